@@ -0,0 +1,78 @@
+"""
+Latency of small requests while large ones are evaluated by coroutines
+
+usage:
+    python benchmarks/bench_async.py
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from kamodo import Kamodo
+
+
+async def small_requests(kamodo, evaluate, duration, interval=.02):
+    """latencies of requests of 100 points, scheduled every interval seconds
+
+    Latencies are counted from the time a request is scheduled,
+    so they include time the event loop was blocked.
+    """
+    x = np.linspace(0, 1, 100)
+    latencies = []
+    t_start = time.perf_counter()
+    for i in range(int(duration/interval)):
+        scheduled = t_start + i*interval
+        await asyncio.sleep(max(0, scheduled - time.perf_counter()))
+        await evaluate(kamodo, x)
+        latencies.append(time.perf_counter() - scheduled)
+    return latencies
+
+
+async def run_case(kamodo, evaluate, nlarge, npoints, duration):
+    """small request latencies and the time taken by nlarge requests of npoints"""
+    x = np.linspace(0, 1, npoints)
+    t0 = time.perf_counter()
+
+    async def large():
+        await evaluate(kamodo, x)
+        return time.perf_counter() - t0
+
+    small = asyncio.ensure_future(small_requests(kamodo, evaluate, duration))
+    elapsed = await asyncio.gather(*[large() for i in range(nlarge)])
+    return await small, max(elapsed)
+
+
+def bench_latency(nlarge=2, npoints=10**7, num_workers=2, duration=1.):
+    """small request latency with nlarge large requests in flight on num_workers threads"""
+    kamodo = Kamodo('f(x[km], y[km])[m] = sin(x)**2*exp(-y) + sqrt(x + y)', backend='numpy')
+    executor = ThreadPoolExecutor(max_workers=num_workers)
+
+    async def blocking(kamodo, x):
+        return kamodo.evaluate('f', x=x, y=x)
+
+    async def offloaded(kamodo, x):
+        return await asyncio.get_running_loop().run_in_executor(
+            executor, lambda: kamodo.evaluate('f', x=x, y=x))
+
+    async def chunked(kamodo, x):
+        return await kamodo.aevaluate('f', executor=executor, x=x, y=x)
+
+    print('{} requests of {} points in flight, {} workers'.format(nlarge, npoints, num_workers))
+    for label, evaluate in [
+            ('idle', None), ('blocking', blocking), ('offloaded', offloaded), ('aevaluate', chunked)]:
+        if evaluate is None:
+            latencies = asyncio.run(small_requests(kamodo, chunked, duration))
+            total = float('nan')
+        else:
+            latencies, total = asyncio.run(run_case(kamodo, evaluate, nlarge, npoints, duration))
+        latencies = 1e3*np.array(latencies)
+        print('\t{:10s} {:4d} small requests, latency median {:8.2f} ms, max {:8.2f} ms, '
+              'large requests done in {:6.2f} s'.format(
+                  label, len(latencies), np.median(latencies), latencies.max(), total))
+    executor.shutdown()
+
+
+if __name__ == '__main__':
+    bench_latency()
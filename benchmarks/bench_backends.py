@@ -0,0 +1,59 @@
+"""
+Benchmark matrix of numeric backends on typical expressions
+
+usage:
+    python benchmarks/bench_backends.py
+"""
+import os
+import timeit
+
+import numpy as np
+from sympy import sympify
+
+from kamodo.backends import compile_expression, set_num_threads
+
+expressions = [
+    'x**2 + y**2',
+    'sqrt(x**2 + y**2)*exp(-x/y)',
+    'sin(x)*cos(y) + tanh(x*y)',
+    '1000*(100*x)**2 + 1',
+    'Max(x, y) + x*y',
+]
+
+backends = ['numpy', 'numexpr', 'ufunc', 'auto']
+
+
+def bench_backends(sizes=(10**3, 10**6), number=5):
+    args = sympify('x, y')
+    funcs = dict()
+    for expr_str in expressions:
+        for backend in backends:
+            try:
+                funcs[expr_str, backend] = compile_expression(
+                    args, sympify(expr_str), {}, backend)[0]
+            except TypeError:
+                pass
+
+    thread_counts = sorted(set([1, os.cpu_count()]))
+    for npoints in sizes:
+        x = np.linspace(1, 2, npoints)
+        y = np.linspace(2, 3, npoints)
+        for nthreads in thread_counts:
+            set_num_threads(nthreads)
+            print('\n{:.0e} points, {} thread(s), ms per call'.format(npoints, nthreads))
+            print('{:32s}'.format('expression') + ''.join('{:>10s}'.format(b) for b in backends))
+            for expr_str in expressions:
+                row = '{:32s}'.format(expr_str)
+                for backend in backends:
+                    func = funcs.get((expr_str, backend))
+                    if func is None:
+                        row += '{:>10s}'.format('-')
+                        continue
+                    func(x, y)
+                    elapsed = timeit.timeit(lambda: func(x, y), number=number)
+                    row += '{:10.3f}'.format(1e3*elapsed/number)
+                print(row)
+
+
+if __name__ == '__main__':
+    bench_backends()
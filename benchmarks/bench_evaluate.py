@@ -0,0 +1,161 @@
+"""
+Benchmarks for evaluating many variables of one model
+
+usage:
+    python benchmarks/bench_evaluate.py
+"""
+import time
+
+import numpy as np
+
+from kamodo import Kamodo, kamodofy
+
+
+def make_model(nvariables):
+    """derived quantities sharing subexpressions and an opaque dependency"""
+    @kamodofy(units='kg/m^3')
+    def rho(x, y):
+        return np.exp(-np.hypot(x, y))
+
+    kamodo = Kamodo(
+        'r(x[m], y[m])[m] = sqrt(x**2 + y**2)',
+        'v(x[m], y[m])[m/s] = sin(x)*cos(y)',
+        rho=rho)
+    for i in range(nvariables):
+        kamodo['q_{}(x, y)'.format(i)] = \
+            '{}*rho(x, y)*v(x, y)**2 + rho(x, y)*v(x, y)**2*exp(-r(x, y)*x/{})'.format(
+                i + 1, i + 1)
+    return kamodo
+
+
+def bench_evaluate_many(nvariables=20, npoints=10**6, repeat=3):
+    kamodo = make_model(nvariables)
+    variables = ['q_{}'.format(i) for i in range(nvariables)]
+    x = np.linspace(0, 1, npoints)
+    y = np.linspace(1, 2, npoints)
+    kamodo.evaluate_many(variables, x=x, y=y)
+
+    def evaluate_each():
+        return {variable: kamodo.evaluate(variable, x=x, y=y)[variable] for variable in variables}
+
+    def evaluate_many():
+        return kamodo.evaluate_many(variables, x=x, y=y)
+
+    print('{} variables over {:.0e} points'.format(nvariables, npoints))
+    for label, statement in [('evaluate', evaluate_each), ('evaluate_many', evaluate_many)]:
+        elapsed = []
+        for i in range(repeat):
+            t0 = time.perf_counter()
+            statement()
+            elapsed.append(time.perf_counter() - t0)
+        print('\t{:14s} {:8.3f} s'.format(label, min(elapsed)))
+
+    each, many = evaluate_each(), evaluate_many()
+    for variable in variables:
+        assert np.allclose(each[variable], many[variable])
+
+
+def bench_units(npoints=10**6, repeat=3):
+    """output in other units: registering converted symbols versus evaluate(units=...)"""
+    requests = [('g/cm^3', 'km'), ('kg/km^3', 'cm'), ('g/m^3', 'm'), ('kg/cm^3', 'km')]
+    x = np.linspace(1, 2, npoints)
+    print('{} unit combinations over {:.0e} points'.format(len(requests), npoints))
+
+    t0 = time.perf_counter()
+    kamodo = Kamodo('rho(x[m])[kg/m^3] = x**2')
+    for i, (units, arg_units) in enumerate(requests):
+        kamodo['rho_{}(x[{}])[{}]'.format(i, arg_units, units)] = 'rho(x)'
+        kamodo['rho_{}'.format(i)](x)
+    print('\t{:24s} {:8.3f} s'.format('register new symbols', time.perf_counter() - t0))
+
+    t0 = time.perf_counter()
+    kamodo = Kamodo('rho(x[m])[kg/m^3] = x**2')
+    for units, arg_units in requests:
+        kamodo.evaluate('rho', units=units, x=(x, arg_units))
+    print('\t{:24s} {:8.3f} s'.format('evaluate(units=...)', time.perf_counter() - t0))
+
+    elapsed = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        for units, arg_units in requests:
+            kamodo.evaluate('rho', units=units, x=(x, arg_units))
+        elapsed.append(time.perf_counter() - t0)
+    print('\t{:24s} {:8.3f} s'.format('evaluate, cached factors', min(elapsed)))
+
+
+def bench_queries(nvariables=50, nqueries=20, npoints=10**4):
+    """repeated semicolon-delimited queries, as sent by dashboards through the REST api"""
+    kamodo = Kamodo(**{'f_{}(x[m])[kg]'.format(i): 'x**{}'.format(i % 5 + 1) for i in range(nvariables)})
+    query = 'g = f_0*f_1 + f_2**2; h = g*sin(x) + 1'
+    x = np.linspace(0, 1, npoints)
+    print('{} queries, {} registered variables'.format(nqueries, nvariables))
+    for label, max_queries in [('uncached', 0), ('cached', Kamodo.max_queries)]:
+        kamodo.max_queries = max_queries
+        t0 = time.perf_counter()
+        for i in range(nqueries):
+            kamodo.evaluate(query, x=x)
+        print('\t{:10s} {:8.3f} s'.format(label, time.perf_counter() - t0))
+
+
+def bench_single_point(ncalls=20000):
+    """latency of evaluate and simulate at single points, in calls per second"""
+    @kamodofy(units='kg')
+    def rho(x=np.linspace(0, 1, 10), y=2., z=3.):
+        return x*y + z
+
+    kamodo = Kamodo(rho=rho, v='x**2 + 1')
+
+    @kamodofy(update='y')
+    def fprime(y=0., dt=.1):
+        return y + dt
+
+    stepper = Kamodo(fprime=fprime)
+
+    print('{} single point calls'.format(ncalls))
+    for label, statement in [
+            ('evaluate(rho)', lambda: kamodo.evaluate('rho', x=.5)),
+            ('evaluate(v)', lambda: kamodo.evaluate('v', x=.5)),
+            ('simulate step', None)]:
+        t0 = time.perf_counter()
+        if statement is None:
+            for state in stepper.simulate(y=0., steps=ncalls):
+                pass
+        else:
+            for i in range(ncalls):
+                statement()
+        print('\t{:14s} {:10.0f} calls/s'.format(label, ncalls/(time.perf_counter() - t0)))
+
+
+def bench_point(ncalls=50000, budget=10e-6):
+    """latency of scalar queries, checked against a budget per call in seconds"""
+    @kamodofy(units='km')
+    def altitude(r=6371.):
+        return r - 6371.
+
+    kamodo = Kamodo(
+        'B(x[R_E], y[R_E], z[R_E])[nT] = 3e4/(x**2 + y**2 + z**2)**(3/2)',
+        altitude=altitude)
+    kamodo['h(r[km])[m]'] = 'altitude(r)'
+    arguments = dict(B=dict(x=1.5, y=.5, z=.2), altitude=dict(r=6700.), h=dict(r=6700.))
+
+    print('{} scalar calls, budget {:.0f} us'.format(ncalls, budget*1e6))
+    for variable, kwargs in arguments.items():
+        assert np.isclose(kamodo.point(variable, **kwargs), kamodo[variable](**kwargs))
+        for label, statement in [
+                ('evaluate', lambda: kamodo.evaluate(variable, **kwargs)),
+                ('call', lambda: kamodo[variable](**kwargs)),
+                ('point', lambda: kamodo.point(variable, **kwargs))]:
+            t0 = time.perf_counter()
+            for i in range(ncalls):
+                statement()
+            latency = (time.perf_counter() - t0)/ncalls
+            print('\t{:10s} {:10s} {:8.2f} us'.format(variable, label, latency*1e6))
+        assert latency < budget
+
+
+if __name__ == '__main__':
+    bench_evaluate_many()
+    bench_units()
+    bench_queries()
+    bench_single_point()
+    bench_point()
@@ -0,0 +1,50 @@
+"""
+Evaluation benchmarks for chains of composed functions
+
+usage:
+    python benchmarks/bench_inline.py
+"""
+import time
+import tracemalloc
+
+import numpy as np
+
+from kamodo import Kamodo
+
+
+def make_chain(depth, inline):
+    """f_0(x) = x**2 + 1, f_i(x) = sin(f_{i-1}(x))*x + 1"""
+    kamodo = Kamodo('f_0(x) = x**2 + 1', inline=inline)
+    for i in range(1, depth):
+        kamodo['f_{}(x)'.format(i)] = 'sin(f_{}(x))*x + 1'.format(i - 1)
+    return kamodo
+
+
+def bench_inline(depth=5, npoints=10**7, repeat=3):
+    """evaluation of the last function in the chain with and without inlining"""
+    x = np.linspace(0, 1, npoints)
+    name = 'f_{}'.format(depth - 1)
+    print('{}-deep composition over {:.0e} points'.format(depth, npoints))
+    results = []
+    for inline in [False, True]:
+        func = make_chain(depth, inline)[name]
+        func(x[:10])
+        elapsed = []
+        for i in range(repeat):
+            t0 = time.perf_counter()
+            result = func(x)
+            elapsed.append(time.perf_counter() - t0)
+        results.append(result)
+        del result
+
+        tracemalloc.start()
+        func(x)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print('\t{:10s} {:8.3f} s {:8.0f} MB peak'.format(
+            'inline' if inline else 'composed', min(elapsed), peak/2**20))
+    assert np.allclose(*results)
+
+
+if __name__ == '__main__':
+    bench_inline()
@@ -0,0 +1,41 @@
+"""
+Symbol lookup benchmarks for Kamodo
+
+usage:
+    python benchmarks/bench_lookup.py
+"""
+import timeit
+
+from kamodo import Kamodo
+
+
+def make_model(nsymbols):
+    """model with nsymbols registered functions"""
+    kamodo = Kamodo()
+    for i in range(nsymbols):
+        kamodo['f_{}'.format(i)] = lambda x: x
+    return kamodo
+
+
+def bench_lookup(nsymbols=1000, number=10000):
+    """latency of membership tests and item lookups"""
+    kamodo = make_model(nsymbols)
+    name = 'f_{}'.format(nsymbols - 1)
+    symbol = kamodo.symbol_registry[name]
+
+    statements = [
+        ('name in kamodo', lambda: name in kamodo),
+        ('kamodo[name]', lambda: kamodo[name]),
+        ('kamodo[symbol]', lambda: kamodo[symbol]),
+        ('getattr(kamodo, name)', lambda: getattr(kamodo, name)),
+        ('hasattr(kamodo, name)', lambda: hasattr(kamodo, name)),
+    ]
+
+    print('lookup latency, {} symbols'.format(nsymbols))
+    for label, statement in statements:
+        elapsed = timeit.timeit(statement, number=number)
+        print('\t{:24s} {:8.2f} us'.format(label, 1e6*elapsed/number))
+
+
+if __name__ == '__main__':
+    bench_lookup()
@@ -0,0 +1,160 @@
+"""
+Scaling of parallel evaluation with the number of threads and processes
+
+usage:
+    python benchmarks/bench_parallel.py [max_workers]
+"""
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator
+
+from kamodo import Kamodo, kamodofy, gridify
+
+
+def make_tiegcm(ntime=24, nilev=29, nlat=72, nlon=144):
+    """interpolators registered as by the TIEGCM reader, on a synthetic grid"""
+    time_ = np.linspace(0, 24, ntime)
+    ilev = np.linspace(-7, 7, nilev)
+    lat = np.linspace(-87.5, 87.5, nlat)
+    lon = np.linspace(-180, 177.5, nlon)
+    variable = np.random.RandomState(0).random_sample((ntime, nilev, nlat, nlon))
+    rgi = RegularGridInterpolator((time_, ilev, lat, lon), variable, bounds_error=False)
+
+    @kamodofy(units='K')
+    @gridify(t=time_, ilev=ilev, lat=lat, lon=lon)
+    @kamodofy(pointwise=True)
+    def T_n(xvec):
+        return rgi(xvec)
+
+    @kamodofy(units='K', pointwise=True)
+    def T_n_ijk(xvec):
+        return rgi(xvec)
+
+    return Kamodo(T_n=T_n, T_n_ijk=T_n_ijk), (time_, ilev, lat, lon)
+
+
+def time_evaluate(kamodo, variable, kwargs, num_threads, repeat=3):
+    kamodo.parallel = num_threads
+    elapsed = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        result = kamodo.evaluate(variable, **kwargs)[variable]
+        elapsed.append(time.perf_counter() - t0)
+    return min(elapsed), result
+
+
+def bench_scaling(max_threads=None, npoints=4*10**6):
+    if max_threads is None:
+        max_threads = os.cpu_count()
+    thread_counts = [1] + [n for n in [2, 4, 8, 16, 32] if n <= max_threads]
+    x = np.linspace(0, 1, npoints)
+    algebraic = Kamodo(
+        'f(x[km], y[km])[m] = sin(x)**2*exp(-y) + sqrt(x + y)', backend='numpy')
+    tiegcm, (time_, ilev, lat, lon) = make_tiegcm()
+    rs = np.random.RandomState(1)
+    xvec = np.column_stack([
+        rs.uniform(0, 24, npoints//4), rs.uniform(-7, 7, npoints//4),
+        rs.uniform(-87.5, 87.5, npoints//4), rs.uniform(-180, 177.5, npoints//4)])
+    cases = [
+        ('expression', algebraic, 'f', dict(x=x, y=x[::-1])),
+        ('rgi points', tiegcm, 'T_n_ijk', dict(xvec=xvec)),
+        ('rgi grid', tiegcm, 'T_n', dict(t=time_[:6])),
+    ]
+
+    print('{} cpus, threads {}'.format(os.cpu_count(), thread_counts))
+    for label, kamodo, variable, kwargs in cases:
+        serial, expected = time_evaluate(kamodo, variable, kwargs, False)
+        print('\t{:12s} serial {:8.3f} s'.format(label, serial))
+        for num_threads in thread_counts:
+            elapsed, result = time_evaluate(kamodo, variable, kwargs, num_threads)
+            assert np.allclose(result, expected, equal_nan=True)
+            print('\t{:12s} {:2d} threads {:8.3f} s  speedup {:5.2f}'.format(
+                label, num_threads, elapsed, serial/elapsed))
+
+
+def make_callables():
+    """opaque python callables, one vectorized and one looping over points"""
+    @kamodofy(units='m', pointwise=True)
+    def vectorized(x, y):
+        result = np.zeros_like(x)
+        for k in range(1, 40):
+            result += np.sin(k*x)*np.cos(k*y)/k
+        return result
+
+    @kamodofy(units='m', pointwise=True)
+    def scalar(x, y):
+        return np.array([math.sin(x_)*math.cos(y_) + max(x_, y_) for x_, y_ in zip(x, y)])
+
+    return Kamodo(vectorized=vectorized, scalar=scalar)
+
+
+def bench_processes(max_processes=None, npoints=10**6):
+    if max_processes is None:
+        max_processes = os.cpu_count()
+    process_counts = [n for n in [2, 4, 8, 16, 32] if n <= max(max_processes, 2)]
+    kamodo = make_callables()
+    kamodo.spec = make_callables
+    x = np.linspace(0, 1, npoints)
+    kwargs = dict(x=x, y=x[::-1])
+
+    print('{} cpus, processes {}'.format(os.cpu_count(), process_counts))
+    for variable in ['vectorized', 'scalar']:
+        kamodo.processes = False
+        serial, expected = time_evaluate(kamodo, variable, kwargs, False, repeat=1)
+        print('\t{:12s} serial {:8.3f} s'.format(variable, serial))
+        for num_processes in process_counts:
+            kamodo.processes = num_processes
+            time_evaluate(kamodo, variable, dict(x=x[:10**4], y=x[:10**4]), False, repeat=1)  # start workers
+            elapsed, result = time_evaluate(kamodo, variable, kwargs, False, repeat=1)
+            assert np.allclose(result, expected)
+            print('\t{:12s} {:2d} processes {:8.3f} s  speedup {:5.2f}'.format(
+                variable, num_processes, elapsed, serial/elapsed))
+
+
+def resident_mb():
+    """resident memory of this process in MB"""
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1])*os.sysconf('SC_PAGE_SIZE')/2**20
+
+
+def bench_out_of_core(npoints=2*10**7, chunk_size=2**20):
+    """streaming .npy files through a model versus evaluating them in memory"""
+    directory = tempfile.mkdtemp()
+    try:
+        x = np.lib.format.open_memmap(
+            os.path.join(directory, 'x.npy'), mode='w+', dtype='f8', shape=(npoints,))
+        x[:] = np.linspace(0, 1, npoints)
+        x.flush()
+        del x
+        kamodo = Kamodo('f(x[km])[m] = sin(x)**2*exp(-x) + sqrt(x)')
+        xfile = os.path.join(directory, 'x.npy')
+        print('{} points, {:.0f} MB per array, {} MB resident before'.format(
+            npoints, npoints*8/2**20, int(resident_mb())))
+
+        peak = [resident_mb()]
+        t0 = time.perf_counter()
+        kamodo.evaluate_out_of_core(
+            'f', os.path.join(directory, 'f.npy'), chunk_size=chunk_size, x=xfile,
+            progress=lambda done, total: peak.append(resident_mb()))
+        print('\t{:12s} {:8.3f} s, peak resident {:6.0f} MB'.format(
+            'streamed', time.perf_counter() - t0, max(peak)))
+
+        t0 = time.perf_counter()
+        result = kamodo.evaluate('f', x=np.load(xfile))['f']
+        print('\t{:12s} {:8.3f} s, resident after {:6.0f} MB'.format(
+            'in memory', time.perf_counter() - t0, resident_mb()))
+        assert np.allclose(result, np.load(os.path.join(directory, 'f.npy'), mmap_mode='r'))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    bench_scaling(*[int(arg) for arg in sys.argv[1:]])
+    bench_processes(*[int(arg) for arg in sys.argv[1:]])
+    bench_out_of_core()
@@ -0,0 +1,158 @@
+"""
+Registration benchmarks for Kamodo
+
+usage:
+    python benchmarks/bench_registration.py
+"""
+import functools
+import time
+
+import numpy as np
+
+import kamodo.kamodo as kamodo_module
+from kamodo import Kamodo, kamodofy
+from kamodo.util import unit_subs
+
+
+# units typical of CDF and TIEGCM variables
+cdf_units = ['nT', 'km/s', '1/cm^3', 'eV', 'km', 'K', 'Pa', 'cm/s', 'erg/(g*s)', 'm/s']
+
+
+def make_variables(nvars):
+    """generate nvars kamodofied functions with units"""
+    variables = dict()
+    for i in range(nvars):
+        units = cdf_units[i % len(cdf_units)]
+        variables['var_{}'.format(i)] = kamodofy(lambda t: t, units=units, data=0)
+    return variables
+
+
+def time_registration(variables):
+    t0 = time.perf_counter()
+    Kamodo(**variables)
+    return time.perf_counter() - t0
+
+
+def bench_unit_parsing(nvars=500):
+    """registration time before and after memoized unit parsing"""
+    variables = make_variables(nvars)
+
+    # before: rebuild the unit table and re-parse on every call
+    get_unit = kamodo_module.get_unit
+    kamodo_module.get_unit = functools.partial(get_unit, unit_subs=dict(unit_subs))
+    try:
+        before = time_registration(variables)
+    finally:
+        kamodo_module.get_unit = get_unit
+
+    kamodo_module.clear_unit_cache()
+    after = time_registration(variables)
+
+    print('unit parsing, {} variables'.format(nvars))
+    print('\tuncached: {:.3f} s'.format(before))
+    print('\tcached:   {:.3f} s ({:.1f}x)'.format(after, before/after))
+
+
+def bench_composition_scaling(sizes=(10, 100, 1000)):
+    """registration time of a chain of composed expressions"""
+    print('composition scaling')
+    for n in sizes:
+        kamodo = Kamodo('f_0(x) = x')
+        t0 = time.perf_counter()
+        for i in range(1, n):
+            kamodo['f_{}(x)'.format(i)] = 'f_{}(x) + x'.format(i - 1)
+        elapsed = time.perf_counter() - t0
+        print('\t{:5d} expressions: {:.3f} s ({:.2f} ms per expression)'.format(
+            n, elapsed, 1000*elapsed/n))
+
+
+# (from units, to units) pairs requiring conversion factors
+conversion_units = [('nT', 'T'), ('km/s', 'cm/s'), ('1/cm^3', '1/m^3'), ('eV', 'erg'),
+                    ('km', 'm'), ('kg/m^3', 'g/cm^3'), ('erg/g/s', 'J/kg/s')]
+
+
+def bench_unit_conversion(nexpr=100):
+    """registration time of expressions composed across units"""
+    params = dict()
+    for i in range(nexpr):
+        from_units, to_units = conversion_units[i % len(conversion_units)]
+        params['a_{}(x[cm])[{}]'.format(i, from_units)] = 'x**2'
+        params['b_{}(y[km])[{}]'.format(i, to_units)] = '2*a_{}(y) + 1'.format(i)
+    t0 = time.perf_counter()
+    Kamodo(**params)
+    elapsed = time.perf_counter() - t0
+    print('unit conversion, {} composed expressions: {:.3f} s'.format(nexpr, elapsed))
+
+
+def bench_registry_scaling(sizes=(100, 1000, 3000), batch=100):
+    """per-registration cost of unit-annotated functions as the unit registry grows"""
+    print('unit registry scaling')
+    kamodo = Kamodo('f_0(x[cm])[kg] = x**2')
+    n = 1
+    for size in sizes:
+        while n < size - batch:
+            kamodo['f_{}(x[cm])[kg]'.format(n)] = 'x**2'
+            n += 1
+        t0 = time.perf_counter()
+        for i in range(batch):
+            kamodo['g_{}(y[km])[g]'.format(n)] = 'f_0(y) + 1'
+            n += 1
+        elapsed = time.perf_counter() - t0
+        print('\t{:5d} registered: {:.2f} ms per registration'.format(
+            len(kamodo.signatures), 1000*elapsed/batch))
+
+
+def bench_new_child(sizes=(50, 500)):
+    """adding one expression to a model: from_kamodo copy versus new_child"""
+    from kamodo import from_kamodo
+    print('one added expression')
+    for n in sizes:
+        kamodo = Kamodo(**{'f_{}(x[cm])[kg]'.format(i): 'x**2 + {}'.format(i) for i in range(n)})
+        for label, derive in [
+                ('from_kamodo', lambda: from_kamodo(kamodo, g='2*f_0(x)')),
+                ('new_child', lambda: kamodo.new_child(g='2*f_0(x)'))]:
+            t0 = time.perf_counter()
+            derive()
+            print('\t{:5d} symbols, {:12s} {:.4f} s'.format(n, label, time.perf_counter() - t0))
+
+
+def bench_compose(nmodels=4, nvars=200):
+    """composing reader-like models with functions and derived expressions"""
+    from kamodo import compose
+    models = dict()
+    for m in range(nmodels):
+        variables = make_variables(nvars // 2)
+        for i in range(nvars // 2):
+            variables['d_{}(t[s])[m/s]'.format(i)] = 't**2 + {}'.format(i)
+        models['model_{}'.format(m)] = Kamodo(**variables)
+    t0 = time.perf_counter()
+    kamodo = compose(**models)
+    elapsed = time.perf_counter() - t0
+    assert 'd_0_model_0' in kamodo
+    print('compose {} models of {} symbols: {:.4f} s'.format(nmodels, nvars, elapsed))
+
+
+def bench_kamodofy_defaults(nfuncs=20, npoints=10**6):
+    """kamodofying reader functions whose defaults span a full grid"""
+    x = np.linspace(0, 1, npoints)
+    t0 = time.perf_counter()
+    functions = dict()
+    for i in range(nfuncs):
+        @kamodofy(units='kg')
+        def f(x=x, i=i):
+            return np.sin(x)**i*np.exp(-x)
+        functions['f_{}'.format(i)] = f
+    kamodo = Kamodo(**functions)
+    print('kamodofy {} functions over {:.0e} default points: {:.3f} s'.format(
+        nfuncs, npoints, time.perf_counter() - t0))
+    assert kamodo.f_1.data.shape == x.shape
+
+
+if __name__ == '__main__':
+    bench_unit_parsing()
+    bench_composition_scaling()
+    bench_unit_conversion()
+    bench_registry_scaling()
+    bench_new_child()
+    bench_compose()
+    bench_kamodofy_defaults()
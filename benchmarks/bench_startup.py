@@ -0,0 +1,131 @@
+"""
+Cold-start benchmarks for config-driven Kamodo models
+
+usage:
+    python benchmarks/bench_startup.py
+"""
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator
+
+from kamodo import Kamodo, kamodofy, gridify
+
+
+def make_params(nexpr):
+    """string expressions resembling a config-driven model"""
+    params = {'f_0(x[cm])[kg]': 'x**2 - 1'}
+    for i in range(1, nexpr):
+        if i % 3 == 0:
+            params['f_{}(x[cm])[g]'.format(i)] = 'f_{}(x) + x**3'.format(i - 1)
+        elif i % 3 == 1:
+            params['f_{}(x[cm])[kg]'.format(i)] = 'sin(x)*f_{}(x)'.format(i - 1)
+        else:
+            params['f_{}(x[cm])[kg]'.format(i)] = 'x**{} + exp(-x)'.format(i % 7 + 1)
+    return params
+
+
+def time_startup(params, compile_cache):
+    t0 = time.perf_counter()
+    Kamodo(compile_cache=compile_cache, **params)
+    return time.perf_counter() - t0
+
+
+def bench_startup(nexpr=200):
+    """model construction with no cache, a cold cache and a warm cache"""
+    params = make_params(nexpr)
+    directory = tempfile.mkdtemp()
+    try:
+        print('startup time, {} expressions'.format(nexpr))
+        print('\t{:12s} {:8.3f} s'.format('no cache', time_startup(params, False)))
+        print('\t{:12s} {:8.3f} s'.format('cold cache', time_startup(params, directory)))
+        print('\t{:12s} {:8.3f} s'.format('warm cache', time_startup(params, directory)))
+    finally:
+        shutil.rmtree(directory)
+
+
+def bench_register_many(nexpr=200):
+    """one definition at a time versus register_many"""
+    params = make_params(nexpr)
+    print('registration time, {} expressions'.format(nexpr))
+
+    t0 = time.perf_counter()
+    kamodo = Kamodo(compile_cache=False)
+    for sym_name, expr in params.items():
+        kamodo[sym_name] = expr
+    print('\t{:14s} {:8.3f} s'.format('__setitem__', time.perf_counter() - t0))
+
+    t0 = time.perf_counter()
+    kamodo = Kamodo(compile_cache=False)
+    kamodo.register_many(**params)
+    print('\t{:14s} {:8.3f} s'.format('register_many', time.perf_counter() - t0))
+
+
+def bench_lazy(nexpr=200, nevaluated=10):
+    """eager versus lazy models when only a few symbols are evaluated"""
+    params = make_params(nexpr)
+    names = ['f_{}'.format(i) for i in range(nevaluated)]
+    print('startup and {} evaluations, {} expressions'.format(nevaluated, nexpr))
+    for lazy in [False, True]:
+        t0 = time.perf_counter()
+        kamodo = Kamodo(compile_cache=False, lazy=lazy, **params)
+        t1 = time.perf_counter()
+        for name in names:
+            kamodo[name](1.)
+        t2 = time.perf_counter()
+        print('\t{:6s} registration {:8.3f} s, evaluation {:8.3f} s'.format(
+            'lazy' if lazy else 'eager', t1 - t0, t2 - t1))
+
+
+class GridReader(Kamodo):
+    """reads a (time, ilev, lat, lon) variable from a .npy file, as the TIEGCM reader does"""
+    snapshot_attributes = Kamodo.snapshot_attributes + ('_grid',)
+
+    def __init__(self, filename, **kwargs):
+        super(GridReader, self).__init__(**kwargs)
+        values = np.load(filename)
+        self._grid = [np.linspace(0, 1, n) for n in values.shape]
+        rgi = RegularGridInterpolator(self._grid, values, bounds_error=False)
+        self['T_n'] = kamodofy(
+            gridify(rgi, **dict(zip(['t', 'ilev', 'lat', 'lon'], self._grid))),
+            units='K', data=rgi.values)
+
+
+def bench_snapshot(nexpr=200, shape=(24, 29, 72, 144)):
+    """constructing a reader and derived expressions versus loading their snapshot"""
+    directory = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(directory, 'T_n.npy')
+        np.save(filename, np.random.RandomState(0).random_sample(shape))
+        point = dict(t=.5, ilev=.5, lat=.5, lon=.5)
+
+        t0 = time.perf_counter()
+        kamodo = GridReader(filename, compile_cache=False).new_child(**make_params(nexpr))
+        t1 = time.perf_counter()
+        kamodo.f_0(1.), kamodo.T_n(**point)
+        t2 = time.perf_counter()
+        snapshot = os.path.join(directory, 'snapshot')
+        kamodo.save(snapshot)
+        t3 = time.perf_counter()
+        loaded = Kamodo.load(snapshot)
+        t4 = time.perf_counter()
+        loaded.f_0(1.), loaded.T_n(**point)
+        t5 = time.perf_counter()
+
+        print('{} expressions and a {} grid of {:.0f} MB'.format(
+            nexpr, shape, np.prod(shape)*8/2**20))
+        print('\t{:10s} {:8.3f} s, first evaluations {:8.3f} s'.format('construct', t1 - t0, t2 - t1))
+        print('\t{:10s} {:8.3f} s'.format('save', t3 - t2))
+        print('\t{:10s} {:8.3f} s, first evaluations {:8.3f} s'.format('load', t4 - t3, t5 - t4))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    bench_startup()
+    bench_register_many()
+    bench_lazy()
+    bench_snapshot()
@@ -0,0 +1,54 @@
+"""
+Benchmarks of the compiled ufunc backend against numpy and numexpr
+
+usage:
+    python benchmarks/bench_ufunc.py [npoints]
+"""
+import sys
+import tempfile
+import time
+
+import numpy as np
+from sympy import sympify
+
+from kamodo.backends import compile_expression
+from kamodo.compile_cache import CompileCache
+
+expressions = [
+    '3*x**4 - 2*x**3 + x**2 - 5*x + 7',
+    '(x**2 + 1)/(x**2 + 2*x + 3)',
+    'sqrt(1 + x**2)*exp(-x**2/2)',
+]
+
+
+def bench_ufunc(npoints=10**8, repeat=3):
+    cache = CompileCache(tempfile.mkdtemp())
+    x_symbol = sympify('x')
+    x = np.linspace(0, 1, npoints)
+    print('{:.0e} points, s per call (first ufunc compile / cached load)'.format(npoints))
+    for expr_str in expressions:
+        expr = sympify(expr_str)
+        row = '{:36s}'.format(expr_str)
+        for backend in ['numpy', 'numexpr', 'ufunc']:
+            t0 = time.perf_counter()
+            func, used = compile_expression((x_symbol,), expr, {}, backend, cache)
+            compile_time = time.perf_counter() - t0
+            assert used == backend
+            elapsed = []
+            for i in range(repeat):
+                t0 = time.perf_counter()
+                func(x)
+                elapsed.append(time.perf_counter() - t0)
+            row += '  {}: {:.3f}'.format(backend, min(elapsed))
+            if backend == 'ufunc':
+                t0 = time.perf_counter()
+                compile_expression((x_symbol,), expr, {}, backend, cache)
+                row += ' ({:.1f} / {:.3f})'.format(compile_time, time.perf_counter() - t0)
+        print(row)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        bench_ufunc(int(float(sys.argv[1])))
+    else:
+        bench_ufunc()
@@ -0,0 +1,266 @@
+"""
+Copyright © 2017 United States Government as represented by the Administrator, National Aeronautics and Space Administration.
+No Copyright is claimed in the United States under Title 17, U.S. Code.  All Other Rights Reserved.
+"""
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import sys
+import sysconfig
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+import sympy
+from sympy import Add, Mul, Pow, Function, lambdify, srepr
+from sympy.core.function import AppliedUndef
+from sympy.printing.lambdarepr import NumExprPrinter
+from sympy.utilities.autowrap import ufuncify, CodeWrapper
+
+from .compile_cache import CACHE_FORMAT, cached_lambdify
+from .util import sort_symbols
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+
+backends = OrderedDict()
+
+# backends that fall back to 'auto' when they cannot compile an expression
+fallback_backends = set()
+
+num_threads = None
+
+numexpr_functions = set(NumExprPrinter._numexpr_functions)
+
+
+def register_backend(name, compile_function, fallback=False):
+    """registers a numeric backend
+
+    compile_function(args, expr, composition, cache) returns a vectorized
+    function of args, or raises TypeError if it cannot compile expr.
+    composition maps names of functions called in expr to their implementations.
+    If fallback is True, expressions it cannot compile use the 'auto' backend.
+    """
+    backends[name] = compile_function
+    if fallback:
+        fallback_backends.add(name)
+
+
+def get_backend(name):
+    try:
+        return backends[name]
+    except KeyError:
+        raise KeyError('unknown backend {}, choose from {}'.format(
+            name, list(backends)))
+
+
+def compile_expression(args, expr, composition, backend='auto', cache=None):
+    """compiles expr with the named backend
+
+    returns the function and the name of the backend that compiled it
+    """
+    if backend == 'auto':
+        return compile_auto(args, expr, composition, cache)
+    compile_function = get_backend(backend)
+    try:
+        return compile_function(args, expr, composition, cache), backend
+    except TypeError:
+        if backend not in fallback_backends:
+            raise
+    return compile_auto(args, expr, composition, cache)
+
+
+def set_num_threads(n):
+    """sets the number of threads used by numexpr and kamodo's thread pools
+
+    returns the previous setting
+    """
+    global num_threads
+    previous = get_num_threads()
+    num_threads = n
+    if numexpr is not None:
+        numexpr.set_num_threads(n)
+    return previous
+
+
+def get_num_threads():
+    if num_threads is not None:
+        return num_threads
+    if numexpr is not None:
+        return numexpr.get_num_threads()
+    return os.cpu_count()
+
+
+def numexpr_compatible(expr):
+    """whether every node of expr can be evaluated by numexpr"""
+    if isinstance(expr, AppliedUndef):
+        return False
+    if expr.is_Atom:
+        return expr.is_Symbol or expr.is_Number or expr.is_NumberSymbol
+    if isinstance(expr, (Add, Mul, Pow)) or (type(expr).__name__ in numexpr_functions):
+        return all(numexpr_compatible(arg) for arg in expr.args)
+    return False
+
+
+def split_numexpr(expr, kernels=None):
+    """replaces numexpr-compatible subtrees of expr with placeholder calls
+
+    Compatible terms of a sum or product are grouped into one subtree.
+
+    returns the outer expression and {placeholder call: subtree}
+    """
+    if kernels is None:
+        kernels = OrderedDict()
+    if numexpr_compatible(expr):
+        if expr.is_Atom or len(expr.free_symbols) == 0:
+            return expr, kernels
+        placeholder = Function('_ne{}'.format(len(kernels)))(*sort_symbols(expr.free_symbols))
+        kernels[placeholder] = expr
+        return placeholder, kernels
+    if expr.is_Atom:
+        return expr, kernels
+    args = expr.args
+    if isinstance(expr, (Add, Mul)):
+        compatible = [arg for arg in args if numexpr_compatible(arg)]
+        if len(compatible) > 1:
+            others = [arg for arg in args if not numexpr_compatible(arg)]
+            args = [expr.func(*compatible)] + others
+    args = [split_numexpr(arg, kernels)[0] for arg in args]
+    return expr.func(*args), kernels
+
+
+def compile_numpy(args, expr, composition, cache=None):
+    return cached_lambdify(args, expr, ['numpy', composition], cache)
+
+
+def compile_numexpr(args, expr, composition, cache=None):
+    if numexpr is None:
+        raise TypeError('numexpr is not installed')
+    if not numexpr_compatible(expr):
+        raise TypeError('numexpr cannot evaluate {}'.format(expr))
+    return cached_lambdify(args, expr, ['numexpr'], cache)
+
+
+def compiler_available():
+    """whether the C compiler python was built with can be found"""
+    compiler = sysconfig.get_config_var('CC') or 'cc'
+    return shutil.which(compiler.split()[0]) is not None
+
+
+def get_ufunc_directory(cache=None):
+    """directory of ufunc builds
+
+    Builds live next to the compile cache if one is configured,
+    otherwise in the user's cache directory.
+    """
+    if cache is not None:
+        return os.path.join(cache.directory, 'ufunc')
+    cache_home = os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache'))
+    return os.path.join(cache_home, 'kamodo', 'ufunc')
+
+
+def get_ufunc_key(args, expr):
+    """hash of the expression and everything the compiled extension depends on"""
+    canonical = json.dumps([
+        CACHE_FORMAT,
+        sympy.__version__,
+        np.__version__,
+        sysconfig.get_config_var('EXT_SUFFIX'),
+        [srepr(arg) for arg in args],
+        srepr(expr)])
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def build_ufunc(args, expr, directory):
+    """builds a ufunc into directory, keeping only the extension and a manifest"""
+    parent = os.path.dirname(directory)
+    os.makedirs(parent, exist_ok=True)
+    build_dir = tempfile.mkdtemp(dir=parent, prefix='.build-')
+    try:
+        try:
+            ufunc = ufuncify(args, expr, tempdir=build_dir)
+        except Exception as m:
+            manifest = dict(error='could not ufuncify {}: {}'.format(expr, m))
+        else:
+            module_name = 'wrapper_module_{}'.format(CodeWrapper._module_counter - 1)
+            module = sys.modules.pop(module_name)
+            funcname = [k for k, v in vars(module).items() if v is ufunc][0]
+            filename = os.path.basename(module.__file__)
+            manifest = dict(module=module_name, funcname=funcname, file=filename, error=None)
+            for name in os.listdir(build_dir):
+                if name != filename:
+                    path = os.path.join(build_dir, name)
+                    if os.path.isdir(path):
+                        shutil.rmtree(path)
+                    else:
+                        os.remove(path)
+        with open(os.path.join(build_dir, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+        try:
+            os.replace(build_dir, directory)
+        except OSError:
+            pass  # built concurrently by another process
+    finally:
+        if os.path.exists(build_dir):
+            shutil.rmtree(build_dir)
+
+
+def load_ufunc(directory):
+    """loads a cached ufunc build, raising TypeError for a failed build"""
+    with open(os.path.join(directory, 'manifest.json')) as f:
+        manifest = json.load(f)
+    if manifest['error'] is not None:
+        raise TypeError(manifest['error'])
+    spec = importlib.util.spec_from_file_location(
+        manifest['module'], os.path.join(directory, manifest['file']))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return getattr(module, manifest['funcname'])
+
+
+def compile_ufunc(args, expr, composition, cache=None):
+    """compiles expr to a C ufunc with sympy's autowrap
+
+    Builds are kept on disk by expression hash, so each expression
+    is compiled once.
+    """
+    if len(expr.atoms(AppliedUndef)) > 0:
+        raise TypeError('ufuncify cannot call {}'.format(expr.atoms(AppliedUndef)))
+    if not compiler_available():
+        raise TypeError('no C compiler available for ufuncify')
+    directory = os.path.join(get_ufunc_directory(cache), get_ufunc_key(args, expr))
+    if not os.path.exists(os.path.join(directory, 'manifest.json')):
+        build_ufunc(args, expr, directory)
+    ufunc = load_ufunc(directory)
+    # ufuncs do not accept attributes, so wrap in a function of the same arguments
+    return lambdify(args, Function('_ufunc')(*args), modules=[{'_ufunc': ufunc}])
+
+
+def compile_auto(args, expr, composition, cache=None):
+    """numexpr where possible, numpy otherwise
+
+    Expressions that numexpr cannot evaluate as a whole have their
+    numexpr-compatible subtrees compiled with numexpr.
+    """
+    if numexpr is None:
+        return compile_numpy(args, expr, composition, cache), 'numpy'
+    if numexpr_compatible(expr):
+        return compile_numexpr(args, expr, composition, cache), 'numexpr'
+    outer, kernels = split_numexpr(expr)
+    if len(kernels) == 0:
+        return compile_numpy(args, expr, composition, cache), 'numpy'
+    namespace = dict(composition)
+    for placeholder, subexpr in kernels.items():
+        namespace[str(type(placeholder))] = compile_numexpr(
+            placeholder.args, subexpr, composition, cache)
+    return compile_numpy(args, outer, namespace, cache), 'numpy+numexpr'
+
+
+register_backend('numpy', compile_numpy)
+register_backend('numexpr', compile_numexpr)
+register_backend('ufunc', compile_ufunc, fallback=True)
@@ -155,10 +155,10 @@ def get_func_resource(model_name, model, var_symbol):
     """Get resource associated with this function"""
     parser = reqparse.RequestParser()
     func = model[var_symbol]
-    defaults = get_defaults(func)
+    binder = model.get_binder(var_symbol)
 
-    for arg in getfullargspec(func).args:
-        if arg in defaults:
+    for arg in binder.args:
+        if arg in binder.defaults:
             parser.add_argument(arg, type=str)
         else:
             parser.add_argument(arg, type=str, required=True)
@@ -174,18 +174,19 @@ def get_func_resource(model_name, model, var_symbol):
             for argname, val_ in args_.items():
                 args[argname] = pd.read_json(StringIO(val_), typ='series')
 
-            return func(**args).tolist()
+            return binder(args).tolist()
     return FuncResource
 
 def get_evaluate_resource(model_name, model):
     """get resource associated with evaluate"""
     parser = reqparse.RequestParser()
     parser.add_argument('variable', type=str, required=True)
+    parser.add_argument('units', type=str)
+    parser.add_argument('arg_units', type=str)  # json {arg: units}
 
     for var_symbol in model:
         if type(var_symbol) != UndefinedFunction:
-            func = model[var_symbol]
-            for arg in getfullargspec(func).args:
+            for arg in model.get_binder(var_symbol).args:
                 parser.add_argument(arg, type=str)
 
 
@@ -198,19 +199,23 @@ def get_evaluate_resource(model_name, model):
             args_ = parser.parse_args()
             args = dict()
 
-            variable_name = ''
+            variable_name = args_.pop('variable')
+            units = args_.pop('units')
+            arg_units = args_.pop('arg_units')
+            if arg_units is not None:
+                arg_units = json.loads(arg_units)
+            else:
+                arg_units = dict()
 
             for argname, val_ in args_.items():
-                if argname != 'variable':
-                    if val_ is not None:
-                        args[argname] = pd.read_json(StringIO(val_), typ='series')
-
-                else:
-                    variable_name = val_
+                if val_ is not None:
+                    args[argname] = pd.read_json(StringIO(val_), typ='series')
+                    if argname in arg_units:
+                        args[argname] = (args[argname].values, arg_units[argname])
 
             try:
-                result = model.evaluate(variable=variable_name, **args)
-            except SyntaxError as m:
+                result = model.evaluate(variable=variable_name, units=units, **args)
+            except (SyntaxError, NameError) as m:
                 return {'message': '{}'.format(m)}
 
             return {k_: v_.tolist() for k_, v_ in result.items()}
@@ -262,12 +262,12 @@ def get_tabs_children(cfg, app):
         if model_conf.plot is None:
             for var_symbol, func in model.items():
                 if type(var_symbol) == UndefinedFunction:
-                    model_params[str(var_symbol)] = get_defaults(func)
+                    model_params[str(var_symbol)] = model.get_binder(var_symbol).get_defaults()
         else:
             for var_name, var_args in model_conf.plot.items():
                 if var_args is None:
                     try:
-                        model_params[var_name] = get_defaults(model[var_name])
+                        model_params[var_name] = model.get_binder(var_name).get_defaults()
                     except Exception as m:
                         print(model.detail)
                         print(m)
@@ -580,10 +580,9 @@ def get_model_resource(model_name, model):
 
 def get_func_resource(model_name, model, var_symbol):
     parser = reqparse.RequestParser()
-    func = model[var_symbol]
-    defaults = get_defaults(func)
-    for arg in getfullargspec(func).args:
-        if arg in defaults:
+    binder = model.get_binder(var_symbol)
+    for arg in binder.args:
+        if arg in binder.defaults:
             parser.add_argument(arg, type = str)
         else:
             parser.add_argument(arg, type = str, required = True)
@@ -597,7 +596,7 @@ def get_func_resource(model_name, model, var_symbol):
             for argname, val_ in args_.items():
                 args[argname] = pd.read_json(StringIO(val_), typ = 'series')
 
-            return func(**args).tolist()
+            return binder(args).tolist()
       
             
 
@@ -89,10 +89,15 @@ def main(cfg):
         if model_conf.evaluate is not None:
             for varname, params in model_conf.evaluate.items():
                 try:
-                    units = model[varname].meta['units']
+                    params = dict(params)
+                    units = params.pop('units', None)
                     lhs = "{}({})".format(varname, ','.join(['{}={}'.format(k,v) for k,v in params.items()]))
 
-                    rhs = model[varname](**eval_config(params))
+                    if units is None:
+                        units = model[varname].meta['units']
+                        rhs = model[varname](**eval_config(params))
+                    else:
+                        rhs = model.evaluate(varname, units=units, **eval_config(params))[varname]
 
                     print("{} {} = \n".format(lhs,units))
                     print(rhs)
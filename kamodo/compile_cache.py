@@ -0,0 +1,251 @@
+"""
+Copyright © 2017 United States Government as represented by the Administrator, National Aeronautics and Space Administration.
+No Copyright is claimed in the United States under Title 17, U.S. Code.  All Other Rights Reserved.
+"""
+import builtins
+import hashlib
+import inspect
+import json
+import linecache
+import os
+import tempfile
+
+import sympy
+from sympy import lambdify, srepr
+from sympy.core.function import AppliedUndef
+from sympy.physics.units import Quantity
+from sympy.utilities.lambdify import _get_namespace
+
+from .util import unify
+
+# bump when the format of cache entries changes
+CACHE_FORMAT = 1
+
+
+class CompileCache(object):
+    """Content-addressed store of lambdified source code
+
+    Entries are json files named by the hash of (argument symbols, expression, modules).
+    When the directory grows past max_bytes, the least recently used entries are removed.
+    """
+
+    def __init__(self, directory, max_bytes=64*2**20):
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __repr__(self):
+        return 'CompileCache({!r}, max_bytes={})'.format(self.directory, self.max_bytes)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def get(self, key):
+        """returns the entry stored under key or None"""
+        path = self.path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (IOError, ValueError):
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        return entry
+
+    def put(self, key, entry):
+        """atomically writes the entry, then enforces the size bound"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self.path(key))
+        self.evict()
+
+    def entries(self):
+        """returns [(mtime, size, path)] for all entries, oldest first"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def size(self):
+        return sum(size for mtime, size, path in self.entries())
+
+    def evict(self):
+        """removes least recently used entries until the cache fits in max_bytes"""
+        entries = self.entries()
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for mtime, size, path in self.entries():
+            os.remove(path)
+
+
+def get_compile_cache(cache=None):
+    """resolves the compile cache setting
+
+    cache may be a CompileCache, a directory, or None.
+    If None, the KAMODO_CACHE_DIR environment variable is used when set.
+    Pass False to disable caching.
+    """
+    if cache is False:
+        return None
+    if isinstance(cache, CompileCache):
+        return cache
+    if cache is None:
+        cache = os.environ.get('KAMODO_CACHE_DIR')
+        if cache is None:
+            return None
+    return CompileCache(cache)
+
+
+def module_version(module):
+    """version string of an importable module, used to key cache entries"""
+    try:
+        return getattr(__import__(module), '__version__', '')
+    except ImportError:
+        return 'missing'
+
+
+def get_cache_key(args, expr, modules):
+    """hash of the canonical form of the arguments, expression and named modules
+
+    dict modules are runtime namespaces (e.g. composed functions)
+    and only their names contribute to the key.
+    """
+    module_keys = []
+    for module in modules:
+        if isinstance(module, dict):
+            module_keys.append(sorted(module))
+        else:
+            module_keys.append([module, module_version(module)])
+    canonical = json.dumps([
+        CACHE_FORMAT,
+        sympy.__version__,
+        [srepr(arg) for arg in args],
+        srepr(expr),
+        module_keys])
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def get_unify_key(expr, unit_registry):
+    """hash of the expression and the unit registry entries it can depend on
+
+    unify only consults registry entries of functions appearing in the expression,
+    so entries for unrelated functions do not change the key.
+    """
+    names = set(str(type(func)) for func in expr.atoms(AppliedUndef))
+    entries = []
+    for key, value in unit_registry.items():
+        if isinstance(key, AppliedUndef) and str(type(key)) not in names:
+            continue
+        entries.append([srepr(key), srepr(value)])
+    canonical = json.dumps([
+        CACHE_FORMAT,
+        sympy.__version__,
+        'unify',
+        srepr(expr),
+        sorted(entries)])
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+_srepr_namespace = dict()
+
+
+def from_srepr(expr_str):
+    """rebuilds a sympy expression from its srepr"""
+    if len(_srepr_namespace) == 0:
+        exec('from sympy import *', _srepr_namespace)
+    return eval(expr_str, _srepr_namespace)
+
+
+def cached_unify(expr, unit_registry, cache=None, verbose=False):
+    """unify(expr, unit_registry) backed by an optional CompileCache
+
+    Only results free of unit quantities are stored,
+    since quantity scale factors do not survive a round trip through srepr.
+    """
+    if cache is None:
+        return unify(expr, unit_registry, verbose=verbose)
+
+    key = get_unify_key(expr, unit_registry)
+    entry = cache.get(key)
+    if entry is not None:
+        return from_srepr(entry['expr'])
+
+    result = unify(expr, unit_registry, verbose=verbose)
+    if len(result.atoms(Quantity)) == 0:
+        cache.put(key, dict(expr=srepr(result)))
+    return result
+
+
+def build_function(entry, modules, key):
+    """reconstructs a lambdified function from its cached source"""
+    namespace = {}
+    for module in modules[::-1]:
+        namespace.update(_get_namespace(module))
+    for line in entry['imports']:
+        exec(line, {}, namespace)
+    namespace.update({'builtins': builtins, 'range': range})
+
+    filename = '<kamodo-cached-{}>'.format(key[:16])
+    source = entry['source']
+    funclocals = {}
+    exec(compile(source, filename, 'exec'), namespace, funclocals)
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+    func = funclocals['_lambdifygenerated']
+    func.__doc__ = entry['doc']
+    return func
+
+
+def get_imports(func):
+    """recovers the import lines lambdify added to the function namespace"""
+    imports = func.__doc__.split('Imported modules:\n\n')[-1]
+    return [line for line in imports.splitlines() if len(line) > 0]
+
+
+def cached_lambdify(args, expr, modules, cache=None):
+    """lambdify(args, expr, modules) backed by an optional CompileCache
+
+    On a cache hit the generated source is executed directly, skipping lambdify.
+    Expressions that cannot be compiled with the given modules are remembered,
+    so later attempts raise without calling lambdify again.
+    """
+    if cache is None:
+        return lambdify(args, expr, modules=modules)
+
+    key = get_cache_key(args, expr, modules)
+    entry = cache.get(key)
+    if entry is not None:
+        if entry.get('error') is not None:
+            raise TypeError(entry['error'])
+        return build_function(entry, modules, key)
+
+    try:
+        func = lambdify(args, expr, modules=modules)
+    except Exception as m:
+        cache.put(key, dict(error='{}: {}'.format(type(m).__name__, m)))
+        raise
+
+    cache.put(key, dict(
+        source=inspect.getsource(func),
+        imports=get_imports(func),
+        doc=func.__doc__,
+        error=None))
+    return func
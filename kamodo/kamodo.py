@@ -11,14 +11,14 @@ try:
 except ImportError:  # may occur for certain versions of sympy
     from sympy import sympify as parse_expr
 
-from collections import OrderedDict
+from collections import ChainMap, OrderedDict
 from collections import UserDict
+from numbers import Number
 import collections
 
-from sympy import lambdify
 from sympy.parsing.latex import parse_latex
 from sympy import latex
-from sympy.core.function import UndefinedFunction
+from sympy.core.function import UndefinedFunction, AppliedUndef
 from inspect import getfullargspec
 from sympy import Eq
 import pandas as pd
@@ -30,32 +30,46 @@ from sympy.physics.units import Quantity
 from sympy.physics.units import Dimension
 from sympy import Expr
 
+import asyncio
+import copy
 import functools
-from .util import kamodofy
+import os
 from .util import sort_symbols
 from .util import simulate
 from .util import unit_subs
-from .util import get_defaults, valid_args, eval_func
+from .util import Binder
 # from .util import to_arrays, cast_0_dim
 from .util import beautify_latex, arg_to_latex
 from .util import concat_solution
 from .util import convert_to
-from .util import unify, get_abbrev, get_expr_unit
+from .util import get_abbrev, get_expr_unit
 from .util import is_function, get_arg_units
+from .util import convert_expr, units_compatible
+from .backends import compile_expression, get_backend, get_num_threads
+from .namespace import Namespace
+from .unit_algebra import UnitRegistry
+from .parallel import evaluate_async, evaluate_chunked, evaluate_sharded, evaluate_streamed, \
+    is_elementwise, threads
+from .compile_cache import cached_lambdify, cached_unify, get_compile_cache
+from .snapshot import save_snapshot, load_snapshot
 
 import sympy.physics.units as u
 
 import plotly.graph_objs as go
 from plotly import figure_factory as ff
 
-from plotting import plot_dict, get_arg_shapes, get_plot_key
+from .plotting import plot_dict, get_arg_shapes, get_plot_key
 from .util import existing_plot_types
 
 from sympy import Wild
+from sympy import cse, numbered_symbols, sympify
+from sympy.printing.pycode import NumPyPrinter
+from sympy.utilities.lambdify import _get_namespace
 from types import GeneratorType
 import inspect
 
 import re
+import keyword
 
 
 
@@ -68,24 +82,35 @@ def get_unit_quantities():
     return subs
 
 
-def clean_unit(unit_str):
-    """remove brackets and all white spaces in and around unit string"""
-    return unit_str.strip().strip('[]').strip()
+_default_unit_subs = unit_subs
+_unit_table = dict()
 
 
-def get_unit(unit_str, unit_subs=unit_subs):
-    """get the unit quantity corresponding to this string
+def get_unit_table():
+    """returns the process-wide map of sympy and custom units, built once
 
-    unit_subs should contain a dictonary {symbol: quantity} of custom units not available in sympy"""
+    The table combines get_unit_quantities() with the custom units in unit_subs.
+    Call clear_unit_cache() after adding custom units to unit_subs.
+    """
+    if len(_unit_table) == 0:
+        _unit_table.update(get_unit_quantities())
+        _unit_table.update(_default_unit_subs)
+    return _unit_table
 
-    unit_str = clean_unit(unit_str)
-    units = get_unit_quantities()
 
-    if unit_subs is not None:
-        units.update(unit_subs)
+def clear_unit_cache():
+    """discards the unit table and all memoized unit strings"""
+    _unit_table.clear()
+    parse_unit.cache_clear()
 
-    if len(unit_str) == 0:
-        return Dimension(1)
+
+def clean_unit(unit_str):
+    """remove brackets and all white spaces in and around unit string"""
+    return unit_str.strip().strip('[]').strip()
+
+
+def _parse_unit(unit_str, units):
+    """parse a cleaned, non-empty unit string using the {symbol: quantity} map"""
     try:
         unit = parse_expr(unit_str.replace('^', '**')).subs(units)
     except:
@@ -98,6 +123,36 @@ def get_unit(unit_str, unit_subs=unit_subs):
     return unit
 
 
+@functools.lru_cache(maxsize=1024)
+def parse_unit(unit_str):
+    """memoized parsing of a cleaned unit string against the unit table"""
+    return _parse_unit(unit_str, get_unit_table())
+
+
+def get_unit(unit_str, unit_subs=unit_subs):
+    """get the unit quantity corresponding to this string
+
+    unit_subs should contain a dictonary {symbol: quantity} of custom units not available in sympy
+
+    Lookups with the default unit_subs are memoized on the cleaned unit string.
+    """
+
+    unit_str = clean_unit(unit_str)
+
+    if len(unit_str) == 0:
+        return Dimension(1)
+
+    if unit_subs is _default_unit_subs:
+        return parse_unit(unit_str)
+
+    units = get_unit_quantities()
+
+    if unit_subs is not None:
+        units.update(unit_subs)
+
+    return _parse_unit(unit_str, units)
+
+
 
 
 def args_from_dict(expr, local_dict, verbose):
@@ -232,10 +287,20 @@ def parse_rhs(rhs, is_latex, local_dict):
     subsititute variables from local_dict where available
     """
     if is_latex:
-        expr = parse_latex(rhs).subs(local_dict)
+        expr = parse_latex(rhs)
     else:
-        expr = parse_expr(rhs).subs(local_dict)
-    return expr
+        expr = parse_expr(rhs)
+    # only substitute names that appear in the expression
+    subs = dict()
+    for symbol in expr.free_symbols:
+        if str(symbol) in local_dict:
+            subs[symbol] = local_dict[str(symbol)]
+    return expr.subs(subs)
+
+
+def normalize_name(key):
+    """string form of a registry key without white space, f( x ) -> f(x)"""
+    return str(key).replace(' ', '')
 
 
 def get_function_args(func, hidden_args=[]):
@@ -243,6 +308,274 @@ def get_function_args(func, hidden_args=[]):
     return symbols([a for a in getfullargspec(func).args if a not in hidden_args])
 
 
+def get_names(expr_str):
+    """names referenced in an expression string, in order of appearance"""
+    return re.findall(r'[^\W\d]\w*', expr_str)
+
+
+def get_called_names(expr_str):
+    """names called as functions in expr_str, e.g. ['f', 'sin'] for 'f(x) + sin(y)'"""
+    return re.findall(r'([^\W\d]\w*)\s*\(', expr_str)
+
+
+def dependency_order(definitions):
+    """stable topological sort of [(lhs, rhs)] definitions
+
+    Each definition is moved after the definitions its rhs calls as functions,
+    otherwise the original order is kept. Names used without a call may be
+    arguments, e.g. x in f='x**2' followed by x='t', and never reorder
+    definitions. Cycles are left in place.
+    """
+    index = OrderedDict()
+    for i, (lhs, rhs) in enumerate(definitions):
+        names = get_names(lhs.strip('$'))
+        if len(names) > 0:
+            index.setdefault(names[0], []).append(i)
+
+    ordered = []
+    visited = set()
+
+    def visit(i):
+        if i in visited:
+            return
+        visited.add(i)
+        lhs, rhs = definitions[i]
+        if isinstance(rhs, str):
+            for name in get_called_names(rhs):
+                for j in index.get(name, []):
+                    visit(j)
+        ordered.append(definitions[i])
+
+    for i in range(len(definitions)):
+        visit(i)
+    return ordered
+
+
+def deferred_function(args, compile_function):
+    """a function of args that calls compile_function() on first use
+
+    The compiled implementation is stored on the returned function as .compiled,
+    see get_compiled.
+    Returns None if the arguments cannot be used as python argument names.
+    """
+    arg_names = [str(arg) for arg in args]
+    for arg_name in arg_names:
+        if (not arg_name.isidentifier()) or keyword.iskeyword(arg_name):
+            return None
+        if arg_name in ['_deferred', '_compile']:
+            return None
+    arg_str = ', '.join(arg_names)
+    source = '\n'.join([
+        'def _deferred({0}):',
+        '    if _deferred.compiled is None:',
+        '        _deferred.compiled = _compile()',
+        '    return _deferred.compiled({0})']).format(arg_str)
+    namespace = dict(_compile=compile_function)
+    exec(source, namespace)
+    func = namespace['_deferred']
+    func.compile = compile_function
+    func.compiled = None
+    return func
+
+
+def lambdify_many(args, exprs, composition):
+    """compiles exprs into one numpy function of args returning a tuple
+
+    Common subexpressions are computed once, including calls to
+    the functions in composition, which map names to implementations.
+    """
+    arg_symbols = [Symbol('_arg{}'.format(i)) for i in range(len(args))]
+    arg_map = dict(zip(args, arg_symbols))
+    exprs = [sympify(expr).xreplace(arg_map) for expr in exprs]
+    replacements, reduced = cse(exprs, symbols=numbered_symbols('_cse'))
+
+    printer = NumPyPrinter({
+        'fully_qualified_modules': False,
+        'inline': True,
+        'allow_unknown_functions': True})
+    lines = ['def _kernel({}):'.format(', '.join(str(arg) for arg in arg_symbols))]
+    for symbol, expr in replacements:
+        lines.append('    {} = {}'.format(symbol, printer.doprint(expr)))
+    lines.append('    return ({},)'.format(', '.join(printer.doprint(expr) for expr in reduced)))
+    source = '\n'.join(lines)
+
+    namespace = dict(_get_namespace('numpy'))
+    namespace.update(composition)
+    exec(source, namespace)
+    func = namespace['_kernel']
+    func.source = source
+    return func
+
+
+def get_compiled(func):
+    """implementation of a deferred function, compiling it if needed
+
+    Other functions are returned unchanged.
+    """
+    if getattr(func, 'compiled', False) is None:
+        func.compiled = func.compile()
+    return getattr(func, 'compiled', None) or func
+
+
+def set_expression(func, expression, composition, meta):
+    """attributes of functions compiled from expression
+
+    composition maps the names of the functions expression calls to their
+    implementations, so the function can be compiled again (see Kamodo.save)
+    """
+    func.meta = meta
+    func.data = None
+    func.expression = expression
+    func.composition = composition
+
+
+def expression_function(symbol, rhs_expr, composition, meta):
+    """function compiling rhs_expr on first call, used to load snapshots
+
+    The expression is compiled with the backend that compiled it before.
+    """
+    expression = Eq(symbol, rhs_expr, evaluate=False)
+    backend = meta.get('backend') or 'auto'
+
+    def compile_():
+        for name, func in list(composition.items()):
+            composition[name] = get_compiled(func)
+        func, meta['backend'] = compile_expression(symbol.args, rhs_expr, composition, backend)
+        set_expression(func, expression, composition, meta)
+        return func
+
+    stub = deferred_function(symbol.args, compile_)
+    if stub is None:
+        return compile_()
+    set_expression(stub, expression, composition, meta)
+    return stub
+
+
+def undefined_function(name, kwargs):
+    """Function(name, **kwargs), used to load snapshots"""
+    return Function(name, **kwargs)
+
+
+def reduce_snapshot(obj):
+    """reduces the objects of a model that do not pickle as they are, see Kamodo.save
+
+    Models are reduced to their registries, function classes to their names
+    and compiled expressions to their expressions.
+    """
+    if isinstance(obj, Kamodo):
+        return (new_model, (type(obj),), obj.get_snapshot(), None, None, restore_snapshot)
+    if isinstance(obj, UndefinedFunction):
+        return (undefined_function, (obj.__name__, obj._kwargs))
+    if 'expression' in getattr(obj, '__dict__', ()) and callable(obj):
+        symbol, rhs_expr = obj.expression.args  # Eq would be evaluated when unpickled
+        return (expression_function, (symbol, rhs_expr, obj.composition, dict(obj.meta)))
+    return NotImplemented
+
+
+def split_arg_units(kwargs):
+    """values of arguments given as values or (value, units) pairs, and the units given"""
+    values = dict()
+    arg_units = dict()
+    for arg, value in kwargs.items():
+        if isinstance(value, tuple) and len(value) == 2 and isinstance(value[1], str):
+            value, arg_units[arg] = value
+        values[arg] = value
+    return values, arg_units
+
+
+def join_arg_units(values, arg_units):
+    """inverse of split_arg_units"""
+    kwargs = dict(values)
+    for arg, units in arg_units.items():
+        kwargs[arg] = (kwargs[arg], units)
+    return kwargs
+
+
+def new_model(cls):
+    return cls.__new__(cls)
+
+
+def restore_snapshot(model, state):
+    """sets the state of a model loaded from a snapshot, see Kamodo.get_snapshot"""
+    scopes = state.pop('_scopes')
+    model.__dict__.update(state)
+    model._scopes = ()
+    model._queries = OrderedDict()
+    model.kernels = OrderedDict()
+    model.unit_factors = dict()
+    model.point_kernels = dict()
+    model._deferred = None
+    model.binders = {str(key): Binder(value) for key, value in model.data.items()
+                     if isinstance(key, UndefinedFunction) and callable(value)}
+    if len(scopes) > 0:
+        model.add_scopes(*scopes)
+
+
+def record_init(init):
+    """wraps the __init__ of a Kamodo subclass to record how it was constructed
+
+    The arguments and the definitions registered during construction
+    are kept, see Kamodo.__reduce__.
+    """
+    @functools.wraps(init)
+    def __init__(self, *args, **kwargs):
+        if '_init_args' in self.__dict__:  # called from the __init__ of a subclass
+            return init(self, *args, **kwargs)
+        self.__dict__['_init_args'] = (args, kwargs)
+        init(self, *args, **kwargs)
+        self.__dict__['_init_definitions'] = dict(self.definitions)
+    return __init__
+
+
+def unpickle_model(cls, recipe):
+    """model of class cls, built from recipe on first use (see Kamodo.__reduce__)"""
+    model = cls.__new__(cls)
+    model.__dict__['_recipe'] = recipe
+    return model
+
+
+class ScopeChain(ChainMap):
+    """registry of a model chained to the registries of its scopes (see Kamodo.add_scopes)
+
+    Lookups try the model's own registry first, then the scopes in order.
+    Iteration lists the scopes' keys in order, then the model's own,
+    so symbols are listed in the order they were defined.
+    """
+
+    @classmethod
+    def chain(cls, registry, scoped):
+        """registry chained to scoped registries, after any it is already chained to"""
+        if isinstance(registry, ChainMap):
+            return cls(*registry.maps, *scoped)
+        return cls(registry, *scoped)
+
+    def __iter__(self):
+        keys = dict()
+        for mapping in self.maps[1:] + self.maps[:1]:
+            keys.update(dict.fromkeys(mapping))
+        return iter(keys)
+
+
+# types accepted by point without an isinstance(value, Number) check
+scalar_types = {float, int, np.float64, np.float32, np.int64, np.int32}
+
+
+def is_scalar(value):
+    return type(value) in scalar_types or isinstance(value, Number)
+
+
+def scalar_function(func):
+    """implementation of func for scalar arguments
+
+    Deferred functions are compiled and np.vectorize wrappers
+    without a core signature are replaced by the function they vectorize.
+    """
+    func = get_compiled(func)
+    if type(func) is np.vectorize and func.signature is None:
+        return func.pyfunc
+    return func
+
+
 
 
 # class Kamodo(collections.OrderedDict):
@@ -260,41 +593,282 @@ class Kamodo(UserDict):
     will raise a NotImplementedError
     '''
 
+    # derived models kept for semicolon-delimited evaluate queries
+    max_queries = 128
+
+    # kernels kept by evaluate_many, for combinations of variables
+    max_kernels = 128
+
+    # attributes saved in snapshots, subclasses may add their own (see save)
+    snapshot_attributes = (
+        'verbose', 'compile_cache', 'lazy', 'inline', 'backend', 'parallel', 'processes', 'spec',
+        'data', 'name_index', 'symbol_registry', 'signatures', 'symbol_backends', 'unit_registry',
+        'definitions', '_scopes', '_version', '_init_args', '_init_definitions')
+
     def __init__(self, *funcs, **kwargs):
         """Base initialization method
 
         Args:
             param1 (str, optional): Filename of datafile to interpolate from
+            compile_cache (str or CompileCache, optional): directory in which
+                to cache compiled expressions, defaults to $KAMODO_CACHE_DIR
+            lazy (bool, optional): compile expressions on first call
+                rather than at registration, defaults to False
+            inline (bool, optional): substitute the expressions of registered
+                symbolic functions into the expressions that call them,
+                defaults to True
+            backend (str, optional): numeric backend for expressions,
+                one of 'auto', 'numpy', 'numexpr', 'ufunc', defaults to 'auto'
+            parallel (bool or int, optional): evaluate large point arrays in
+                chunks on a thread pool of this many threads (True for
+                backends.get_num_threads()), defaults to False
+            processes (int, optional): evaluate large point arrays in shards
+                on a pool of this many worker processes, defaults to False
+            spec (callable, optional): picklable callable returning this
+                model, with which worker processes rebuild it,
+                defaults to the model's own recipe (see __reduce__)
 
         """
 
         super(Kamodo, self).__init__()
+        self.name_index = dict()
+        self._version = 0  # incremented whenever a key is inserted or removed
+        self._scopes = ()  # models this one resolves missing symbols from
+        self._queries = OrderedDict()  # LRU of derived models for evaluate queries
         self.symbol_registry = OrderedDict()
-        self.unit_registry = OrderedDict()
+        self.definitions = OrderedDict()  # {name: (lhs, rhs) as registered}, see __reduce__
+        self.unit_registry = UnitRegistry()
 
         symbol_dict = kwargs.pop('symbol_dict', None)
 
         self.verbose = kwargs.pop('verbose', False)
+        self.compile_cache = get_compile_cache(kwargs.pop('compile_cache', None))
+        self.lazy = kwargs.pop('lazy', False)
+        self.inline = kwargs.pop('inline', True)
+        self.backend = kwargs.pop('backend', 'auto')
+        if self.backend != 'auto':
+            get_backend(self.backend)
+        self.parallel = kwargs.pop('parallel', False)
+        self.processes = kwargs.pop('processes', False)
+        self.spec = kwargs.pop('spec', None)
+        self.symbol_backends = dict()
+        self.kernels = OrderedDict()  # LRU of evaluate_many kernels
+        self.unit_factors = dict()
         self.signatures = OrderedDict()
+        self.binders = dict()  # {name: Binder of the registered function}
+        self.point_kernels = dict()  # {variable: (function, scalar kernel)}
+        self._deferred = None
+
+        self.register_many(*funcs, **kwargs)
 
+    def register_many(self, *funcs, **kwargs):
+        """Registers several definitions at once
+
+        funcs are strings of the form 'f(x)[units] = expr',
+        kwargs map left-hand-sides to expressions or functions.
+
+        Definitions are registered after the definitions they call
+        (see dependency_order), and compilation of expressions is deferred until all are registered.
+        """
+        definitions = []
         for func in funcs:
-            if self.verbose:
-                print('registering {}'.format(func))
             if type(func) is str:
                 components = func.split('=')
                 if len(components) == 2:
                     # function(arg)[unit] = expr
                     lhs, rhs = components
-                    self[lhs.strip('$')] = rhs
+                    definitions.append((lhs.strip('$'), rhs))
                 else:
                     raise NotImplementedError(
                         'cannot register functions of the form {}'.format(func))
+        definitions.extend(kwargs.items())
 
-        for sym_name, expr in list(kwargs.items()):
-            if self.verbose:
-                print('registering {} with {}'.format(sym_name, expr))
-            self[sym_name] = expr
+        outer = self._deferred is None
+        if outer:
+            self._deferred = []
+        try:
+            for sym_name, expr in dependency_order(definitions):
+                if self.verbose:
+                    print('registering {} with {}'.format(sym_name, expr))
+                self[sym_name] = expr
+        finally:
+            if outer:
+                deferred, self._deferred = self._deferred, None
+                self.compile_deferred(deferred)
+
+    def compile_deferred(self, deferred):
+        """compiles deferred functions and replaces them in the registry"""
+        for symbol, stub in deferred:
+            func = get_compiled(stub)
+            for key in [symbol, type(symbol)]:
+                if self.data.get(key) is stub:
+                    self.insert_key(key, func)
+
+    def new_child(self, *funcs, **kwargs):
+        """model resolving symbols from this one, with new definitions kept locally
+
+        The child refers to this model's registries instead of copying them,
+        so creating it does not depend on the number of registered symbols.
+        Definitions made on the child never modify this model,
+        and symbols of this model cannot be deleted from the child.
+        """
+        child = Kamodo(
+            verbose=self.verbose,
+            compile_cache=self.compile_cache or False,
+            lazy=self.lazy,
+            inline=self.inline,
+            backend=self.backend,
+            parallel=self.parallel)
+        child.add_scopes(self)
+        child.register_many(*funcs, **kwargs)
+        return child
+
+    def add_scopes(self, *scopes):
+        """resolves symbols missing from this model from scopes, in order
+
+        scopes are models or Namespace views of models. Their registries
+        are chained rather than copied.
+        """
+        self._scopes = self._scopes + scopes
+        self.data = ScopeChain.chain(self.data, [scope.data for scope in scopes])
+        self.name_index = ScopeChain.chain(self.name_index, [scope.name_index for scope in scopes])
+        self.symbol_registry = ScopeChain.chain(
+            self.symbol_registry, [scope.symbol_registry for scope in scopes])
+        self.signatures = ScopeChain.chain(self.signatures, [scope.signatures for scope in scopes])
+        self.binders = ScopeChain.chain(self.binders, [scope.binders for scope in scopes])
+        self.symbol_backends = ScopeChain.chain(
+            self.symbol_backends, [scope.symbol_backends for scope in scopes])
+        self.unit_registry.parents += tuple(scope.unit_registry for scope in scopes)
+
+    def get_version(self):
+        """versions of this model and of the models it resolves symbols from"""
+        version = (self._version,)
+        for scope in self._scopes:
+            version += scope.get_version()
+        return version
+
+    def __init_subclass__(cls, **kwargs):
+        super(Kamodo, cls).__init_subclass__(**kwargs)
+        if '__init__' in cls.__dict__:
+            cls.__init__ = record_init(cls.__dict__['__init__'])
+
+    def __reduce__(self):
+        """pickles the recipe this model is rebuilt from
+
+        Registered expressions are pickled as their source, functions as
+        themselves (by name, or kamodofied functions as the function they
+        wrap and their kamodofy arguments). Subclasses are called again with
+        the arguments they were constructed with, so readers re-open their
+        files instead of pickling their data or interpolators, and only the
+        definitions made after construction are pickled. Models resolving
+        symbols from other models (see new_child, compose) pickle those too.
+
+        Unpickled models are rebuilt on first use.
+        """
+        recipe = self.__dict__.get('_recipe')
+        if recipe is None:
+            recipe = self.get_recipe()
+        return (unpickle_model, (type(self), recipe))
+
+    def get_recipe(self):
+        """how to rebuild this model, see __reduce__"""
+        init_definitions = self.__dict__.get('_init_definitions', dict())
+        symbol_backends = self.symbol_backends
+        if isinstance(symbol_backends, ChainMap):
+            symbol_backends = symbol_backends.maps[0]
+        return dict(
+            init_args=self.__dict__.get('_init_args'),
+            options=dict(
+                verbose=self.verbose,
+                compile_cache=self.compile_cache or False,
+                lazy=self.lazy,
+                inline=self.inline,
+                backend=self.backend,
+                parallel=self.parallel,
+                processes=self.processes,
+                spec=self.spec),
+            scopes=self._scopes,
+            removed=[name for name in init_definitions if name not in self.definitions],
+            symbol_backends=dict(symbol_backends),
+            definitions=[definition for name, definition in self.definitions.items()
+                         if init_definitions.get(name) is not definition])
+
+    def rebuild(self, recipe):
+        """constructs this model from a recipe made by get_recipe"""
+        options = recipe['options']
+        if recipe['init_args'] is None:
+            Kamodo.__init__(self, **options)
+        else:
+            args, kwargs = recipe['init_args']
+            self.__init__(*args, **kwargs)
+            for key in ['parallel', 'processes', 'spec']:
+                setattr(self, key, options[key])
+        if len(recipe['scopes']) > 0:
+            self.add_scopes(*recipe['scopes'])
+        for name in recipe['removed']:
+            if name in self:
+                del self[name]
+        for name, backend in recipe['symbol_backends'].items():
+            self.set_backend(name, backend)
+        self.register_many(**OrderedDict(recipe['definitions']))
+
+    def save(self, path, sources=None):
+        """saves a snapshot of this model to the directory path, see load
+
+        The snapshot holds the model's registries: symbols, units, signatures,
+        and the expressions of compiled functions, which are compiled again
+        on first call. Registered functions are pickled, with large arrays,
+        e.g. the grids and values of interpolators, saved as .npy files.
+        Subclasses are saved with the attributes named in snapshot_attributes.
+
+        sources are the files the model was built from, defaulting to the
+        existing files passed to the constructor of this model and of the
+        models it resolves symbols from.
+        Snapshots require python 3.8, NotImplementedError is raised otherwise.
+        path may be a previous snapshot, which is replaced, or an empty
+        directory. FileExistsError is raised for other existing paths.
+        """
+        if sources is None:
+            sources = self.get_sources()
+        save_snapshot(path, self, sources, reduce_snapshot)
+
+    @staticmethod
+    def load(path):
+        """model saved to the directory path by save
 
+        Arrays are memory-mapped rather than read.
+        Raises IOError if a source file changed since the model was saved.
+        """
+        return load_snapshot(path)
+
+    def get_sources(self):
+        """existing files passed to the constructors of this model and of its scopes"""
+        sources = []
+        for scope in self._scopes:
+            sources.extend(getattr(scope, 'model', scope).get_sources())
+        args, kwargs = self.__dict__.get('_init_args') or ((), dict())
+        for arg in list(args) + list(kwargs.values()):
+            if isinstance(arg, str) and os.path.isfile(arg):
+                sources.append(arg)
+        return sources
+
+    def get_snapshot(self):
+        """attributes of this model saved by save
+
+        Registries chained from scopes are saved without the scopes' entries,
+        which are chained again on load.
+        """
+        self.get_version()  # builds unpickled models
+        state = dict()
+        for key in self.snapshot_attributes:
+            if key in self.__dict__:
+                state[key] = self.__dict__[key]
+        for key in ['data', 'name_index', 'symbol_registry', 'signatures', 'symbol_backends']:
+            if isinstance(state[key], ChainMap):
+                state[key] = state[key].maps[0]
+        state['unit_registry'] = copy.copy(self.unit_registry)
+        state['unit_registry'].parents = ()
+        return state
 
     def register_symbol(self, symbol):
         self.symbol_registry[str(type(symbol))] = symbol
@@ -417,31 +991,104 @@ class Kamodo(UserDict):
     def validate_function(self, lhs_expr, rhs_expr):
         assert lhs_expr.free_symbols == rhs_expr.free_symbols
 
-    # def get_composition(self, lhs_expr, rhs_expr):
-    #     composition = dict()
-    #     for k in list(self.keys()):
-    #         if len(rhs_expr.find(k)) > 0:
-    #             if self.verbose:
-    #                 print('composition detected: found {} in {} = {}'.format(k, lhs_expr, rhs_expr))
-    #             composition[str(k)] = self[k]
-    #         else:
-    #             if self.verbose:
-    #                 print('{} {} not in {} = {}'.format(k, type(k), lhs_expr, rhs_expr))
-    #     return composition
+    def get_composition(self, lhs_expr, rhs_expr):
+        """maps the names of registered functions called in rhs_expr to their implementations
+
+        Only the functions appearing in rhs_expr are resolved,
+        so the cost does not depend on the size of the registry.
+        """
+        composition = dict()
+        for func in rhs_expr.atoms(AppliedUndef):
+            func_name = str(type(func))
+            symbol = self.symbol_registry.get(func_name)
+            if symbol in self.data:
+                if self.verbose:
+                    print('composition detected: found {} in {} = {}'.format(
+                        func_name, lhs_expr, rhs_expr))
+                composition[func_name] = self.data[symbol]
+        return composition
 
     def vectorize_function(self, symbol, rhs_expr, composition):
-        try:
-            func = lambdify(symbol.args, rhs_expr, modules=['numexpr'])
-            if self.verbose:
-                print('lambda {} = {} labmdified with numexpr'.format(symbol.args, rhs_expr))
-        except: # numexpr not installed
-            func = lambdify(symbol.args, rhs_expr, modules=['numpy', composition])
-            if self.verbose:
-                print('lambda {} = {} lambdified with numpy and composition:'.format(
-                    symbol.args, rhs_expr))
-                for k, v in composition.items():
-                    print('\t', k, v)
-        return func
+        """compiles rhs_expr with the backend selected for symbol
+
+        returns the function and the name of the backend that compiled it
+        """
+        backend = self.symbol_backends.get(str(type(symbol)), self.backend)
+        func, backend = compile_expression(
+            symbol.args, rhs_expr, composition, backend, self.compile_cache)
+        if self.verbose:
+            print('lambda {} = {} compiled with {}'.format(symbol.args, rhs_expr, backend))
+        return func, backend
+
+    def set_backend(self, name, backend):
+        """selects the numeric backend for the named symbol
+
+        The symbol is recompiled if it is already registered.
+        """
+        if backend != 'auto':
+            get_backend(backend)
+        self.symbol_backends[name] = backend
+        if name not in self.signatures:
+            return
+        symbol = self.signatures[name]['symbol']
+        expression = getattr(self[symbol], 'expression', None)
+        if expression is None:
+            return  # registered as a callable
+        composition = self.get_composition(symbol, expression.rhs)
+        meta = dict(self[symbol].meta)
+        func = self.compile_function(symbol, expression.rhs, composition, meta)
+        self.insert_key(symbol, func)
+        self.insert_key(type(symbol), func)
+
+    def fuse(self, rhs_expr):
+        """substitutes the expressions of registered symbolic functions into rhs_expr
+
+        f(x) = x**2, g(x) = f(x) + 1 fuses g into x**2 + 1,
+        so g compiles to a single kernel. Functions registered as callables
+        remain calls into their implementations.
+        """
+        subs = dict()
+        for call in rhs_expr.atoms(AppliedUndef):
+            symbol = self.symbol_registry.get(str(type(call)))
+            func = self.data.get(symbol)
+            expression = getattr(func, 'expression', None)
+            if expression is None:
+                continue
+            lhs, rhs = expression.args
+            if str(type(lhs)) != str(type(call)) or len(lhs.args) != len(call.args):
+                continue  # e.g. a function copied from another model
+            if not all(str(type(f)) in self for f in rhs.atoms(AppliedUndef)):
+                continue
+            subs[call] = rhs.xreplace(dict(zip(lhs.args, call.args)))
+        return rhs_expr.xreplace(subs)
+
+    def compile_function(self, symbol, rhs_expr, composition, meta):
+        """vectorizes rhs_expr
+
+        Compilation is deferred to the end of register_many
+        or, for lazy models, to the first call.
+        The returned function's expression attribute holds Eq(symbol, rhs_expr).
+        """
+        expression = Eq(symbol, rhs_expr, evaluate=False)
+
+        def compile_():
+            # deferred functions in the composition are compiled first
+            for name, func in list(composition.items()):
+                composition[name] = get_compiled(func)
+            func, meta['backend'] = self.vectorize_function(symbol, rhs_expr, composition)
+            set_expression(func, expression, composition, meta)
+            return func
+
+        if (self._deferred is None) and (not self.lazy):
+            return compile_()
+        stub = deferred_function(symbol.args, compile_)
+        if stub is None:
+            return compile_()
+        meta['backend'] = None  # set when compiled
+        set_expression(stub, expression, composition, meta)
+        if not self.lazy:
+            self._deferred.append((symbol, stub))
+        return stub
 
     def update_unit_registry(self, func, arg_units):
         """Inserts unit functions into registry"""
@@ -460,6 +1107,10 @@ class Kamodo(UserDict):
         return lhs
 
 
+    def select_units(self, expr):
+        """unit registry entries that unit resolution of expr can depend on"""
+        return self.unit_registry.select(expr)
+
     def register_signature(self, symbol, units, lhs_expr, rhs_expr):
         # if isinstance(units, str):
         unit_str = units
@@ -524,9 +1175,9 @@ class Kamodo(UserDict):
             self.unit_registry[unit_expr] = get_unit(units)
         else:
             self.unit_registry[lhs_symbol] = get_unit(units)
-        super(Kamodo, self).__setitem__(lhs_symbol, func)  # assign key 'f(x)'
+        self.insert_key(lhs_symbol, func)  # assign key 'f(x)'
         self.register_signature(lhs_symbol, units, lhs_expr, rhs)
-        super(Kamodo, self).__setitem__(type(lhs_symbol), self[lhs_symbol])  # assign key 'f'
+        self.insert_key(type(lhs_symbol), func)  # assign key 'f'
         self.register_symbol(lhs_symbol)
 
     # def check_consistency(self, input_expr, units):
@@ -581,6 +1232,7 @@ class Kamodo(UserDict):
             sym_name = str(sym_name)
 
         symbol, args, lhs_units, lhs_expr = self.parse_key(sym_name)
+        definition = (sym_name, input_expr)
 
         # if self.verbose:
         #     print('')
@@ -647,8 +1299,9 @@ class Kamodo(UserDict):
                           symbol,
                           'had no units. Getting units from {}'.format(rhs_expr))
 
-                expr_unit = get_expr_unit(rhs_expr, self.unit_registry, self.verbose)
-                arg_units = get_arg_units(rhs_expr, self.unit_registry)
+                rhs_units = self.select_units(rhs_expr)
+                expr_unit = get_expr_unit(rhs_expr, rhs_units, self.verbose)
+                arg_units = get_arg_units(rhs_expr, rhs_units)
 
                 # if expr_unit == Dimension(1):
                 #     expr_unit = None
@@ -667,7 +1320,8 @@ class Kamodo(UserDict):
                 #         self.verbose)
 
                 if expr_unit is not None:
-                    lhs_units = str(get_abbrev(get_expr_unit(expr_unit, self.unit_registry, self.verbose)))
+                    lhs_units = str(get_abbrev(get_expr_unit(
+                        expr_unit, self.select_units(expr_unit), self.verbose)))
 
                 if self.verbose:
                     print('registered lhs_units', lhs_units)
@@ -682,10 +1336,11 @@ class Kamodo(UserDict):
                     print('about to unify lhs_units {} {} with {}'.format(
                         lhs_units, type(lhs_units), rhs))
 
-                expr = unify(
-                    Eq(parse_expr(sym_name), rhs),
-                    self.unit_registry,
-                    # to_symbol = symbol,
+                eq = Eq(parse_expr(sym_name), rhs)
+                expr = cached_unify(
+                    eq,
+                    self.select_units(eq),
+                    self.compile_cache,
                     verbose=self.verbose)
                 rhs_expr = expr.rhs
 
@@ -693,7 +1348,7 @@ class Kamodo(UserDict):
                 print('symbol after unify', symbol, type(symbol), rhs_expr)
                 print('unit registry to resolve units:', self.unit_registry)
 
-            units = get_expr_unit(symbol, self.unit_registry)
+            units = get_expr_unit(symbol, self.select_units(symbol))
             units = get_abbrev(units)
             if units is not None:
                 units = str(units)
@@ -718,8 +1373,11 @@ class Kamodo(UserDict):
             #         print('unit registry:', self.unit_registry)
             #     raise
 
-            # composition = self.get_composition(lhs_expr, rhs_expr)
-            composition = {str(k_): self[k_] for k_ in self}
+            if self.inline:
+                fused_expr = self.fuse(rhs_expr)
+            else:
+                fused_expr = rhs_expr
+            composition = self.get_composition(lhs_expr, fused_expr)
             arg_units = {}
             if symbol in self.unit_registry:
                 unit_args = self.unit_registry[symbol]
@@ -727,36 +1385,65 @@ class Kamodo(UserDict):
                     if len(unit_args.args) == len(symbol.args):
                         for arg, unit in zip(symbol.args, unit_args.args):
                             arg_units[str(arg)] = str(get_abbrev(unit))
-            func = self.vectorize_function(symbol, rhs_expr, composition)
             meta = dict(units=units, arg_units=arg_units)
-            func.meta = meta
-            func.data = None
+            func = self.compile_function(symbol, fused_expr, composition, meta)
             self.register_signature(symbol, units, lhs_expr, rhs_expr)
-            super(Kamodo, self).__setitem__(symbol, func)
-            super(Kamodo, self).__setitem__(type(symbol), self[symbol])
+            self.insert_key(symbol, func)
+            self.insert_key(type(symbol), func)
             self.register_symbol(symbol)
             # self[symbol].meta = dict(units=units)
 
+        self.definitions[str(type(symbol))] = definition
+
+
+    def insert_key(self, key, value):
+        """stores value under key and indexes (key, value) by the key's normalized name
+
+        functions stored under their function class also get an argument binder
+        """
+        self.data[key] = value
+        self.name_index[normalize_name(key)] = (key, value)
+        if isinstance(key, UndefinedFunction) and callable(value):
+            self.binders[str(key)] = Binder(value)
+        self._version += 1
+
+    def remove_key(self, key):
+        """removes key and its name from the index"""
+        self.data.pop(key)
+        self.binders.pop(str(key), None)
+        self._version += 1
+        name = normalize_name(key)
+        if self.name_index.get(name, (None,))[0] is key:
+            self.name_index.pop(name)
 
     def __getitem__(self, key):
         try:
-            return super(Kamodo, self).__getitem__(key)
+            return self.data[key]
         except KeyError:
-            try:
-                symbol = self.symbol_registry[str(key)]
-            except KeyError:
-                symbol = self.symbol_registry[str(type(key))]
-            if symbol in self:
-                return super().__getitem__(symbol)
+            pass
+        name = normalize_name(key)
+        if name not in self.name_index:
+            # f(y) resolves to the function registered as f(x)
+            name = normalize_name(type(key))
+        try:
+            return self.name_index[name][1]
+        except KeyError:
+            raise KeyError(key)
 
     def __contains__(self, item):
-        func_str = str(item).replace(' ', '')
-        for key in self.keys():
-            if func_str == str(key).replace(' ', ''):
-                return True
-        return False
+        return normalize_name(item) in self.name_index
 
     def __getattr__(self, name):
+        recipe = self.__dict__.pop('_recipe', None)
+        if recipe is not None:  # unpickled model, built on first use
+            try:
+                self.rebuild(recipe)
+            except:
+                # back to the unpickled state, so the next use rebuilds from scratch
+                self.__dict__.clear()
+                self.__dict__['_recipe'] = recipe
+                raise
+            return getattr(self, name)
         try:
             return self[name]
         except KeyError:
@@ -769,9 +1456,7 @@ class Kamodo(UserDict):
             if self.verbose:
                 print('__delattr__: removing name {}, symbol {}'.format(name, symbol))
                 print(self.keys())
-            # del self[symbol]
-            super().pop(symbol)
-            super().pop(type(symbol))
+            del self[symbol]
 
         else:
             raise AttributeError("No such field: " + name)
@@ -789,6 +1474,10 @@ class Kamodo(UserDict):
             symbol = key
         if self.verbose:
             print('__delitem__: removing {} {}'.format(symbol, type(symbol)))
+        if isinstance(symbol, AppliedUndef):
+            self.definitions.pop(str(type(symbol)), None)
+        else:
+            self.definitions.pop(str(symbol), None)
 
         remove_keys = []
         for k in self.data:
@@ -800,7 +1489,7 @@ class Kamodo(UserDict):
             print('__delitem__: removing keys:', remove_keys)
 
         for key_ in remove_keys:
-            self.data.pop(key_)
+            self.remove_key(key_)
 
     # def get_units_map(self):
     #     """Maps from string units to symbolic units"""
@@ -879,48 +1568,184 @@ class Kamodo(UserDict):
 
     def detail(self):
         """Constructs a pandas dataframe from signatures"""
-        return pd.DataFrame(self.signatures).T
+        return pd.DataFrame(dict(self.signatures)).T
 
     def get_signature(self, name):
         """Get the signature for the named variable"""
         return self.signatures[name]
         # return self.signatures[str(self.symbol_registry[name])]
 
+    def get_binder(self, variable):
+        """argument binder of the function registered as variable
+
+        Binders are built when functions are registered and reused as long
+        as variable refers to the same function.
+        """
+        func = self[variable]
+        if isinstance(variable, AppliedUndef):
+            variable = type(variable)
+        binder = self.binders.get(str(variable))
+        if binder is None or binder.func is not func:
+            binder = Binder(func)
+        return binder
+
+    def get_point_kernel(self, func):
+        """scalar implementation of a registered function, see point
+
+        Expressions are compiled with the math module, calling scalar
+        implementations of the functions they compose.
+        returns None if the expression cannot be compiled for scalars
+        """
+        expression = getattr(func, 'expression', None)
+        if expression is None:
+            return scalar_function(func)
+        symbol, rhs_expr = expression.args
+        composition = self.get_composition(symbol, rhs_expr)
+        for name, composed in list(composition.items()):
+            composition[name] = scalar_function(composed)
+        try:
+            return cached_lambdify(symbol.args, rhs_expr, ['math', composition], self.compile_cache)
+        except Exception:
+            return None
+
+    def point(self, variable, **kwargs):
+        """value of variable at a single point
+
+        When all arguments are scalars, the variable is evaluated by a scalar
+        kernel (see get_point_kernel), skipping numpy arrays and argument binding.
+        This keeps a call to a few microseconds (see benchmarks/bench_evaluate.py).
+        Other arguments, and points where the math module raises
+        (e.g. sqrt(-1)), are evaluated by the registered function.
+        Kernels are compiled on first use and kept while variable
+        refers to the same function.
+        """
+        func = self[variable]
+        try:
+            compiled, kernel = self.point_kernels[variable]
+        except KeyError:
+            compiled = None
+        if compiled is not func:
+            kernel = self.get_point_kernel(func)
+            self.point_kernels[variable] = func, kernel
+        if kernel is not None and all(map(is_scalar, kwargs.values())):
+            try:
+                return kernel(**kwargs)
+            except (ArithmeticError, ValueError, TypeError, NameError):
+                pass
+        binder = self.get_binder(variable)
+        params = binder.get_defaults()
+        params.update(binder.valid_args(kwargs))
+        return binder(params)
+
     def simulate(self, **kwargs):
         state_funcs = []
         for name, func_key in list(self.symbol_registry.items()):
             func = self[func_key]
             update_var = getattr(func, 'update', None)
             if update_var is not None:
-                state_funcs.append((func.update, func))
+                state_funcs.append((func.update, self.get_binder(name)))
 
         return simulate(OrderedDict(state_funcs), **kwargs)
 
-    def evaluate(self, variable, *args, **kwargs):
+    def get_unit_factor(self, variable, from_units, to_units):
+        """numeric factor converting values of variable from from_units to to_units
+
+        factors are cached per (variable, from_units, to_units)
+        """
+        key = (variable, from_units, to_units)
+        try:
+            return self.unit_factors[key]
+        except KeyError:
+            pass
+        from_unit = get_unit(from_units)
+        to_unit = get_unit(to_units)
+        if from_unit == to_unit:
+            factor = 1.
+        elif units_compatible(from_unit, to_unit):
+            factor = float(convert_expr(sympify(1), from_unit, to_unit))
+        else:
+            raise NameError('cannot convert {} from [{}] to [{}]'.format(
+                variable, from_units, to_units))
+        self.unit_factors[key] = factor
+        return factor
+
+    def convert_args(self, variable, kwargs):
+        """converts arguments given as (value, units) to the units of variable
+
+        returns the converted arguments and the values given with units
+        """
+        arg_units = getattr(self[variable], 'meta', dict()).get('arg_units') or dict()
+        converted = dict()
+        inputs = dict()
+        for arg, value in kwargs.items():
+            if isinstance(value, tuple) and len(value) == 2 and isinstance(value[1], str):
+                value, units = value
+                inputs[arg] = value
+                factor = self.get_unit_factor(variable, units, arg_units.get(arg, ''))
+                if factor != 1:
+                    value = np.multiply(value, factor)
+            converted[arg] = value
+        return converted, inputs
+
+    def convert_result(self, variable, result, units):
+        """converts the result of variable to the requested units
+
+        The result is scaled into a new array, since functions may return
+        arrays they keep, e.g. their data.
+        """
+        factor = self.get_unit_factor(
+            variable, getattr(self[variable], 'meta', dict()).get('units', ''), units)
+        if factor == 1:
+            return result
+        return result*factor
+
+    def get_query(self, query):
+        """derived model and last variable name of a semicolon-delimited query
+
+        Derived models are children of this model (see new_child), kept in an
+        LRU cache keyed by the normalized query and the version of this model,
+        so repeated queries are only parsed.
+        """
+        var_dict = OrderedDict()
+        for variable_ in query.split(';'):
+            if len(variable_.split('=')) == 2:
+                variable_name, variable_expr = variable_.strip("'").split('=')
+                variable_name = ' '.join(variable_name.split())
+                var_dict[variable_name] = ' '.join(variable_expr.split())
+            else:
+                raise SyntaxError('cannot parse {}'.format(variable_))
+
+        key = (';'.join('{}={}'.format(*item) for item in var_dict.items()), self.get_version())
+        try:
+            knew = self._queries[key]
+            self._queries.move_to_end(key)
+        except KeyError:
+            knew = self.new_child(**var_dict)
+            self._queries[key] = knew
+            while len(self._queries) > self.max_queries:
+                self._queries.popitem(last=False)
+        return knew, variable_name
+
+    def evaluate(self, variable, *args, units=None, **kwargs):
         """evaluates the variable
 
         if the variable is not present, try to parse it as a semicolon-delimited list
+
+        units converts the result to the given units. Arguments may be
+        given as (value, units) pairs and are converted to the units of
+        the variable's arguments.
         """
         if not hasattr(self, variable):
-            var_dict = {}
-            for variable_ in variable.split(';'):
-                if len(variable_.split('=')) == 2:
-                    variable_name, variable_expr = variable_.strip("'").split('=')
-                    var_dict[variable_name] = variable_expr
-                else:
-                    raise SyntaxError('cannot parse {}'.format(variable_))
-            knew = from_kamodo(self, **var_dict)
+            knew, variable_name = self.get_query(variable)
             # evaluate the last variable
-            result = knew.evaluate(variable=variable_name, *args, **kwargs)
+            result = knew.evaluate(variable=variable_name, *args, units=units, **kwargs)
             return result
 
+        binder = self.get_binder(variable)
+        params = binder.get_defaults()
 
-        if isinstance(self[variable], np.vectorize):
-            params = get_defaults(self[variable].pyfunc)
-        else:
-            params = get_defaults(self[variable])
-
-        valid_arguments = valid_args(self[variable], kwargs)
+        kwargs, inputs = self.convert_args(variable, kwargs)
+        valid_arguments = binder.valid_args(kwargs)
         if len(params) > 0:
             if self.verbose:
                 print('default parameters:', list(params.keys()))
@@ -931,13 +1756,222 @@ class Kamodo(UserDict):
             params = valid_arguments
             if self.verbose:
                 print('user-supplied args:', list(params.keys()))
-        result = eval_func(self[variable], params)
+        if self.processes:
+            result = self.evaluate_processes(variable, binder, params)
+        elif self.parallel:
+            result = self.evaluate_parallel(binder, params)
+        else:
+            result = binder(params)
         if isinstance(result, GeneratorType):
+            if units is not None:
+                raise NotImplementedError('unit conversion of solutions')
             params = concat_solution(result, variable)
         else:
+            if units is not None:
+                result = self.convert_result(variable, result, units)
+            params.update({k: v for k, v in inputs.items() if k in params})
             params.update({variable: result})
         return params
 
+    def get_num_threads(self):
+        """threads used by parallel evaluation, see parallel"""
+        if self.parallel is True:
+            return get_num_threads()
+        return int(self.parallel)
+
+    def evaluate_parallel(self, binder, params):
+        """evaluates the function of binder on params in chunks of points
+
+        Only elementwise functions are split (see parallel.is_elementwise),
+        others are called once. Gridded functions (see gridify) split their points instead.
+        """
+        num_threads = self.get_num_threads()
+        kwargs = binder.valid_args(params)
+        with threads(num_threads):
+            try:
+                if not is_elementwise(binder.func):
+                    return binder.func(**kwargs)
+                return evaluate_chunked(binder.func, kwargs, num_threads)
+            except TypeError as m:
+                raise TypeError(str(m) + str(list(kwargs.keys())))
+
+    def evaluate_processes(self, variable, binder, params):
+        """evaluates the function of binder on params in shards of points by worker processes
+
+        Workers rebuild the model once from its spec, which defaults to
+        the recipe the model is pickled as (see __reduce__).
+        Functions that are not elementwise (see parallel.is_elementwise)
+        are called once by this process.
+        """
+        kwargs = binder.valid_args(params)
+        if not is_elementwise(binder.func):
+            return binder(params)
+        spec = self.spec
+        if spec is None:
+            spec = functools.partial(unpickle_model, type(self), self.get_recipe())
+        try:
+            return evaluate_sharded(spec, variable, binder.func, kwargs, int(self.processes))
+        except TypeError as m:
+            raise TypeError(str(m) + str(list(kwargs.keys())))
+
+    def evaluate_out_of_core(self, variable, out, units=None, chunk_size=None, progress=None,
+                             **kwargs):
+        """evaluates variable on point arrays too large for memory, writing the result to out
+
+        Arguments may be arrays, np.memmap or paths of .npy files, which are
+        memory-mapped, and are streamed through evaluate chunk_size points
+        at a time (see parallel.evaluate_streamed), so only a chunk of the
+        inputs and output is resident at once. Chunks are evaluated in threads
+        or processes as set by parallel and processes. As in evaluate,
+        arguments may be given as (value, units) pairs and units converts
+        the result.
+
+        out is the path of a .npy file to create or an array to fill.
+        progress(done, total) is called with the number of points
+        evaluated after each chunk.
+
+        Only elementwise functions can be streamed (see parallel.is_elementwise),
+        NotImplementedError is raised for others.
+
+        returns the output, memory-mapped if out is a path
+        """
+        if not hasattr(self, variable):
+            knew, variable_name = self.get_query(variable)
+            return knew.evaluate_out_of_core(
+                variable_name, out, units=units, chunk_size=chunk_size, progress=progress, **kwargs)
+        if not is_elementwise(self[variable]):
+            raise NotImplementedError(
+                'out of core evaluation requires an elementwise function, see kamodofy(pointwise=True)')
+        values, arg_units = split_arg_units(kwargs)
+
+        def evaluate_chunk(**chunk):
+            return self.evaluate(variable, units=units, **join_arg_units(chunk, arg_units))[variable]
+
+        return evaluate_streamed(evaluate_chunk, values, out, chunk_size, progress)
+
+    async def aevaluate(self, variable, units=None, executor=None, chunk_size=None, **kwargs):
+        """evaluates the variable without blocking the event loop
+
+        Arguments are as in evaluate, which is run in executor (the event
+        loop's default executor if None) on chunk_size points at a time
+        (see parallel.evaluate_async), so that concurrent requests take turns.
+        Cancelling the awaiting task stops evaluation after the current chunk.
+        Functions that are not elementwise (see parallel.is_elementwise)
+        are evaluated by a single call in executor.
+
+        returns the dictionary evaluate returns
+        """
+        loop = asyncio.get_running_loop()
+        if not hasattr(self, variable):
+            knew, variable_name = await loop.run_in_executor(executor, self.get_query, variable)
+            return await knew.aevaluate(
+                variable_name, units=units, executor=executor, chunk_size=chunk_size, **kwargs)
+        if not is_elementwise(self[variable]):
+            return await loop.run_in_executor(
+                executor, functools.partial(self.evaluate, variable, units=units, **kwargs))
+
+        values, arg_units = split_arg_units(kwargs)
+        params = dict()
+
+        def evaluate_chunk(**chunk):
+            params.update(self.evaluate(variable, units=units, **join_arg_units(chunk, arg_units)))
+            return {variable: params.pop(variable)}
+
+        results = await evaluate_async(evaluate_chunk, values, executor, chunk_size)
+        params.update({key: value for key, value in values.items() if key in params})
+        params.update(results)
+        return params
+
+    async def aevaluate_many(self, variables, executor=None, chunk_size=None, **kwargs):
+        """evaluates several variables on the same arguments without blocking the event loop
+
+        evaluate_many is run in executor as in aevaluate, in chunks
+        only if all the variables are elementwise.
+
+        returns the dictionary evaluate_many returns
+        """
+        if isinstance(variables, str):
+            variables = [variable.strip() for variable in variables.split(',')]
+        if not all(is_elementwise(getattr(self, variable, None)) for variable in variables):
+            return await asyncio.get_running_loop().run_in_executor(
+                executor, functools.partial(self.evaluate_many, variables, **kwargs))
+        params = OrderedDict()
+
+        def evaluate_chunk(**chunk):
+            params.update(self.evaluate_many(variables, **chunk))
+            return {variable: params.pop(variable) for variable in variables}
+
+        results = await evaluate_async(evaluate_chunk, kwargs, executor, chunk_size)
+        params.update({key: value for key, value in kwargs.items() if key in params})
+        params.update(results)
+        return params
+
+    def evaluate_many(self, variables, **kwargs):
+        """evaluates several variables on the same arguments
+
+        variables may be a list of names or a comma-separated string.
+        Variables defined by expressions are evaluated together by a single
+        kernel in which common subexpressions, including calls to
+        registered functions, are computed once. Variables registered as
+        functions are evaluated as in evaluate, and their results are reused
+        wherever the kernel calls them with the same arguments.
+
+        returns a dictionary of arguments and results, as evaluate does
+        """
+        if isinstance(variables, str):
+            variables = [variable.strip() for variable in variables.split(',')]
+
+        params = OrderedDict()
+        results = OrderedDict()
+        known = OrderedDict()  # {rho(x): rho(x) evaluated on kwargs}
+        exprs = OrderedDict()
+        for variable in variables:
+            expression = getattr(self[variable], 'expression', None)
+            if expression is None:
+                result = self.evaluate(variable, **kwargs)
+                results[variable] = result.pop(variable)
+                params.update(result)
+                symbol = self.signatures[variable]['symbol']
+                if all(str(arg) in kwargs for arg in symbol.args):
+                    known[symbol] = results[variable]
+            else:
+                exprs[variable] = expression
+
+        if len(exprs) > 0:
+            key = (tuple((variable, self[variable]) for variable in exprs), tuple(known))
+            if key in self.kernels:
+                self.kernels.move_to_end(key)
+            else:
+                rhs_exprs = [expression.rhs for expression in exprs.values()]
+                args = sort_symbols(set.union(*[expr.free_symbols for expr in rhs_exprs]))
+                inputs = list(args) + list(known)
+                composition = dict()
+                for expr in rhs_exprs:
+                    composition.update(self.get_composition(None, expr))
+                for name, func in list(composition.items()):
+                    composition[name] = get_compiled(func)
+                self.kernels[key] = inputs, lambdify_many(inputs, rhs_exprs, composition)
+                while len(self.kernels) > self.max_kernels:
+                    self.kernels.popitem(last=False)
+            inputs, kernel = self.kernels[key]
+
+            arg_values = []
+            for arg in inputs:
+                if arg in known:
+                    arg_values.append(known[arg])
+                else:
+                    try:
+                        arg_values.append(kwargs[str(arg)])
+                    except KeyError:
+                        raise TypeError('missing required argument {}'.format(arg))
+                    params[str(arg)] = kwargs[str(arg)]
+            for variable, result in zip(exprs, kernel(*arg_values)):
+                results[variable] = result
+
+        for variable in variables:
+            params[variable] = results[variable]
+        return params
+
     def solve(self, fprime, interval, y0,
               dense_output=True,  # generate a callable solution
               events=None,  # stop when event is triggered
@@ -977,9 +2011,7 @@ class Kamodo(UserDict):
         chart_type = None
         traces = []
 
-        hidden_args = []
-        if 'hidden_args' in self[variable].meta:
-            hidden_args = self[variable].meta['hidden_args']
+        hidden_args = self.get_binder(variable).hidden_args
         arg_arrays = [result[k] for k in result if k not in hidden_args][:-1]
 
         arg_shapes = get_arg_shapes(*arg_arrays)
@@ -1043,21 +2075,14 @@ class Kamodo(UserDict):
 
 
 def compose(**kamodos):
-    """Kamposes multiple kamodo instances into one"""
-    kamodo = Kamodo()
-    for kname, k in kamodos.items():
-        for name, symbol in k.symbol_registry.items():
-            signature = k.signatures[name]
-            meta = k[symbol].meta
-            data = getattr(k[symbol], 'data', None)
-
-            rhs = signature['rhs']
-            registry_name = '{}_{}'.format(name, kname)
-            if (rhs is None) | hasattr(rhs, '__call__'):
-                kamodo[registry_name] = kamodofy(k[symbol], data=data, **meta)
-            else:
-                kamodo[registry_name] = str(rhs)
+    """Kamposes multiple kamodo instances into one
 
+    Symbols of each model are available as name_model. The composed model
+    refers to the models' registries through namespaces rather than
+    re-registering their symbols, and new expressions may combine them.
+    """
+    kamodo = Kamodo()
+    kamodo.add_scopes(*[Namespace(k, kname) for kname, k in kamodos.items()])
     return kamodo
 
 def from_kamodo(kobj, **funcs):
@@ -0,0 +1,180 @@
+"""
+Copyright © 2017 United States Government as represented by the Administrator, National Aeronautics and Space Administration.
+No Copyright is claimed in the United States under Title 17, U.S. Code.  All Other Rights Reserved.
+
+Read-only views of a kamodo model's registries with its symbols renamed,
+so composed models can refer to the model without re-registering it.
+"""
+from collections.abc import Mapping
+
+from sympy import Basic, Function, Symbol
+from sympy.core.function import AppliedUndef, UndefinedFunction
+
+
+class Namespace(object):
+    """Symbols of a model renamed as name_suffix
+
+    Exposes the registries Kamodo resolves symbols from (data, name_index,
+    symbol_registry, signatures, symbol_backends, binders, unit_registry) as views,
+    so lookups are renamed on demand and nothing is copied.
+    """
+
+    def __init__(self, model, suffix):
+        self.model = model
+        self.suffix = '_{}'.format(suffix)
+        self._functions = dict()  # original name -> renamed function
+
+        self.data = RenamedMapping(model.data, self.rename, self.original)
+        self.name_index = RenamedMapping(
+            model.name_index, self.rename_str, self.original_str,
+            lambda item: (self.rename(item[0]), item[1]))
+        self.symbol_registry = RenamedMapping(
+            model.symbol_registry, self.rename_name, self.original_name, self.rename)
+        self.signatures = RenamedMapping(
+            model.signatures, self.rename_name, self.original_name, self.rename_signature)
+        self.symbol_backends = RenamedMapping(
+            model.symbol_backends, self.rename_name, self.original_name)
+        self.binders = RenamedMapping(model.binders, self.rename_name, self.original_name)
+        self.unit_registry = RenamedUnits(self)
+
+    def __repr__(self):
+        return 'Namespace({!r}, {!r})'.format(self.model, self.suffix[1:])
+
+    def __reduce__(self):
+        return (Namespace, (self.model, self.suffix[1:]))
+
+    def get_version(self):
+        return self.model.get_version()
+
+    def original_name(self, name):
+        """name of a model symbol renamed as name, raising KeyError for other names"""
+        if isinstance(name, str) and name.endswith(self.suffix):
+            original = name[:-len(self.suffix)]
+            if original in self.model.symbol_registry:
+                return original
+        raise KeyError(name)
+
+    def rename_name(self, name):
+        if name in self.model.symbol_registry:
+            return name + self.suffix
+        return name
+
+    def function(self, name):
+        """renamed function of the named model symbol"""
+        try:
+            return self._functions[name]
+        except KeyError:
+            pass
+        func = self._functions[name] = Function(name + self.suffix)
+        return func
+
+    def original_function(self, name):
+        """function class the model registered under the original name"""
+        return type(self.model.symbol_registry[name])
+
+    def rename(self, expr):
+        """expr with calls to the model's functions renamed"""
+        if isinstance(expr, UndefinedFunction):
+            name = str(expr)
+            if name in self.model.symbol_registry:
+                return self.function(name)
+            return expr
+        if not isinstance(expr, Basic):
+            return expr
+        calls = dict()
+        for call in expr.atoms(AppliedUndef):
+            name = call.func.__name__
+            if name in self.model.symbol_registry:
+                calls[call] = self.function(name)(*call.args)
+        if len(calls) == 0:
+            return expr
+        return expr.xreplace(calls)
+
+    def original(self, expr):
+        """inverse of rename, raising KeyError for expressions outside the namespace"""
+        if isinstance(expr, str):
+            raise KeyError(expr)
+        if isinstance(expr, UndefinedFunction):
+            return self.original_function(self.original_name(str(expr)))
+        if not isinstance(expr, Basic):
+            raise KeyError(expr)
+        calls = dict()
+        for call in expr.atoms(AppliedUndef):
+            try:
+                name = self.original_name(call.func.__name__)
+            except KeyError:
+                continue
+            calls[call] = self.original_function(name)(*call.args)
+        if len(calls) == 0:
+            raise KeyError(expr)
+        return expr.xreplace(calls)
+
+    def rename_str(self, key):
+        """renames normalized keys of the form f or f(x)"""
+        head, paren, tail = key.partition('(')
+        return self.rename_name(head) + paren + tail
+
+    def original_str(self, key):
+        head, paren, tail = key.partition('(')
+        return self.original_name(head) + paren + tail
+
+    def rename_signature(self, signature):
+        renamed = dict(signature)
+        for key in ['symbol', 'lhs', 'rhs']:
+            if key in renamed:
+                renamed[key] = self.rename(renamed[key])
+        lhs = renamed.get('lhs')
+        if isinstance(lhs, Symbol):  # functions registered by name
+            renamed['lhs'] = Symbol(self.rename_name(lhs.name))
+        return renamed
+
+
+class RenamedMapping(Mapping):
+    """read-only view of a mapping with its keys (and optionally values) renamed"""
+
+    def __init__(self, mapping, rename_key, original_key, rename_value=None):
+        self.mapping = mapping
+        self.rename_key = rename_key
+        self.original_key = original_key
+        self.rename_value = rename_value
+
+    def __getitem__(self, key):
+        value = self.mapping[self.original_key(key)]
+        if self.rename_value is None:
+            return value
+        return self.rename_value(value)
+
+    def __contains__(self, key):
+        try:
+            return self.original_key(key) in self.mapping
+        except (KeyError, TypeError):
+            return False
+
+    def __iter__(self):
+        for key in self.mapping:
+            yield self.rename_key(key)
+
+    def __len__(self):
+        return len(self.mapping)
+
+
+class RenamedUnits(RenamedMapping):
+    """view of a model's unit registry in a namespace, usable as a UnitRegistry parent"""
+
+    def __init__(self, namespace):
+        super(RenamedUnits, self).__init__(
+            namespace.model.unit_registry,
+            namespace.rename,
+            namespace.original,
+            namespace.rename)
+        self.namespace = namespace
+
+    def bucket(self, name):
+        try:
+            original = self.namespace.original_name(name)
+        except KeyError:
+            return ()
+        return [self.namespace.rename(key) for key in self.mapping.bucket(original)]
+
+    def other_keys(self):
+        return self.mapping.other_keys()
@@ -0,0 +1,413 @@
+"""
+Copyright © 2017 United States Government as represented by the Administrator, National Aeronautics and Space Administration.
+No Copyright is claimed in the United States under Title 17, U.S. Code.  All Other Rights Reserved.
+
+Chunked evaluation of functions over large point arrays on a thread pool.
+
+numpy, numexpr and scipy's RegularGridInterpolator release the GIL for most
+of their work, so chunks of the point axis evaluate concurrently in threads.
+Python callables that hold the GIL are evaluated in shards by worker
+processes instead, reading and writing arrays in shared memory.
+Arrays too large for memory are streamed through functions in chunks,
+from and to memory-mapped files. Coroutines evaluate in chunks on an
+executor, so that the event loop is not blocked.
+"""
+import asyncio
+import functools
+import mmap
+import pickle
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator
+
+
+# chunks are at least this many points, smaller inputs are evaluated in one call
+min_chunk = 2**14
+
+# chunks per thread, so that uneven chunks still keep every thread busy
+chunks_per_thread = 4
+
+# shards per process and the minimum number of points in a shard
+shards_per_process = 4
+min_shard = 2**10
+
+# points per chunk of streamed evaluations
+stream_chunk = 2**20
+
+# points per chunk of evaluations awaited by coroutines
+async_chunk = 2**16
+
+# models kept by each worker process, least recently used models are dropped
+max_worker_models = 8
+
+executors = dict()  # {num_threads: ThreadPoolExecutor}
+process_executors = dict()  # {num_processes: ProcessPoolExecutor}
+worker_models = OrderedDict()  # LRU of {pickled spec: model}, in worker processes
+
+local = threading.local()
+
+
+def get_executor(num_threads):
+    """thread pool of num_threads workers, shared by all evaluations"""
+    try:
+        return executors[num_threads]
+    except KeyError:
+        pass
+    executor = executors[num_threads] = ThreadPoolExecutor(
+        max_workers=num_threads, thread_name_prefix='kamodo')
+    return executor
+
+
+def get_process_executor(num_processes):
+    """process pool of num_processes workers, shared by all evaluations"""
+    try:
+        return process_executors[num_processes]
+    except KeyError:
+        pass
+    executor = process_executors[num_processes] = ProcessPoolExecutor(max_workers=num_processes)
+    return executor
+
+
+@contextmanager
+def threads(num_threads):
+    """evaluates functions in this thread with num_threads threads
+
+    Functions that split their points (see map_points) run on the pool,
+    threads of the pool itself evaluate serially.
+    """
+    previous = get_threads()
+    local.num_threads = num_threads
+    try:
+        yield
+    finally:
+        local.num_threads = previous
+
+
+def get_threads():
+    """number of threads available to evaluations in this thread"""
+    return getattr(local, 'num_threads', 1)
+
+
+def leading_length(value):
+    if isinstance(value, np.ndarray) and value.ndim > 0:
+        return value.shape[0]
+    return None
+
+
+def chunk_bounds(npoints, nchunks):
+    """(start, stop) of nchunks nearly equal chunks of npoints"""
+    edges = np.linspace(0, npoints, nchunks + 1).astype(int)
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def split_arguments(kwargs):
+    """number of points and names of the arguments holding them
+
+    Points lie along the first axis of the arguments for which it is longest.
+    """
+    lengths = [leading_length(value) for value in kwargs.values()]
+    npoints = max([length for length in lengths if length is not None], default=0)
+    return npoints, [key for key, length in zip(kwargs, lengths) if length == npoints]
+
+
+def is_pointwise(result, length, ndim):
+    """whether result has one row per point of arguments with at most ndim dimensions"""
+    return isinstance(result, np.ndarray) and 0 < result.ndim <= ndim and \
+        result.shape[0] == length
+
+
+def is_elementwise(func):
+    """whether func is known to evaluate each point independently of the others
+
+    Only such functions may be split into chunks of points: those whose
+    meta flags them pointwise (see kamodofy), functions compiled from
+    expressions composing only elementwise functions, ufuncs, np.vectorize
+    without a signature and scipy's RegularGridInterpolator. Functions
+    that keep the length of their arguments, e.g. cumsum or x - x.mean(),
+    are not elementwise.
+    """
+    meta = getattr(func, 'meta', None)
+    if isinstance(meta, dict) and meta.get('pointwise') is not None:
+        return bool(meta['pointwise'])
+    if getattr(func, 'expression', None) is not None:
+        composition = getattr(func, 'composition', None) or dict()
+        return all(is_elementwise(composed) for composed in composition.values())
+    if isinstance(func, (np.ufunc, np.vectorize)):
+        return func.signature is None
+    return isinstance(func, RegularGridInterpolator)
+
+
+def evaluate_chunked(func, kwargs, num_threads=None):
+    """func(**kwargs), evaluated over chunks of the point axis on a thread pool
+
+    func must be elementwise (see is_elementwise). Arrays whose first axis is the longest among the arguments are split
+    along it, other arguments are passed whole to every chunk. The first
+    chunk is evaluated in the calling thread: unless its result is an array
+    with one row per point (and no more dimensions than the arguments),
+    func is called once on all arguments. The results of the chunks are copied into a preallocated
+    output array.
+    """
+    if num_threads is None:
+        num_threads = get_threads()
+    npoints, split = split_arguments(kwargs)
+    nchunks = min(num_threads*chunks_per_thread, npoints // min_chunk)
+    if num_threads < 2 or nchunks < 2:
+        return func(**kwargs)
+    ndim = max(kwargs[key].ndim for key in split)
+
+    def evaluate_chunk(start, stop):
+        chunk = dict(kwargs)
+        for key in split:
+            chunk[key] = kwargs[key][start:stop]
+        return func(**chunk)
+
+    bounds = chunk_bounds(npoints, nchunks)
+    first = evaluate_chunk(*bounds[0])
+    if not is_pointwise(first, bounds[0][1] - bounds[0][0], ndim):
+        return func(**kwargs)
+
+    executor = get_executor(num_threads)
+    futures = [executor.submit(evaluate_chunk, start, stop) for start, stop in bounds[1:]]
+    result = np.empty((npoints,) + first.shape[1:], dtype=first.dtype)
+    result[:len(first)] = first
+    for (start, stop), future in zip(bounds[1:], futures):
+        result[start:stop] = future.result()
+    return result
+
+
+def map_points(func, points, num_threads=None):
+    """func(points) for points of shape (n, dim), evaluated in chunks of points if func is elementwise"""
+    if not is_elementwise(func):
+        return func(points)
+    return evaluate_chunked(lambda points: func(points), dict(points=points), num_threads)
+
+
+def share_array(array):
+    """copy of array in a new shared memory block, returned with its descriptor"""
+    from multiprocessing.shared_memory import SharedMemory  # python >= 3.8
+    shm = SharedMemory(create=True, size=max(array.nbytes, 1))
+    shared = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+    shared[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def attach_array(descriptor):
+    """shared memory block and array of a descriptor made by share_array"""
+    from multiprocessing.shared_memory import SharedMemory  # python >= 3.8
+    name, shape, dtype = descriptor
+    shm = SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def get_worker_model(spec):
+    """model built by the pickled spec, built once per worker process
+
+    Workers keep the max_worker_models most recently used models.
+    """
+    try:
+        model = worker_models[spec]
+        worker_models.move_to_end(spec)
+        return model
+    except KeyError:
+        pass
+    model = worker_models[spec] = pickle.loads(spec)()
+    while len(worker_models) > max_worker_models:
+        worker_models.popitem(last=False)
+    return model
+
+
+def evaluate_shard(spec, variable, arrays, others, output, start, stop):
+    """evaluates variable on points [start, stop) of shared arrays into the shared output"""
+    model = get_worker_model(spec)
+    blocks = dict()
+    views = dict(others)
+    for key, descriptor in list(arrays.items()) + [(variable, output)]:
+        blocks[key], views[key] = attach_array(descriptor)
+    try:
+        result = views.pop(variable)
+        kwargs = {key: value[start:stop] if key in arrays else value for key, value in views.items()}
+        result[start:stop] = model.get_binder(variable)(kwargs)
+    finally:
+        # views must be released before their blocks are closed
+        result = kwargs = views = None
+        for shm in blocks.values():
+            shm.close()
+
+
+def evaluate_sharded(spec, variable, func, kwargs, num_processes):
+    """func(**kwargs) for the variable func is registered as, evaluated by worker processes
+
+    spec is a picklable callable returning the model, which each worker
+    builds once. Arrays split along their points (see split_arguments) are
+    copied into shared memory, as is the output, so tasks only carry
+    the spec, the names of shared blocks and the bounds of a shard.
+    Other arguments are pickled. As in evaluate_chunked, func must be
+    elementwise, and is called once on all arguments unless the first
+    shard, evaluated by this process, has one row per point.
+    Shared memory requires python 3.8.
+    """
+    npoints, split = split_arguments(kwargs)
+    nshards = min(num_processes*shards_per_process, npoints // min_shard)
+    if num_processes < 2 or nshards < 2:
+        return func(**kwargs)
+    ndim = max(kwargs[key].ndim for key in split)
+
+    bounds = chunk_bounds(npoints, nshards)
+    start, stop = bounds[0]
+    first = func(**dict(kwargs, **{key: kwargs[key][start:stop] for key in split}))
+    if not is_pointwise(first, stop - start, ndim):
+        return func(**kwargs)
+
+    spec = pickle.dumps(spec)
+    others = {key: value for key, value in kwargs.items() if key not in split}
+    blocks = []
+    try:
+        arrays = dict()
+        for key in split:
+            shm, arrays[key] = share_array(np.asarray(kwargs[key]))
+            blocks.append(shm)
+        shm, output = share_array(np.empty((npoints,) + first.shape[1:], dtype=first.dtype))
+        blocks.append(shm)
+
+        executor = get_process_executor(num_processes)
+        futures = [executor.submit(evaluate_shard, spec, variable, arrays, others, output, start, stop)
+                   for start, stop in bounds[1:]]
+        for future in futures:
+            future.result()
+        result = np.ndarray((npoints,) + first.shape[1:], dtype=first.dtype, buffer=shm.buf).copy()
+        result[:len(first)] = first
+        return result
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+
+def open_array(value):
+    """value, with paths of .npy files opened as read-only memory maps"""
+    if isinstance(value, str) and value.endswith('.npy'):
+        return np.load(value, mmap_mode='r')
+    return value
+
+
+def open_output(out, shape, dtype):
+    """out if it is an array of shape, or a new .npy file of shape memory-mapped at path out"""
+    if isinstance(out, str):
+        return np.lib.format.open_memmap(out, mode='w+', dtype=dtype, shape=shape)
+    if out.shape != shape:
+        raise ValueError('output has shape {}, expected {}'.format(out.shape, shape))
+    return out
+
+
+def release_pages(array, start, stop):
+    """drops the pages of rows [start, stop) of a memory-mapped array from resident memory
+
+    Only whole pages are released, and only for arrays owning their mapping,
+    e.g. those opened by np.load or open_memmap. The pages are read again
+    from the file if used.
+    """
+    if not isinstance(array, np.memmap) or array.base is not getattr(array, '_mmap', None):
+        return
+    if not hasattr(mmap, 'MADV_DONTNEED') or not array.flags.c_contiguous:
+        return
+    offset = array.offset % mmap.ALLOCATIONGRANULARITY  # of the data in the mapping
+    begin = (offset + start*array.strides[0]) // mmap.PAGESIZE*mmap.PAGESIZE
+    end = (offset + stop*array.strides[0]) // mmap.PAGESIZE*mmap.PAGESIZE
+    if end > begin:
+        array._mmap.madvise(mmap.MADV_DONTNEED, begin, end - begin)
+
+
+def evaluate_streamed(func, kwargs, out, chunk_size=None, progress=None):
+    """func(**kwargs) written to out, evaluated chunk_size points at a time
+
+    Arguments may be paths of .npy files, which are memory-mapped.
+    As in evaluate_chunked, arrays whose first axis is the longest among
+    the arguments are split along it. func must be elementwise (see
+    is_elementwise), and each chunk must give one row per point. out is an array or the path of a .npy
+    file to create, memory-mapped. After each chunk, the output is flushed
+    and the pages of memory-mapped inputs and output holding the chunk are
+    released, so resident memory is bounded by the chunk size.
+    progress(done, total) is called with the number of points done after each chunk.
+
+    returns the output
+    """
+    if chunk_size is None:
+        chunk_size = stream_chunk
+    kwargs = {key: open_array(value) for key, value in kwargs.items()}
+    npoints, split = split_arguments(kwargs)
+    if len(split) == 0:
+        raise NotImplementedError('streamed evaluation requires arrays of points')
+    ndim = max(kwargs[key].ndim for key in split)
+
+    output = None
+    for start, stop in chunk_bounds(npoints, max(1, -(-npoints // chunk_size))):
+        chunk = dict(kwargs)
+        for key in split:
+            chunk[key] = kwargs[key][start:stop]
+        result = func(**chunk)
+        if not is_pointwise(result, stop - start, ndim):
+            raise NotImplementedError(
+                'streamed evaluation requires a pointwise function, got {} for {} points'.format(
+                    getattr(result, 'shape', type(result)), stop - start))
+        if output is None:
+            output = open_output(out, (npoints,) + result.shape[1:], result.dtype)
+        output[start:stop] = result
+        chunk = result = None
+        if isinstance(output, np.memmap):
+            output.flush()
+        for array in [output] + [kwargs[key] for key in split]:
+            release_pages(array, start, stop)
+        if progress is not None:
+            progress(stop, npoints)
+    return output
+
+
+async def evaluate_async(func, kwargs, executor=None, chunk_size=None):
+    """func(**kwargs) evaluated in executor chunk_size points at a time, for coroutines
+
+    func returns a dictionary of arrays and must be elementwise (see
+    is_elementwise). executor defaults to the event loop's default executor.
+    As in evaluate_chunked, arrays whose first axis is the longest among the
+    arguments are split along it, and func is called once on all arguments
+    unless the arrays returned for the first chunk have one row per point. Each chunk is submitted once the previous
+    one completes, so concurrent evaluations take turns on the executor's
+    workers rather than queueing behind all the chunks of large evaluations.
+    Cancelling the awaiting task stops evaluation after the current chunk.
+    """
+    if chunk_size is None:
+        chunk_size = async_chunk
+    loop = asyncio.get_running_loop()
+
+    def run(chunk):
+        return loop.run_in_executor(executor, functools.partial(func, **chunk))
+
+    npoints, split = split_arguments(kwargs)
+    nchunks = npoints // chunk_size
+    if nchunks < 2:
+        return await run(kwargs)
+    ndim = max(kwargs[key].ndim for key in split)
+
+    def get_chunk(start, stop):
+        chunk = dict(kwargs)
+        for key in split:
+            chunk[key] = kwargs[key][start:stop]
+        return chunk
+
+    bounds = chunk_bounds(npoints, nchunks)
+    start, stop = bounds[0]
+    first = await run(get_chunk(start, stop))
+    if not all(is_pointwise(value, stop - start, ndim) for value in first.values()):
+        return await run(kwargs)
+
+    results = dict()
+    for key, value in first.items():
+        results[key] = np.empty((npoints,) + value.shape[1:], dtype=value.dtype)
+        results[key][:stop] = value
+    for start, stop in bounds[1:]:
+        for key, value in (await run(get_chunk(start, stop))).items():
+            results[key][start:stop] = value
+    return results
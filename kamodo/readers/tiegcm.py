@@ -1,3 +1,5 @@
+import functools
+
 import numpy as np
 
 from kamodo import Kamodo, kamodofy, gridify
@@ -35,7 +37,13 @@ def sort_variables(self, variables):
             variables_3d.append(varname)
     return variables_4d + variables_3d
 
+def ilev(kamodo, points):
+    return kamodo.lev(*points)
+
 class TIEGCM_Kamodo(Kamodo):
+    snapshot_attributes = Kamodo.snapshot_attributes + (
+        '_ilev', '_time', '_lat', '_lon', '_registered')
+
     def __init__(self, filename, variables = None, **kwargs):
         self._tiegcm = TIEGCM(filename)
         
@@ -86,10 +94,7 @@ class TIEGCM_Kamodo(Kamodo):
             self[varname] = variable
 
 
-        def ilev(points):
-            return self.lev(*points)
-
-        self['ilev'] = ilev
+        self['ilev'] = functools.partial(ilev, self)
 
 
     def register_3d_variable(self, units, variable, varname):
@@ -97,13 +102,11 @@ class TIEGCM_Kamodo(Kamodo):
 
         rgi = RegularGridInterpolator((self._time, self._lat, self._lon),
                                       variable, bounds_error = False)
-        @kamodofy(units = units, data = variable)
-        @gridify(t = self._time, lat = self._lat, lon = self._lon)
-        def interpolator(xvec):
-            """Interpolates 3d variable"""
-            return rgi(xvec)
+        # registered without a closure, so the model can be saved (see Kamodo.save)
+        interpolator = gridify(rgi, t = self._time, lat = self._lat, lon = self._lon)
+        interpolator.__doc__ = """Interpolates 3d variable"""
 
-        self[varname] = interpolator
+        self[varname] = kamodofy(interpolator, units = units, data = rgi.values)
         self._registered += 1
 
     def register_4d_variable(self, units, variable, varname):
@@ -111,12 +114,9 @@ class TIEGCM_Kamodo(Kamodo):
 
         rgi = RegularGridInterpolator((self._time, self._ilev, self._lat, self._lon), 
                                       variable, bounds_error = False)
-        @kamodofy(units = units, data = variable)
-        @gridify(t = self._time, ilev = self._ilev, lat = self._lat, lon = self._lon) 
-        def interpolator(xvec):
-            """Interpolates 4d variable"""
-            return rgi(xvec)
-        self[varname] = interpolator
+        interpolator = gridify(rgi, t = self._time, ilev = self._ilev, lat = self._lat, lon = self._lon)
+        interpolator.__doc__ = """Interpolates 4d variable"""
+        self[varname] = kamodofy(interpolator, units = units, data = rgi.values)
         self._registered += 1
 
     @np.vectorize
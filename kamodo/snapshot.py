@@ -0,0 +1,157 @@
+"""
+Copyright © 2017 United States Government as represented by the Administrator, National Aeronautics and Space Administration.
+No Copyright is claimed in the United States under Title 17, U.S. Code.  All Other Rights Reserved.
+
+Snapshots of built models, so that models slow to construct load quickly.
+
+A snapshot is a directory holding a pickle of the model and one .npy file
+per large array it refers to. Arrays are memory-mapped on load, so loading
+costs little more than unpickling the registry, and data is read from disk
+as it is used. The files a model was built from are recorded with their
+modification times and sizes, and snapshots are stale once these change.
+
+Snapshots require python 3.8, whose picklers support reducer_override
+and reduce tuples with a state setter.
+"""
+import os
+import pickle
+import shutil
+import sys
+
+import numpy as np
+
+# bump when the format of snapshots changes
+SNAPSHOT_FORMAT = 1
+
+# arrays of at least this many bytes are stored in their own memory-mapped file
+min_mapped_bytes = 2**12
+
+
+def check_python():
+    """raises NotImplementedError on python versions without the pickling snapshots rely on"""
+    if sys.version_info < (3, 8):
+        raise NotImplementedError('snapshots require python 3.8 or later, found {}.{}'.format(
+            *sys.version_info[:2]))
+
+
+def get_source_stats(sources):
+    """{absolute path: (modification time in ns, size)} of source files"""
+    stats = dict()
+    for source in sources:
+        path = os.path.abspath(source)
+        stat = os.stat(path)
+        stats[path] = (stat.st_mtime_ns, stat.st_size)
+    return stats
+
+
+def check_sources(stats, path):
+    """raises IOError if a source file recorded in stats changed since the snapshot at path"""
+    for source, (mtime, size) in stats.items():
+        try:
+            stat = os.stat(source)
+        except OSError:
+            raise IOError('snapshot {} is stale: {} no longer exists'.format(path, source))
+        if (stat.st_mtime_ns, stat.st_size) != (mtime, size):
+            raise IOError('snapshot {} is stale: {} changed'.format(path, source))
+
+
+class SnapshotPickler(pickle.Pickler):
+    """Pickler writing large arrays to .npy files in directory
+
+    reduce(obj) may return a reduce tuple for obj or NotImplemented,
+    see pickle.Pickler.reducer_override.
+    """
+
+    def __init__(self, file, directory, reduce):
+        super(SnapshotPickler, self).__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.directory = directory
+        self.reduce = reduce
+        self.arrays = dict()  # {id(array): (array, filename)}
+
+    def persistent_id(self, obj):
+        if not isinstance(obj, np.ndarray):
+            return None
+        if obj.dtype.hasobject or obj.nbytes < min_mapped_bytes:
+            return None
+        try:
+            return ('ndarray', self.arrays[id(obj)][1])
+        except KeyError:
+            pass
+        filename = '{}.npy'.format(len(self.arrays))
+        np.save(os.path.join(self.directory, filename), np.asarray(obj))
+        self.arrays[id(obj)] = obj, filename  # keeps obj alive, so its id is not reused
+        return ('ndarray', filename)
+
+    def reducer_override(self, obj):
+        return self.reduce(obj)
+
+
+class SnapshotUnpickler(pickle.Unpickler):
+    """Unpickler memory-mapping the arrays written by SnapshotPickler"""
+
+    def __init__(self, file, directory):
+        super(SnapshotUnpickler, self).__init__(file)
+        self.directory = directory
+
+    def persistent_load(self, pid):
+        kind, filename = pid
+        if kind != 'ndarray':
+            raise pickle.UnpicklingError('unsupported persistent id {}'.format(pid))
+        return np.load(os.path.join(self.directory, filename), mmap_mode='r')
+
+
+def remove_snapshot(path):
+    """removes the snapshot or empty directory at path, if any
+
+    raises FileExistsError if path exists and is neither, so that saving
+    never deletes files that are not snapshots
+    """
+    if not os.path.lexists(path):
+        return
+    if not os.path.isdir(path) or os.path.islink(path):
+        raise FileExistsError('{} exists and is not a snapshot directory'.format(path))
+    if os.listdir(path) and not os.path.isfile(os.path.join(path, 'snapshot.pkl')):
+        raise FileExistsError('{} is not empty and is not a snapshot'.format(path))
+    shutil.rmtree(path)
+
+
+def save_snapshot(path, obj, sources=(), reduce=lambda obj: NotImplemented):
+    """writes a snapshot of obj to the directory path, replacing any previous snapshot
+
+    sources are the files obj was built from. The snapshot is written
+    next to path and moved into place once complete. path may be a
+    previous snapshot or an empty directory, FileExistsError is raised
+    for anything else.
+    """
+    check_python()
+    path = os.path.abspath(path)
+    stats = get_source_stats(sources)
+    partial = path + '.partial'
+    remove_snapshot(partial)
+    remove_snapshot(path)
+    os.makedirs(partial)
+    try:
+        with open(os.path.join(partial, 'snapshot.pkl'), 'wb') as file:
+            pickle.dump(dict(format=SNAPSHOT_FORMAT, sources=stats), file)
+            SnapshotPickler(file, partial, reduce).dump(obj)
+    except:
+        shutil.rmtree(partial)
+        raise
+    remove_snapshot(path)
+    os.rename(partial, path)
+
+
+def load_snapshot(path):
+    """object saved to path by save_snapshot
+
+    raises IOError if the snapshot is missing, of another format, or stale
+    """
+    check_python()
+    path = os.path.abspath(path)
+    with open(os.path.join(path, 'snapshot.pkl'), 'rb') as file:
+        header = pickle.load(file)
+        if header.get('format') != SNAPSHOT_FORMAT:
+            raise IOError('snapshot {} has format {}, expected {}'.format(
+                path, header.get('format'), SNAPSHOT_FORMAT))
+        check_sources(header['sources'], path)
+        return SnapshotUnpickler(file, path).load()
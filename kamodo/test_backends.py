@@ -0,0 +1,126 @@
+"""
+Tests for backends.py
+
+"""
+import numpy as np
+import pytest
+from sympy import sympify
+
+from kamodo import Kamodo, kamodofy
+from kamodo import backends
+from kamodo.backends import numexpr_compatible, split_numexpr, compile_expression
+from kamodo.backends import get_num_threads, set_num_threads
+
+# numexpr is optional, expressions compile with numpy without it
+requires_numexpr = pytest.mark.skipif(backends.numexpr is None, reason='numexpr is not installed')
+
+
+def test_numexpr_compatible():
+    assert numexpr_compatible(sympify('sin(x)**2 + pi*exp(-y)'))
+    assert not numexpr_compatible(sympify('f(x) + 1'))
+    assert not numexpr_compatible(sympify('gamma(x)'))
+
+
+def test_split_numexpr():
+    outer, kernels = split_numexpr(sympify('sin(x)*y + x**2 + f(x)'))
+    assert outer == sympify('_ne0(x, y) + f(x)')
+    assert list(kernels.values()) == [sympify('sin(x)*y + x**2')]
+
+    outer, kernels = split_numexpr(sympify('f(x**2 + 1) + gamma(x)'))
+    assert outer == sympify('f(_ne0(x)) + gamma(x)')
+
+
+@requires_numexpr
+def test_compile_expression():
+    x, y = sympify('x, y')
+    func, backend = compile_expression((x, y), sympify('x*y + 1'), {})
+    assert backend == 'numexpr'
+    assert func(2, 3) == 7
+
+    composition = dict(f=lambda x: 2*x)
+    func, backend = compile_expression((x,), sympify('f(x**2) + gamma(x) + 1'), composition)
+    assert backend == 'numpy+numexpr'
+    assert np.isclose(func(3.), 18 + 2 + 1)
+
+    func, backend = compile_expression((x,), sympify('f(x)'), composition, 'numpy')
+    assert backend == 'numpy'
+    with pytest.raises(TypeError):
+        compile_expression((x,), sympify('f(x)'), composition, 'numexpr')
+    with pytest.raises(KeyError):
+        compile_expression((x,), sympify('x'), {}, 'fortran')
+
+
+@requires_numexpr
+def test_kamodo_numexpr_backend():
+    @kamodofy(units='kg')
+    def rho(x):
+        return 2*x
+
+    kamodo = Kamodo('f(x) = x**2', 'g(x) = gamma(x) + rho(x) + sin(x)**2', rho=rho)
+    assert kamodo.f.meta['backend'] == 'numexpr'
+    assert kamodo.g.meta['backend'] == 'numpy+numexpr'
+    assert 'backend' not in kamodo.rho.meta
+
+
+def test_numexpr_missing(monkeypatch):
+    monkeypatch.setattr(backends, 'numexpr', None)
+    x = sympify('x')
+    func, backend = compile_expression((x,), sympify('x**2 + 1'), {})
+    assert backend == 'numpy'
+    assert func(2) == 5
+    with pytest.raises(TypeError):
+        compile_expression((x,), sympify('x**2 + 1'), {}, 'numexpr')
+
+    kamodo = Kamodo('f(x) = sin(x)**2 + x', compile_cache=False)
+    assert kamodo.f.meta['backend'] == 'numpy'
+    assert np.isclose(kamodo.f(1.), np.sin(1.)**2 + 1)
+
+
+def test_kamodo_backend():
+    kamodo = Kamodo('f(x) = x**2')
+    kamodo.set_backend('f', 'numpy')
+    assert kamodo.f.meta['backend'] == 'numpy'
+    assert kamodo.f(3) == 9
+
+    kamodo = Kamodo('f(x) = x**2', backend='numpy')
+    assert kamodo.f.meta['backend'] == 'numpy'
+
+    with pytest.raises(KeyError):
+        Kamodo(backend='fortran')
+
+    kamodo = Kamodo(lazy=True)
+    kamodo.set_backend('f', 'numpy')
+    kamodo['f'] = 'x**2'
+    assert kamodo.f.meta['backend'] is None
+    assert kamodo.f(2) == 4
+    assert kamodo.f.meta['backend'] == 'numpy'
+
+
+def test_ufunc_backend(tmpdir, monkeypatch):
+    kamodo = Kamodo('f(x, y) = sin(x)*y + x**2', backend='ufunc', compile_cache=str(tmpdir))
+    x = np.linspace(0, 1, 5)
+    assert kamodo.f.meta['backend'] == 'ufunc'
+    assert np.allclose(kamodo.f(x, 2.), np.sin(x)*2 + x**2)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('ufuncify should not be called for a cached build')
+
+    monkeypatch.setattr(backends, 'ufuncify', fail)
+    kamodo = Kamodo('f(x, y) = sin(x)*y + x**2', backend='ufunc', compile_cache=str(tmpdir))
+    assert kamodo.f.meta['backend'] == 'ufunc'
+    assert np.allclose(kamodo.f(x, 2.), np.sin(x)*2 + x**2)
+
+    # expressions ufuncify cannot compile fall back to the default backend
+    kamodo = Kamodo(g=lambda x: np.cos(x), backend='ufunc', compile_cache=str(tmpdir))
+    kamodo['h'] = 'g(x) + x'
+    assert kamodo.h.meta['backend'] == 'numpy'
+
+    monkeypatch.setattr(backends, 'compiler_available', lambda: False)
+    kamodo = Kamodo('f(x) = x**3', backend='ufunc', compile_cache=str(tmpdir))
+    assert kamodo.f.meta['backend'] == Kamodo('f(x) = x**3').f.meta['backend']
+
+
+def test_set_num_threads():
+    previous = set_num_threads(1)
+    assert get_num_threads() == 1
+    set_num_threads(previous)
@@ -0,0 +1,97 @@
+"""
+Tests for compile_cache.py
+
+"""
+import os
+
+import numpy as np
+import pytest
+from sympy import symbols, sympify
+
+from kamodo import Kamodo
+from kamodo import compile_cache
+from kamodo.compile_cache import CompileCache, cached_lambdify, cached_unify, get_compile_cache, get_cache_key
+
+
+def test_cached_lambdify(tmpdir, monkeypatch):
+    cache = CompileCache(str(tmpdir))
+    x, y = symbols('x y')
+    func = cached_lambdify((x, y), x**2 + y, ['numpy'], cache)
+    assert func(3, 1) == 10
+    assert len(cache.entries()) == 1
+
+    def fail(*args, **kwargs):
+        raise AssertionError('lambdify should not be called on a cache hit')
+
+    monkeypatch.setattr(compile_cache, 'lambdify', fail)
+    func = cached_lambdify((x, y), x**2 + y, ['numpy'], cache)
+    assert func(3, 1) == 10
+    assert (func(np.array([1, 2]), 0) == np.array([1, 4])).all()
+
+
+def test_cached_lambdify_composition(tmpdir):
+    pytest.importorskip('numexpr')
+    cache = CompileCache(str(tmpdir))
+    x = symbols('x')
+    expr = sympify('f(x) + 1')
+    with pytest.raises(TypeError):
+        cached_lambdify((x,), expr, ['numexpr'], cache)
+    with pytest.raises(TypeError):  # remembered failure
+        cached_lambdify((x,), expr, ['numexpr'], cache)
+    for i in range(2):
+        func = cached_lambdify((x,), expr, ['numpy', dict(f=lambda x: 2*x)], cache)
+        assert func(3) == 7
+
+
+def test_cache_key():
+    x, y = symbols('x y')
+    assert get_cache_key((x,), x**2, ['numpy']) == get_cache_key((x,), x**2, ['numpy'])
+    assert get_cache_key((x,), x**2, ['numpy']) != get_cache_key((y,), y**2, ['numpy'])
+    assert get_cache_key((x,), x**2, ['numpy']) != get_cache_key((x,), x**2, ['math'])
+
+
+def test_cached_unify(tmpdir, monkeypatch):
+    cache = CompileCache(str(tmpdir))
+    kamodo = Kamodo('a(x[cm])[kg] = x**2', 'c(x[cm])[kg] = x')
+    kamodo.update_unit_registry('b(x[m])[g]', {})
+    expr = sympify('Eq(b(x), a(x))')
+    unified = cached_unify(expr, kamodo.unit_registry, cache)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('unify should not be called on a cache hit')
+
+    monkeypatch.setattr(compile_cache, 'unify', fail)
+    assert cached_unify(expr, kamodo.unit_registry, cache) == unified
+
+    # entries for unrelated functions do not affect the key
+    kamodo.update_unit_registry('c(x[m])[g]', {})
+    assert cached_unify(expr, kamodo.unit_registry, cache) == unified
+
+
+def test_cache_eviction(tmpdir):
+    cache = CompileCache(str(tmpdir), max_bytes=2000)
+    x = symbols('x')
+    for i in range(20):
+        cached_lambdify((x,), x**i, ['numpy'], cache)
+    assert 0 < cache.size() <= 2000
+    cache.clear()
+    assert cache.size() == 0
+
+
+def test_get_compile_cache(tmpdir, monkeypatch):
+    monkeypatch.delenv('KAMODO_CACHE_DIR', raising=False)
+    assert get_compile_cache() is None
+    monkeypatch.setenv('KAMODO_CACHE_DIR', str(tmpdir))
+    assert get_compile_cache().directory == str(tmpdir)
+    assert get_compile_cache(False) is None
+
+
+def test_kamodo_compile_cache(tmpdir):
+    for i in range(2):
+        kamodo = Kamodo(f='x**2', g=lambda y: y + 1, compile_cache=str(tmpdir))
+        kamodo['h(x)'] = 'f(x) + g(x)'
+        kamodo['a(x[cm])[cm]'] = 'x'
+        kamodo['b(x[cm])[m]'] = 'a(x)'
+        assert kamodo.h(3) == 3**2 + 3 + 1
+        assert kamodo.b(300) == 3
+    assert len(os.listdir(str(tmpdir))) > 0
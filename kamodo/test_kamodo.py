@@ -10,11 +10,15 @@ from sympy.core.function import UndefinedFunction
 import pandas as pd
 from kamodo import Kamodo, get_unit, kamodofy, Eq
 import functools
+import inspect
+import pickle
 from sympy import lambdify, sympify
 from kamodo import get_abbrev
 from .util import get_arg_units
 from .util import get_unit_quantity, convert_to
 from kamodo import from_kamodo, compose
+from kamodo import clear_unit_cache, unit_subs
+from kamodo import dependency_order, deferred_function, get_compiled
 from sympy import Function
 
 def test_Kamodo_expr():
@@ -139,6 +143,15 @@ def test_Kamodo_reassignment_units():
     assert kamodo.s(1, 1) == 4
 
 
+def test_get_composition():
+    kamodo = Kamodo(f='x**2', g='y**3', h=lambda z: z)
+    kamodo['k(x,y)'] = 'f(x) + g(y)'
+    composition = kamodo.get_composition(kamodo.k, sympify('f(x)*g(y) + x'))
+    assert set(composition) == {'f', 'g'}
+    assert composition['f'] is kamodo['f']
+    assert kamodo.k(3, 2) == 3 ** 2 + 2 ** 3
+
+
 def test_multivariate_composition():
     kamodo = Kamodo(f='x**2', g=lambda y: y ** 3, verbose=True)
     kamodo['h(x,y)'] = 'f(x) + g(y)'
@@ -247,6 +260,15 @@ def test_get_unit():
     assert get_unit('kg/m^3') == get_unit('kg/m**3')
 
 
+def test_get_unit_cache():
+    assert get_unit('[ kg/m^3 ]') is get_unit('kg/m^3')
+    assert get_unit('R_E') == get_unit('R_E', unit_subs=dict(unit_subs))
+    with pytest.raises(NameError):
+        get_unit('R_E', unit_subs=None)
+    clear_unit_cache()
+    assert get_unit('kg/m^3') == get_unit('kg/m**3')
+
+
 def test_unit_conversion_syntax():
     kamodo = Kamodo('rho[kg/m^3] = x', verbose=True)
     with pytest.raises(NameError):
@@ -547,6 +569,30 @@ def test_from_kamodo():
     assert knew.g(3) == 9
 
 
+def test_new_child():
+    kamodo = Kamodo('f(x[cm])[kg] = x**2', h=lambda y: 2*y)
+    child = kamodo.new_child('g(x[m])[g] = f(x) + 1')
+    assert child.g(1) == 1000*100**2 + 1
+    assert child.f(3) == 9
+    assert child.h(3) == 6
+    assert 'g' not in kamodo
+    assert list(child.detail().index) == ['f', 'h', 'g']
+
+    # definitions on the child shadow the parent
+    child['f(x[cm])[kg]'] = 'x**3'
+    assert child.f(2) == 8
+    assert kamodo.f(2) == 4
+
+    grandchild = child.new_child(k='g + h(x)')
+    assert np.isclose(grandchild.k(1), child.g(1) + 2)
+    with pytest.raises(KeyError):
+        del child['h']
+
+    # new definitions on the parent are visible to children
+    kamodo['m'] = 'x'
+    assert child.m(3) == 3
+
+
 def test_jit_evaluate():
     """Just-in-time evaluation"""
     kamodo = Kamodo(f='x')
@@ -554,6 +600,20 @@ def test_jit_evaluate():
     with pytest.raises(SyntaxError):
         kamodo.evaluate('f**2', x = 3)['x'] == 3
 
+
+def test_evaluate_query_cache():
+    kamodo = Kamodo(f='x')
+    assert kamodo.evaluate('g=f**2;h=g+1', x=3)['h'] == 10
+    knew, name = kamodo.get_query('g = f**2; h = g+1')
+    assert name == 'h'
+    assert len(kamodo._queries) == 1
+    assert kamodo.get_query('g=f**2;h=g+1')[0] is knew
+
+    # registering a function invalidates derived models
+    kamodo['f'] = 'x + 1'
+    assert kamodo.evaluate('g=f**2;h=g+1', x=3)['h'] == 17
+    assert kamodo.get_query('g=f**2;h=g+1')[0] is not knew
+
 def test_eval_no_defaults():
     kamodo = Kamodo(f='x', verbose=True)
     kamodo['g'] = lambda x=3: x
@@ -572,6 +632,73 @@ def test_compose():
     k3['h(f_m1)'] = 'f_m1'
     assert k3.h(3) == 3
 
+
+def test_compose_namespaces():
+    k1 = Kamodo('f(x[cm])[kg] = x**2', 'g(x[cm])[kg] = 2*f(x)')
+    k2 = Kamodo(h=kamodofy(lambda y: y**3, units='g', arg_units=dict(y='m')))
+    k3 = compose(m1=k1, m2=k2)
+    assert k3.f_m1 is k1.f
+    assert k3.signatures['g_m1']['rhs'] == sympify('2*f_m1(x)')
+    assert list(k3.detail().index) == ['f_m1', 'g_m1', 'h_m2']
+    assert [str(key) for key in k3.keys()][::2] == ['f_m1(x)', 'g_m1(x)', 'h_m2(y)']
+    assert k3.f_m1.meta['arg_units'] == dict(x='cm')
+
+    # cross-model expressions are converted between the models' units
+    k3['s(x[m])[kg]'] = 'f_m1(x) + h_m2(x)'
+    assert np.isclose(k3.s(1), 100**2 + 1/1000)
+    assert 's' not in k1
+    assert np.isclose(k3.evaluate('q=2*s', x=1)['q'], 2*k3.s(1))
+
+    # symbols added to a model are visible through the composition
+    k1['r(x[cm])[kg]'] = 'x'
+    assert k3.r_m1(3) == 3
+    assert k3.get_binder('r_m1').func is k1.r
+
+
+def test_binders():
+    @kamodofy(units='kg', hidden_args=['verbose'])
+    def f(x, y=3, verbose=False):
+        return x*y
+
+    kamodo = Kamodo(f=f, g='2*x')
+    binder = kamodo.get_binder('f')
+    assert binder is kamodo.binders['f']
+    assert binder is kamodo.get_binder(kamodo.signatures['f']['symbol'])
+    assert binder.args == ('x', 'y', 'verbose')
+    assert binder.get_defaults() == dict(y=3, verbose=False)
+    assert binder.hidden_args == ('verbose',)
+    assert binder(dict(x=2, z=1)) == 6
+    assert kamodo.evaluate('f', x=2) == dict(y=3, verbose=False, x=2, f=6)
+
+    # redefining a variable replaces its binder
+    kamodo['f(x)[kg]'] = 'x**2'
+    assert kamodo.get_binder('f').func is kamodo.f
+    assert kamodo.evaluate('f', x=2)['f'] == 4
+    del kamodo['f']
+    assert 'f' not in kamodo.binders
+
+
+def test_point():
+    @kamodofy(units='kg')
+    def h(y=2.):
+        return 3*y
+
+    kamodo = Kamodo('f(x[km])[m] = x**2', 'g(x[cm])[m] = sin(f(x)) + 1', 's(x) = sqrt(x)', h=h)
+    assert kamodo.point('f', x=2.) == kamodo.f(2.)
+    assert np.isclose(kamodo.point('g', x=np.float64(2)), kamodo.g(2.))
+    assert kamodo.point('h') == 6
+    assert kamodo.point('h', y=1) == 3
+    assert type(kamodo.point('f', x=2.)) is float
+
+    # arrays and math domain errors fall back to the registered function
+    assert np.allclose(kamodo.point('f', x=np.arange(3.)), [0, 1, 4])
+    with np.errstate(invalid='ignore'):
+        assert np.isnan(kamodo.point('s', x=-1.))
+
+    # kernels follow redefinitions
+    kamodo['f(x[km])[m]'] = 'x**3'
+    assert kamodo.point('f', x=2.) == 8
+
 def test_symbol_replace():
     k = Kamodo(f='x', verbose=True)
 
@@ -595,6 +722,185 @@ def test_contains():
     assert f(x) in kamodo
     assert f('x') in kamodo
 
+def test_name_index():
+    kamodo = Kamodo(f='x', g='y')
+    assert kamodo['f( x )'] is kamodo.f
+    assert kamodo[sympify('f(y)')] is kamodo.f
+    kamodo['f'] = 'x**2'
+    assert kamodo['f'](3) == 9
+    del kamodo['f']
+    assert 'f' not in kamodo
+    assert 'f(x)' not in kamodo.name_index
+    with pytest.raises(KeyError):
+        kamodo['f']
+    assert 'g' in kamodo
+
+def test_dependency_order():
+    definitions = [('h(x)', 'g(x)**2'), ('g', 'f (x) + 1'), ('f(x)', 'x'), ('k', 'y')]
+    ordered = dependency_order(definitions)
+    assert [lhs for lhs, rhs in ordered] == ['f(x)', 'g', 'h(x)', 'k']
+    # names that are not called may be arguments
+    assert dependency_order([('f', 'x**2'), ('x', 't')]) == [('f', 'x**2'), ('x', 't')]
+    # cycles are left in place
+    assert dependency_order([('a', 'b(x)'), ('b', 'a(x)')]) == [('b', 'a(x)'), ('a', 'b(x)')]
+
+
+def test_deferred_function():
+    calls = []
+
+    def compile_function():
+        calls.append(1)
+        return lambda x, y: x + y
+
+    func = deferred_function(symbols('x y'), compile_function)
+    assert inspect.getfullargspec(func).args == ['x', 'y']
+    assert func(1, y=2) == 3
+    assert func(2, 2) == 4
+    assert len(calls) == 1
+    assert get_compiled(func) is func.compiled
+    assert get_compiled(np.sin) is np.sin
+    assert deferred_function(symbols('lambda,'), compile_function) is None
+
+
+def test_register_many():
+    kamodo = Kamodo()
+    kamodo.register_many(
+        'h(x[cm])[m] = f(x)',
+        g='f(x)**2',
+        **{'f(x[cm])[cm]': 'x + 1'})
+    assert kamodo.h(99) == 1
+    assert kamodo.g(2) == 9
+    assert kamodo.signatures['g']['rhs'] == sympify('f(x)**2')
+    for name in ['f', 'g', 'h']:
+        assert not hasattr(kamodo[name], 'compiled')
+        assert inspect.getfullargspec(kamodo[name]).args == ['x']
+    assert kamodo.h.meta['units'] == 'm'
+
+    kamodo = Kamodo(y='f(x)**3', f='x**2 - 1')
+    assert kamodo.y(2) == 27
+
+    # definitions that only use a later name as an argument keep their order
+    kamodo = Kamodo(f='x**2', x='t')
+    assert list(kamodo.signatures) == ['f', 'x']
+    assert kamodo.f(3) == 9
+    assert kamodo.signatures['f']['rhs'] == sympify('x**2')
+
+
+def test_lazy():
+    kamodo = Kamodo(
+        'f(x[cm])[kg] = x**2',
+        'g(x[m])[g] = f(x) + 1',
+        lazy=True)
+    assert kamodo.f.compiled is None
+    assert kamodo.g.compiled is None
+    assert kamodo.g.meta['units'] == 'g'
+    assert inspect.getfullargspec(kamodo.g).args == ['x']
+    assert len(kamodo.detail()) == 2
+    assert 'f' in kamodo.to_latex()
+    assert kamodo.g.compiled is None
+
+    assert kamodo.g(1) == 10000001
+    assert kamodo.g.compiled is not None
+    assert kamodo.f.compiled is None  # inlined into g
+    compiled = kamodo.g.compiled
+    assert kamodo.g(np.array([1, 2]))[1] == 40000001
+    assert kamodo.g.compiled is compiled
+
+    # lazy functions compose with later registrations
+    kamodo['h(x[m])[kg]'] = 'g(x)'
+    assert kamodo.h(1) == 10000.001
+
+
+def test_fuse():
+    @kamodofy(units='kg')
+    def rho(x):
+        return 2*x
+
+    kamodo = Kamodo(
+        'f(x[cm])[kg] = x**2',
+        'g(x[m])[g] = f(x) + 1',
+        'h(x[m])[g] = g(x) + rho(x)',
+        rho=rho)
+    assert kamodo.g.expression.rhs == sympify('1000*(100*x)**2 + 1')
+    assert kamodo.h.expression.rhs.atoms(Function) == {sympify('rho(x)')}
+    assert kamodo.signatures['g']['rhs'] == sympify('1000*f(100*x) + 1')
+    assert kamodo.h(1) == kamodo.g(1) + 2000
+    assert 'f(' not in inspect.getsource(kamodo.g)
+
+    eager = Kamodo(
+        'f(x[cm])[kg] = x**2',
+        'g(x[m])[g] = f(x) + 1',
+        inline=False)
+    assert eager.g.expression.rhs == sympify('1000*f(100*x) + 1')
+    assert eager.g(1) == kamodo.g(1)
+
+
+def test_evaluate_many():
+    calls = []
+
+    @kamodofy(units='kg')
+    def rho(x):
+        calls.append(x)
+        return 2*x
+
+    kamodo = Kamodo(
+        'f(x[cm])[kg] = x**2',
+        'g(x[cm])[kg] = sin(f(x)) + rho(x)',
+        'h(x[cm], y[cm])[kg] = sin(f(x))*y + rho(x)',
+        rho=rho)
+    x = np.linspace(0, 1, 5)
+    result = kamodo.evaluate_many(['g', 'h', 'rho'], x=x, y=2*x)
+    assert list(result) == ['x', 'y', 'g', 'h', 'rho']
+    assert len(calls) == 1
+    assert np.allclose(result['g'], kamodo.g(x))
+    assert np.allclose(result['h'], kamodo.h(x, 2*x))
+    assert np.allclose(result['rho'], 2*x)
+
+    calls.clear()
+    result = kamodo.evaluate_many('f, g', x=x)
+    assert len(calls) == 1
+    assert np.allclose(result['g'], np.sin(x**2) + 2*x)
+    assert len(kamodo.kernels) == 2
+    kamodo.evaluate_many('f, g', x=x)
+    assert len(kamodo.kernels) == 2
+    kamodo.max_kernels = 1
+    kamodo.evaluate_many('g, h', x=x, y=x)
+    assert len(kamodo.kernels) == 1
+
+    with pytest.raises(TypeError):
+        kamodo.evaluate_many(['h'], x=x)
+
+
+def test_evaluate_units():
+    kamodo = Kamodo('rho(x[cm])[kg/m^3] = x**2', 'f(x[m])[m] = x')
+    x = np.array([1., 2.])
+    result = kamodo.evaluate('rho', units='g/cm^3', x=(x, 'km'))
+    assert np.allclose(result['rho'], (1e5*x)**2/1000)
+    assert result['x'] is x
+    assert np.allclose(kamodo.evaluate('rho', units='kg/m^3', x=x)['rho'], x**2)
+
+    # f returns its argument, which must not be scaled in place
+    result = kamodo.evaluate('f', units='km', x=x)
+    assert np.allclose(result['f'], x/1000)
+    assert np.allclose(x, [1., 2.])
+
+    # nor arrays a function keeps
+    stored = np.array([1., 2.])
+
+    @kamodofy(units='m')
+    def g(x):
+        return stored
+
+    kamodo['g'] = g
+    for i in range(2):
+        assert np.allclose(kamodo.evaluate('g', units='km', x=x)['g'], [1e-3, 2e-3])
+    assert np.allclose(stored, [1., 2.])
+
+    assert kamodo.unit_factors[('rho', 'km', 'cm')] == 1e5
+    with pytest.raises(NameError):
+        kamodo.evaluate('f', units='kg', x=x)
+
+
 def test_unusual_signature():
     with pytest.raises(NotImplementedError):
         kamodo = Kamodo()
@@ -618,6 +924,73 @@ def test_method_registry():
     myclass = MyClass()
     myclass['f'] = myclass.f
 
+@kamodofy(units='kg')
+def mass(x):
+    return 2*x
+
+
+class Reader(Kamodo):
+    """subclass constructed with arguments, as readers are"""
+
+    def __init__(self, scale, **kwargs):
+        super(Reader, self).__init__(**kwargs)
+        self.scale = scale
+        self['f'] = 'x*{}'.format(scale)
+        self['g'] = 'f(x)**2'
+
+
+def test_pickle():
+    kamodo = Kamodo('f(x[km])[m] = x**2', g='sin(f(x))', mass=mass)
+    unpickled = pickle.loads(pickle.dumps(kamodo))
+    assert '_recipe' in unpickled.__dict__  # rebuilt on first use
+    x = np.linspace(0, 1, 5)
+    assert np.allclose(unpickled.g(x), kamodo.g(x))
+    assert '_recipe' not in unpickled.__dict__
+    assert unpickled.f.meta['units'] == 'm'
+    assert unpickled.mass(3) == 6
+    assert unpickled.mass.meta['units'] == 'kg'
+    assert pickle.loads(pickle.dumps(unpickled)).f(2.) == 4
+
+    child = kamodo.new_child(h='g(x) + 1')
+    assert pickle.loads(pickle.dumps(child)).h(.5) == child.h(.5)
+
+    composed = compose(a=kamodo, b=Kamodo(p='y**3'))
+    unpickled = pickle.loads(pickle.dumps(composed))
+    assert unpickled.evaluate('f_a', x=2.)['f_a'] == 4
+    assert unpickled.evaluate('p_b', y=2.)['p_b'] == 8
+
+    reader = Reader(3, verbose=False)
+    reader['h'] = 'f(x) + 1'
+    del reader['g']
+    unpickled = pickle.loads(pickle.dumps(reader))
+    assert unpickled.scale == 3
+    assert unpickled.f(2.) == 6
+    assert unpickled.h(2.) == reader.h(2.)
+    assert 'g' not in unpickled
+    # only definitions made after construction are pickled
+    assert [name for name, rhs in reader.get_recipe()['definitions']] == ['h']
+
+
+def test_pickle_rebuild_error(monkeypatch):
+    kamodo = Kamodo('f(x[km])[m] = x**2', g='sin(f(x))')
+    unpickled = pickle.loads(pickle.dumps(kamodo))
+    register_many = Kamodo.register_many
+
+    def register_then_fail(self, *funcs, **kwargs):
+        register_many(self, *funcs, **kwargs)
+        raise ValueError('definition failed')
+
+    monkeypatch.setattr(Kamodo, 'register_many', register_then_fail)
+    with pytest.raises(ValueError):
+        unpickled.g
+    # no half-built state is left behind
+    assert list(unpickled.__dict__) == ['_recipe']
+
+    monkeypatch.undo()
+    assert np.allclose(unpickled.g(1.), kamodo.g(1.))
+    assert list(unpickled.definitions) == ['f', 'g']
+
+
 def test_del_function():
     kamodo = Kamodo(f='x', g='y', h='y', verbose=True)
     del(kamodo.f)
@@ -0,0 +1,279 @@
+"""
+Tests for parallel.py
+
+"""
+import asyncio
+import functools
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+import kamodo.parallel
+from kamodo import Kamodo, kamodofy, gridify
+from kamodo.parallel import chunk_bounds, evaluate_async, evaluate_chunked, evaluate_streamed, \
+    get_worker_model, is_elementwise, min_chunk, min_shard
+
+
+def make_model():
+    """model with a scalar python function, rebuilt by worker processes"""
+    @kamodofy(units='m', pointwise=True)
+    def f(x, y=2.):
+        return np.array([max(x_, .5)*y for x_ in x])
+
+    return Kamodo(f=f, g='x**2')
+
+
+def test_chunk_bounds():
+    assert chunk_bounds(10, 3) == [(0, 3), (3, 6), (6, 10)]
+
+
+def test_evaluate_chunked():
+    npoints = 8*min_chunk
+    x = np.linspace(0, 1, npoints)
+    callers = set()
+
+    def f(x, y, z):
+        callers.add(threading.current_thread().name)
+        return x + y*z
+
+    result = evaluate_chunked(f, dict(x=x, y=2., z=np.array(3.)), num_threads=2)
+    assert np.allclose(result, f(x, 2., 3.))
+    assert len(callers) > 1
+
+    xvec = np.column_stack([x, 2*x])
+    result = evaluate_chunked(lambda xvec: xvec[:, ::-1], dict(xvec=xvec), num_threads=2)
+    assert np.allclose(result, xvec[:, ::-1])
+
+    # small inputs are evaluated in one call
+    callers.clear()
+    assert np.allclose(evaluate_chunked(f, dict(x=x[:10], y=2., z=3.), 2), f(x[:10], 2., 3.))
+    assert len(callers) == 1
+
+
+def test_evaluate_chunked_not_pointwise():
+    x = np.linspace(0, 1, 8*min_chunk)
+    assert evaluate_chunked(np.sum, dict(a=x), num_threads=2) == np.sum(x)
+    outer = evaluate_chunked(lambda a: np.outer(a[:5], a), dict(a=x), num_threads=2)
+    assert outer.shape == (5, len(x))
+
+
+def test_parallel_evaluate():
+    x = np.linspace(0, 1, 8*min_chunk)
+    kamodo = Kamodo('f(x[km], y[km])[m] = sin(x)**2 + exp(-y)', parallel=2)
+    serial = Kamodo('f(x[km], y[km])[m] = sin(x)**2 + exp(-y)')
+    assert np.allclose(kamodo.evaluate('f', x=x, y=x)['f'], serial.f(x, x))
+    assert kamodo.new_child().parallel == 2
+
+    @kamodofy(units='kg')
+    @gridify(t=np.linspace(0, 1, 200), lat=np.linspace(0, 1, 201), lon=np.linspace(0, 1, 202))
+    @kamodofy(pointwise=True)
+    def rho(xvec):
+        return xvec[:, 0] + 2*xvec[:, 1] + 3*xvec[:, 2]
+
+    kamodo['rho'] = rho
+    result = kamodo.evaluate('rho')['rho']
+    assert result.shape == (201, 200, 202)
+    assert np.allclose(result, rho())
+
+
+def test_parallel_not_elementwise():
+    x = np.linspace(0, 1, 8*min_chunk)
+
+    @kamodofy(units='m')
+    def cen(x):
+        return x - x.mean()
+
+    @kamodofy(units='m')
+    def total(x):
+        return np.cumsum(x)
+
+    kamodo = Kamodo(cen=cen, total=total, g='cen(x)*2', parallel=2)
+    assert np.allclose(kamodo.evaluate('cen', x=x)['cen'], x - x.mean())
+    assert np.allclose(kamodo.evaluate('total', x=x)['total'], np.cumsum(x))
+    assert np.allclose(kamodo.evaluate('g', x=x)['g'], 2*(x - x.mean()))
+
+
+def test_is_elementwise():
+    kamodo = Kamodo(f='x**2', g='f(x) + 1')
+    kamodo['h'] = kamodofy(lambda x: x - x.mean())
+    kamodo['k'] = 'h(x) + 1'
+    assert is_elementwise(kamodo.f) and is_elementwise(kamodo.g)
+    assert not is_elementwise(kamodo.h) and not is_elementwise(kamodo.k)
+    assert is_elementwise(kamodofy(lambda x: x, pointwise=True))
+    assert is_elementwise(np.sin) and is_elementwise(np.vectorize(max))
+    assert not is_elementwise(np.vectorize(np.sum, signature='(n)->()'))
+
+
+def test_process_evaluate():
+    x = np.linspace(0, 1, 16*min_shard)
+    kamodo = make_model()
+    kamodo.processes = 2
+    kamodo.spec = make_model
+    result = kamodo.evaluate('f', x=x, y=3.)
+    assert np.allclose(result['f'], np.maximum(x, .5)*3)
+    assert result['x'] is x
+    assert np.allclose(kamodo.evaluate('g', x=x)['g'], x**2)
+
+    # models are rebuilt from their pickled recipe by default
+    kamodo = Kamodo(h='x**2 + 1', processes=2)
+    assert np.allclose(kamodo.evaluate('h', x=x)['h'], x**2 + 1)
+
+    # functions that are not elementwise are not sharded
+    kamodo['cen'] = kamodofy(lambda x: x - x.mean(), units='m')
+    kamodo['total'] = kamodofy(lambda x: np.cumsum(x), units='m')
+    assert np.allclose(kamodo.evaluate('cen', x=x)['cen'], x - x.mean())
+    assert np.allclose(kamodo.evaluate('total', x=x)['total'], np.cumsum(x))
+
+
+def test_worker_models(monkeypatch):
+    monkeypatch.setattr(kamodo.parallel, 'worker_models', OrderedDict())
+    monkeypatch.setattr(kamodo.parallel, 'max_worker_models', 2)
+    specs = [pickle.dumps(functools.partial(Kamodo, f='x**{}'.format(i))) for i in range(3)]
+    first = get_worker_model(specs[0])
+    assert get_worker_model(specs[0]) is first
+    get_worker_model(specs[1])
+    get_worker_model(specs[0])  # most recently used
+    get_worker_model(specs[2])
+    assert list(kamodo.parallel.worker_models) == [specs[0], specs[2]]
+
+
+def test_evaluate_streamed(tmpdir):
+    x = np.linspace(0, 1, 1000)
+    xfile = str(tmpdir.join('x.npy'))
+    np.save(xfile, x)
+    out = str(tmpdir.join('out.npy'))
+    done = []
+    result = evaluate_streamed(lambda x, y: x*y, dict(x=xfile, y=2.), out, chunk_size=300,
+                               progress=lambda n, total: done.append((n, total)))
+    assert isinstance(result, np.memmap)
+    assert np.allclose(np.load(out), 2*x)
+    assert done == [(250, 1000), (500, 1000), (750, 1000), (1000, 1000)]
+
+    xvec = np.column_stack([x, 2*x])
+    result = evaluate_streamed(lambda xvec: xvec[:, ::-1], dict(xvec=xvec), np.empty_like(xvec), 300)
+    assert np.allclose(result, xvec[:, ::-1])
+
+    with pytest.raises(NotImplementedError):
+        evaluate_streamed(np.sum, dict(a=x), out, 300)
+    with pytest.raises(ValueError):
+        evaluate_streamed(lambda x: x, dict(x=x), np.empty(10), 300)
+
+
+def test_evaluate_out_of_core(tmpdir):
+    x = np.linspace(0, 1, 1000)
+    xfile = str(tmpdir.join('x.npy'))
+    np.save(xfile, x)
+    y = np.lib.format.open_memmap(str(tmpdir.join('y.npy')), mode='w+', dtype=x.dtype, shape=x.shape)
+    y[:] = x[::-1]
+    kamodo = Kamodo('f(x[km], y[km])[m] = x + y', parallel=2)
+    out = str(tmpdir.join('f.npy'))
+    result = kamodo.evaluate_out_of_core('f', out, units='cm', chunk_size=128, x=xfile, y=(y, 'm'))
+    expected = kamodo.evaluate('f', units='cm', x=x, y=(x[::-1], 'm'))['f']
+    assert np.allclose(result, expected)
+    assert np.allclose(result[0], 1e-3*100)
+    assert np.allclose(np.load(out, mmap_mode='r'), result)
+
+    result = kamodo.evaluate_out_of_core('g = f(x, y)*2', np.empty(1000), chunk_size=128, x=x, y=x)
+    assert np.allclose(result, 4*x)
+
+    # functions that are not elementwise cannot be streamed
+    kamodo['cen'] = kamodofy(lambda x: x - x.mean(), units='m')
+    with pytest.raises(NotImplementedError):
+        kamodo.evaluate_out_of_core('cen', np.empty(1000), chunk_size=128, x=x)
+    kamodo['total'] = kamodofy(lambda x: np.cumsum(x), units='m')
+    with pytest.raises(NotImplementedError):
+        kamodo.evaluate_out_of_core('total', np.empty(1000), chunk_size=128, x=x)
+
+
+def test_evaluate_async():
+    x = np.linspace(0, 1, 1000)
+    calls = []
+
+    def f(x, y):
+        calls.append(len(x))
+        return dict(f=x*y, g=(x*y).astype(np.float32))
+
+    result = asyncio.run(evaluate_async(f, dict(x=x, y=2.), chunk_size=300))
+    assert calls == [333, 333, 334]
+    assert np.allclose(result['f'], 2*x)
+    assert result['g'].dtype == np.float32
+
+    # functions that are not pointwise are called once on all arguments
+    result = asyncio.run(evaluate_async(lambda a: dict(s=np.sum(a)), dict(a=x), chunk_size=300))
+    assert result['s'] == np.sum(x)
+
+
+def test_aevaluate():
+    x = np.linspace(0, 1, 1000)
+    kamodo = Kamodo('f(x[km], y[km])[m] = x + y', g='f(x, y)**2')
+
+    result = asyncio.run(kamodo.aevaluate('f', units='cm', chunk_size=100, x=x, y=(x, 'm')))
+    expected = kamodo.evaluate('f', units='cm', x=x, y=(x, 'm'))
+    assert list(result) == list(expected)
+    assert result['y'] is x
+    assert np.allclose(result['f'], expected['f'])
+
+    result = asyncio.run(kamodo.aevaluate('h = f(x, y)*2', chunk_size=100, x=x, y=x))
+    assert np.allclose(result['h'], 4*x)
+
+    result = asyncio.run(kamodo.aevaluate_many('f, g', chunk_size=100, x=x, y=x))
+    assert np.allclose(result['g'], 4*x**2)
+    assert result['x'] is x
+
+
+def test_aevaluate_not_elementwise():
+    x = np.linspace(0, 1, 2**18)
+    calls = []
+
+    @kamodofy(units='m')
+    def cen(x):
+        calls.append(len(x))
+        return x - x.mean()
+
+    kamodo = Kamodo(cen=cen, g='cen(x)*2', h='x**2')
+    result = asyncio.run(kamodo.aevaluate('cen', x=x))
+    assert np.allclose(result['cen'], kamodo.evaluate('cen', x=x)['cen'])
+    assert calls == [len(x)]*2
+
+    result = asyncio.run(kamodo.aevaluate('g', chunk_size=1000, x=x))
+    assert np.allclose(result['g'], 2*(x - x.mean()))
+
+    result = asyncio.run(kamodo.aevaluate_many('g, h', x=x))
+    assert np.allclose(result['g'], 2*(x - x.mean()))
+    assert np.allclose(result['h'], x**2)
+
+
+def test_aevaluate_cancel():
+    calls = []
+
+    @kamodofy(units='m', pointwise=True)
+    def f(x):
+        calls.append(len(x))
+        time.sleep(.02)
+        return x
+
+    kamodo = Kamodo(f=f)
+
+    async def cancel():
+        task = asyncio.ensure_future(kamodo.aevaluate('f', chunk_size=10, x=np.linspace(0, 1, 1000)))
+        await asyncio.sleep(.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(.05)
+
+    asyncio.run(cancel())
+    assert len(calls) < 50  # of 100 chunks
+
+
+def test_parallel_settings(monkeypatch):
+    """models use the settings of kamodo.parallel, not of a second copy of the module"""
+    monkeypatch.setattr(kamodo.parallel, 'stream_chunk', 10)
+    done = []
+    Kamodo(f='2*x').evaluate_out_of_core(
+        'f', np.empty(100), progress=lambda n, total: done.append(n), x=np.arange(100.))
+    assert len(done) == 10
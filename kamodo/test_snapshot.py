@@ -0,0 +1,111 @@
+"""
+Tests for snapshot.py
+
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+from scipy.interpolate import RegularGridInterpolator
+
+from kamodo import Kamodo, kamodofy, gridify, compose
+
+
+class Reader(Kamodo):
+    """reads a grid of values from a .npy file, as readers do"""
+    snapshot_attributes = Kamodo.snapshot_attributes + ('filename',)
+
+    def __init__(self, filename, **kwargs):
+        super(Reader, self).__init__(**kwargs)
+        self.filename = filename
+        values = np.load(filename)
+        self._x = np.linspace(0, 1, values.shape[0])
+        self._y = np.linspace(0, 2, values.shape[1])
+        rgi = RegularGridInterpolator((self._x, self._y), values)
+        self['rho'] = kamodofy(gridify(rgi, x=self._x, y=self._y), units='kg', data=rgi.values)
+        self['mass(x, y)[g]'] = 'rho(x, y)'
+
+
+def test_save_load(tmpdir):
+    kamodo = Kamodo('f(x[km])[m] = x**2', g='sin(f(x))', lazy=True)
+    path = str(tmpdir.join('snapshot'))
+    kamodo.save(path)
+    loaded = Kamodo.load(path)
+    x = np.linspace(0, 1, 5)
+    assert np.allclose(loaded.g(x), kamodo.g(x))
+    assert loaded.f.meta['units'] == 'm'
+    assert loaded.lazy
+    assert list(loaded.definitions) == ['f', 'g']
+
+    loaded['h'] = 'g(x) + 1'
+    assert np.allclose(loaded.h(x), kamodo.g(x) + 1)
+
+    child = compose(a=loaded.new_child(p='h(x)*2'), b=Kamodo(q='y**3'))
+    child.save(path)  # replaces the previous snapshot
+    loaded = Kamodo.load(path)
+    assert np.allclose(loaded.evaluate('p_a', x=x)['p_a'], 2*kamodo.g(x) + 2)
+    assert loaded.evaluate('q_b', y=2.)['q_b'] == 8
+
+
+def test_snapshot_arrays(tmpdir):
+    filename = str(tmpdir.join('values.npy'))
+    np.save(filename, np.random.RandomState(0).random_sample((50, 60)))
+    reader = Reader(filename)
+    path = str(tmpdir.join('snapshot'))
+    reader.save(path)
+
+    loaded = Kamodo.load(path)
+    assert type(loaded) is Reader
+    assert loaded.filename == filename
+    assert isinstance(loaded.rho.data, np.memmap)
+    assert np.allclose(loaded.rho(), reader.rho())
+    assert np.allclose(loaded.mass(x=.5, y=1.), reader.mass(x=.5, y=1.))
+
+    # snapshots are stale once the files they were built from change
+    np.save(filename, np.zeros((50, 61)))
+    with pytest.raises(IOError):
+        Kamodo.load(path)
+    os.remove(filename)
+    with pytest.raises(IOError):
+        Kamodo.load(path)
+
+
+def test_save_unpicklable(tmpdir):
+    kamodo = Kamodo(f=lambda x: x**2)
+    path = str(tmpdir.join('snapshot'))
+    with pytest.raises(Exception):
+        kamodo.save(path)
+    assert not os.path.exists(path)
+    assert not os.path.exists(path + '.partial')
+
+
+def test_save_existing(tmpdir):
+    kamodo = Kamodo(f='x**2')
+    directory = tmpdir.mkdir('data')
+    directory.join('values.txt').write('1 2 3')
+    with pytest.raises(FileExistsError):
+        kamodo.save(str(directory))
+    assert directory.join('values.txt').read() == '1 2 3'
+    assert not os.path.exists(str(directory) + '.partial')
+
+    tmpdir.join('file').write('')
+    with pytest.raises(FileExistsError):
+        kamodo.save(str(tmpdir.join('file')))
+
+    # empty directories and previous snapshots are replaced
+    empty = str(tmpdir.mkdir('empty'))
+    kamodo.save(empty)
+    kamodo.save(empty)
+    assert np.allclose(Kamodo.load(empty).f(2.), 4)
+
+
+def test_snapshot_python(tmpdir, monkeypatch):
+    kamodo = Kamodo(f='x**2')
+    path = str(tmpdir.join('snapshot'))
+    kamodo.save(path)
+    monkeypatch.setattr(sys, 'version_info', (3, 7, 0))
+    with pytest.raises(NotImplementedError):
+        kamodo.save(str(tmpdir.join('other')))
+    with pytest.raises(NotImplementedError):
+        Kamodo.load(path)
@@ -0,0 +1,98 @@
+"""
+Tests for unit_algebra.py
+
+"""
+from collections import OrderedDict
+from fractions import Fraction
+
+import pytest
+from sympy import Function, symbols, sympify, Rational
+
+from kamodo import Kamodo, get_unit
+from kamodo.util import convert_to, get_expr_unit
+from kamodo.unit_algebra import UnitRegistry, registry_functions, \
+    get_unit_vector, has_dimensions, convert_units
+import kamodo.unit_algebra
+
+
+def test_unit_vector():
+    meter = get_unit_vector(get_unit('m'))
+    second = get_unit_vector(get_unit('s'))
+    velocity = meter/second
+    assert velocity.dims[:3] == (1, 0, -1)
+    assert (meter*meter).dims == (meter**2).dims
+    assert (meter**Rational(1, 2)).dims[0] == Fraction(1, 2)
+    assert get_unit_vector(get_unit('km')).scale == 1000
+    assert get_unit_vector(get_unit('km')).compatible(meter)
+    assert not velocity.compatible(meter)
+
+
+def test_has_dimensions():
+    assert has_dimensions(get_unit('kg/m^3'))
+    assert not has_dimensions(get_unit(''))
+    assert not has_dimensions(symbols('x'))
+    assert get_unit_vector(symbols('x')) is None
+
+
+@pytest.mark.parametrize('from_unit,to_unit', [
+    ('km', 'm'),
+    ('cm', 'km'),
+    ('g', 'kg'),
+    ('nT', 'T'),
+    ('eV', 'erg'),
+    ('R_E', 'km'),
+    ('1/cm^3', '1/m^3'),
+    ('kg/m^3', 'g/cm^3'),
+    ('km/s', 'cm/s'),
+    ('m^2', 'cm^2'),
+])
+def test_convert_units(from_unit, to_unit):
+    x = symbols('x')
+    from_unit = get_unit(from_unit)
+    to_unit = get_unit(to_unit)
+    expected = convert_to(x*from_unit, to_unit)/to_unit
+    assert convert_units(x, from_unit, to_unit) == expected
+
+
+def test_convert_units_raises():
+    x = symbols('x')
+    assert convert_units(x, get_unit(''), get_unit('m')) is None
+    with pytest.raises(NameError):
+        convert_units(x, get_unit('kg'), get_unit('m'))
+
+
+def test_unit_registry():
+    f, g = Function('f'), Function('g')
+    f_x, f_cm, g_x, g_km = f(symbols('x')), f(get_unit('cm')), g(symbols('x')), g(get_unit('km'))
+    registry = UnitRegistry()
+    registry[f_x] = get_unit('kg')
+    registry[g_x] = g_km
+    registry[g_km] = get_unit('m')
+    registry[f_cm] = get_unit('g')
+    registry[symbols('y')] = get_unit('s')
+
+    assert list(registry) == [f_x, g_x, g_km, f_cm, symbols('y')]
+    assert registry.functions(sympify('f(t)')) == [f_x, f_cm]
+    assert registry.signatures(sympify('f(t)')) == [f_x]
+    assert registry.functions(sympify('h(t)')) == []
+
+    selected = registry.select(sympify('2*f(t)'))
+    assert list(selected) == [symbols('y'), f_x, f_cm]
+
+    del registry[f_x]
+    assert registry.functions(f_x) == [f_cm]
+    assert registry_functions(dict(registry), f_x) == registry_functions(registry, f_x)
+
+    # util re-exports the package module rather than a second copy of it
+    assert UnitRegistry is kamodo.unit_algebra.UnitRegistry
+    assert isinstance(Kamodo().unit_registry, kamodo.unit_algebra.UnitRegistry)
+
+
+def test_unit_registry_resolution():
+    f = Function('f')
+    unit_registry = OrderedDict([
+        (f(symbols('x')), f(get_unit('cm'))),
+        (f(get_unit('cm')), get_unit('kg'))])
+    expr = sympify('f(y)')
+    assert get_expr_unit(expr, unit_registry) == get_unit('kg')
+    assert get_expr_unit(expr, UnitRegistry(unit_registry)) == get_unit('kg')
@@ -1,4 +1,6 @@
 from collections import OrderedDict
+import inspect
+import pickle
 
 import numpy as np
 import pytest
@@ -245,6 +247,45 @@ def test_meta_data_kwargs():
     assert h.data == 3
 
 
+def test_lazy_data():
+    calls = []
+
+    @kamodofy(units='kg')
+    def mass(x=np.linspace(0, 1, 5)):
+        calls.append(x)
+        return 2*x
+
+    kamodo = Kamodo(mass=mass, density='mass/4')
+    Kamodo(m=kamodo.mass)
+    assert len(calls) == 0
+
+    assert mass.data[-1] == 2
+    assert mass.data[-1] == 2
+    assert len(calls) == 1
+
+    mass.invalidate()
+    assert len(calls) == 1
+    assert mass.materialize()[-1] == 2
+    assert len(calls) == 2
+
+    mass.data = 3
+    mass.invalidate()
+    assert mass.data == 3
+
+
+def test_kamodofy_method():
+    class Model(Kamodo):
+        @kamodofy(units='kg')
+        def f(self, x):
+            return 2*x
+
+    model = Model()
+    model['f'] = model.f
+    assert model.f(3) == 6
+    assert model.f.meta['units'] == 'kg'
+    assert list(inspect.signature(model.f).parameters) == ['x']
+
+
 def test_repr_latex():
     @kamodofy(equation='$f(x) = x_i^2$')
     def f(x):
@@ -285,6 +326,9 @@ def test_gridify():
     from kamodo import Kamodo
     kamodo = Kamodo(grids=grid_fun)
     assert kamodo.grids().shape == (10, 20, 30)
+    unpickled = pickle.loads(pickle.dumps(grid_fun))
+    assert unpickled().shape == (10, 20, 30)
+    assert unpickled.meta == grid_fun.meta
 
 
 def test_symbolic():
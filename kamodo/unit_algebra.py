@@ -0,0 +1,273 @@
+"""
+Copyright © 2017 United States Government as represented by the Administrator, National Aeronautics and Space Administration.
+No Copyright is claimed in the United States under Title 17, U.S. Code.  All Other Rights Reserved.
+
+Unit algebra on (scale factor, dimension vector) pairs
+and the registry of function units
+
+sympy is only used to read units and to rationalize results,
+so that conversion factors match sympy's convert_to.
+"""
+import functools
+from collections import OrderedDict, namedtuple
+from collections.abc import MutableMapping
+from fractions import Fraction
+
+from sympy import Float, Mul, Pow, nsimplify
+from sympy.core.function import AppliedUndef
+from sympy.physics.units import Quantity, UnitSystem
+
+base_dimensions = (
+    'length', 'mass', 'time', 'current', 'temperature',
+    'amount_of_substance', 'luminous_intensity')
+
+
+def to_fraction(value):
+    """python Fraction of an integer or sympy Rational"""
+    if hasattr(value, 'q'):
+        return Fraction(int(value.p), int(value.q))
+    return Fraction(value)
+
+
+class UnitVector(namedtuple('UnitVector', ['scale', 'dims'])):
+    """A unit as a scale factor relative to the unit system and a tuple of dimension exponents
+
+    scale is a sympy number, so products of scale factors are exact
+    wherever sympy's own scale factors are.
+    """
+
+    def __mul__(self, other):
+        return UnitVector(
+            self.scale*other.scale,
+            tuple(a + b for a, b in zip(self.dims, other.dims)))
+
+    def __truediv__(self, other):
+        return UnitVector(
+            self.scale/other.scale,
+            tuple(a - b for a, b in zip(self.dims, other.dims)))
+
+    def __pow__(self, exponent):
+        return UnitVector(
+            self.scale**exponent,
+            tuple(a*to_fraction(exponent) for a in self.dims))
+
+    def compatible(self, other):
+        return self.dims == other.dims
+
+
+dimensionless = UnitVector(1, (0,)*len(base_dimensions))
+
+_unit_vectors = dict()
+
+
+def quantity_vector(quantity, unit_system='SI'):
+    unit_system = UnitSystem.get_unit_system(unit_system)
+    scale = unit_system.get_quantity_scale_factor(quantity)
+    dimension = unit_system.get_quantity_dimension(quantity)
+    dependencies = unit_system.get_dimension_system().get_dimensional_dependencies(dimension)
+    if not set(dependencies).issubset(base_dimensions):
+        return None
+    return UnitVector(scale, tuple(
+        to_fraction(dependencies.get(name, 0)) for name in base_dimensions))
+
+
+def get_unit_vector(unit):
+    """UnitVector of a sympy unit expression, or None if unit is not a product of quantities
+
+    Results are memoized per unit expression.
+    """
+    try:
+        return _unit_vectors[unit]
+    except KeyError:
+        pass
+    except TypeError:  # unhashable
+        return None
+    if isinstance(unit, Quantity):
+        vector = quantity_vector(unit)
+    elif isinstance(unit, Mul):
+        vector = dimensionless
+        for arg in unit.args:
+            arg_vector = get_unit_vector(arg)
+            if arg_vector is None:
+                vector = None
+                break
+            vector = vector*arg_vector
+    elif isinstance(unit, Pow) and unit.exp.is_Rational:
+        base = get_unit_vector(unit.base)
+        vector = None if base is None else base**unit.exp
+    elif getattr(unit, 'is_Number', False) and unit.is_nonzero:
+        vector = UnitVector(unit, dimensionless.dims)
+    else:
+        vector = None
+    _unit_vectors[unit] = vector
+    return vector
+
+
+def has_dimensions(unit):
+    """whether unit is a known unit with physical dimensions"""
+    vector = get_unit_vector(unit)
+    return (vector is not None) and (vector.dims != dimensionless.dims)
+
+
+@functools.lru_cache(maxsize=4096)
+def rational_float(value):
+    """the rational nsimplify(rational=True) assigns to a Float"""
+    return nsimplify(value, rational=True)
+
+
+def rationalize(expr):
+    """nsimplify(expr, rational=True) with conversions of repeated floats memoized"""
+    floats = expr.atoms(Float)
+    if len(floats) > 0:
+        expr = expr.xreplace({value: rational_float(value) for value in floats})
+    return nsimplify(expr, rational=True)
+
+
+def convert_units(expr, from_unit, to_unit):
+    """expr in from_unit expressed as a multiple of to_unit
+
+    Equivalent to convert_to(expr*from_unit, to_unit)/to_unit for units with
+    physical dimensions. Returns None if either unit is not supported,
+    raises NameError if the dimensions differ.
+    """
+    if not (has_dimensions(from_unit) and has_dimensions(to_unit)):
+        return None
+    from_vector = get_unit_vector(from_unit)
+    to_vector = get_unit_vector(to_unit)
+    if not from_vector.compatible(to_vector):
+        raise NameError('cannot convert {} to {}'.format(from_unit, to_unit))
+    return rationalize(expr*from_vector.scale/to_vector.scale)
+
+
+class UnitRegistry(MutableMapping):
+    """Ordered mapping of function signatures to units, indexed by function
+
+    Entries take the forms {f(x): f(cm), f(cm): kg} or {f(x): kg}.
+    Keys that are function calls are also kept in per-function buckets,
+    so lookups by function do not scan the whole registry.
+
+    A registry with parents resolves missing keys and functions from the parents,
+    in order, and only stores its own entries. Functions it registers shadow
+    the parents'. Parents may be any mappings providing bucket and other_keys.
+    """
+
+    def __init__(self, *args, parents=(), **kwargs):
+        self.parents = tuple(parents)
+        self._entries = OrderedDict()
+        self._functions = dict()  # function name -> OrderedDict of keys
+        self._others = OrderedDict()  # keys that are not function calls
+        self.update(*args, **kwargs)
+
+    def __getitem__(self, key):
+        try:
+            return self._entries[key]
+        except KeyError:
+            pass
+        for parent in self.parents:
+            try:
+                return parent[key]
+            except KeyError:
+                pass
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        self._entries[key] = value
+        if isinstance(key, AppliedUndef):
+            self._functions.setdefault(key.func.__name__, OrderedDict())[key] = None
+        else:
+            self._others[key] = None
+
+    def __delitem__(self, key):
+        """removes an entry of this registry; entries of parents cannot be removed"""
+        del self._entries[key]
+        if isinstance(key, AppliedUndef):
+            bucket = self._functions[key.func.__name__]
+            del bucket[key]
+            if len(bucket) == 0:
+                del self._functions[key.func.__name__]
+        else:
+            del self._others[key]
+
+    def __iter__(self):
+        seen = set(self._entries)
+        for parent in self.parents[::-1]:
+            for key in parent:
+                if key not in seen:
+                    seen.add(key)
+                    yield key
+        yield from self._entries
+
+    def __len__(self):
+        if len(self.parents) == 0:
+            return len(self._entries)
+        return sum(1 for key in self)
+
+    def __contains__(self, key):
+        try:
+            if key in self._entries:
+                return True
+        except TypeError:  # unhashable
+            return False
+        return any(key in parent for parent in self.parents)
+
+    def __repr__(self):
+        return 'UnitRegistry({})'.format(list(self.items()))
+
+    def copy(self):
+        return UnitRegistry(self)
+
+    def new_child(self):
+        """empty registry resolving missing entries from this one"""
+        return UnitRegistry(parents=(self,))
+
+    def bucket(self, name):
+        """keys of the named function, from the nearest registry defining it"""
+        if name in self._functions:
+            return self._functions[name]
+        for parent in self.parents:
+            bucket = parent.bucket(name)
+            if len(bucket) > 0:
+                return bucket
+        return ()
+
+    def other_keys(self):
+        """keys that are not function calls"""
+        seen = set(self._others)
+        for parent in self.parents[::-1]:
+            for key in parent.other_keys():
+                if key not in seen:
+                    seen.add(key)
+                    yield key
+        yield from self._others
+
+    def functions(self, func):
+        """registered calls of the same function as func, in insertion order"""
+        return [key for key in self.bucket(func.func.__name__) if type(key) == type(func)]
+
+    def signatures(self, func):
+        """registered calls of func with symbolic arguments, e.g. f(x) but not f(cm)"""
+        return [key for key in self.functions(func) if len(key.free_symbols) > 0]
+
+    def select(self, expr):
+        """registry of the entries unit resolution of expr can depend on
+
+        Entries of functions not called in expr can never match its terms,
+        so they are left out.
+        """
+        selected = UnitRegistry()
+        for key in self.other_keys():
+            selected[key] = self[key]
+        for name in set(func.func.__name__ for func in expr.atoms(AppliedUndef)):
+            for key in self.bucket(name):
+                selected[key] = self[key]
+        return selected
+
+
+def registry_functions(unit_registry, func):
+    """keys of unit_registry calling the same function as func
+
+    unit_registry may be a UnitRegistry or any mapping.
+    """
+    if isinstance(unit_registry, UnitRegistry):
+        return unit_registry.functions(func)
+    return [key for key in unit_registry if type(key) == type(func)]
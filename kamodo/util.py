@@ -4,6 +4,7 @@ No Copyright is claimed in the United States under Title 17, U.S. Code.  All Oth
 """
 import logging
 import os
+import types
 import tempfile
 import sys
 import numpy.f2py  # just to check it presents
@@ -37,6 +38,10 @@ from sympy.physics.units.quantities import Quantity
 from sympy.physics.units import Dimension
 from sympy import nsimplify
 from sympy import Function
+from sympy.core.function import AppliedUndef
+from .unit_algebra import convert_units, get_unit_vector, has_dimensions
+from .unit_algebra import registry_functions
+from .parallel import map_points
 
 def get_unit_quantity(name, base, scale_factor, abbrev=None, unit_system='SI'):
     '''Define a unit in terms of a base unit'''
@@ -111,6 +116,85 @@ def decorator_wrapper(f, *args, **kwargs):
     return f(*args, **kwargs)
 
 
+class KamodoFunction(object):
+    """A function carrying kamodo meta and lazily evaluated data
+
+    Calls go straight to the wrapped function, whose signature is preserved.
+    data is computed on first access by calling the function with data_kwargs
+    and cached. materialize() computes it eagerly, invalidate() drops it.
+    Data that was supplied, or assigned to .data, is kept by invalidate.
+    """
+
+    def __init__(self, func, data=None, data_kwargs=None):
+        functools.update_wrapper(self, func)
+        self.__dict__.pop('data', None)
+        self.__signature__ = inspect.signature(func)
+        self._data_kwargs = data_kwargs or dict()
+        self._kamodofy_kwargs = dict(self._data_kwargs)
+        self._data = data
+        self._data_supplied = data is not None
+        self._data_evaluated = data is not None
+
+    def __call__(self, *args, **kwargs):
+        return self.__wrapped__(*args, **kwargs)
+
+    def __get__(self, obj, objtype=None):
+        """binds to instances when used as a method"""
+        if obj is None:
+            return self
+        return types.MethodType(self, obj)
+
+    def __repr__(self):
+        return '<kamodofied function {}>'.format(self.__qualname__)
+
+    def __reduce__(self):
+        """pickles by name if importable, otherwise as the wrapped function and its kamodofy arguments
+
+        Data is pickled only if it was supplied.
+        """
+        found = sys.modules.get(self.__module__)
+        for name in self.__qualname__.split('.'):
+            found = getattr(found, name, None)
+        if found is self:
+            return self.__qualname__
+        kwargs = dict(self._kamodofy_kwargs)
+        if self._data_supplied:
+            kwargs['data'] = self._data
+        return (kamodofied, (self.__wrapped__, kwargs))
+
+    @property
+    def data(self):
+        if not self._data_evaluated:
+            self.materialize()
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+        self._data_supplied = True
+        self._data_evaluated = True
+
+    def materialize(self):
+        """evaluates and caches data, or None if the function requires arguments"""
+        try:
+            self._data = self.__wrapped__(**self._data_kwargs)
+        except:
+            self._data = None
+        self._data_evaluated = True
+        return self._data
+
+    def invalidate(self):
+        """drops computed data, so it is re-evaluated on next access"""
+        if not self._data_supplied:
+            self._data = None
+            self._data_evaluated = False
+
+
+def kamodofied(func, kwargs):
+    """kamodofy(func, **kwargs), used to unpickle KamodoFunctions"""
+    return kamodofy(func, **kwargs)
+
+
 def kamodofy(
         _func=None,
         units='',
@@ -120,38 +204,42 @@ def kamodofy(
         equation=None,
         citation=None,
         hidden_args=[],
+        pointwise=None,
         **kwargs):
     """Adds meta and data attributes to functions for compatibility with Komodo
 
     meta: a dictionary containing {units: <str>}
+    pointwise: True if f evaluates each point independently of the others,
+        so that its points may be evaluated in chunks (see parallel.is_elementwise)
     data:
         if supplied, set f.data = data
-        if not supplied, set f.data = f(), assuming it can be called with no arguments.
-            If f cannot be called with no arguments, set f.data = None
+        if not supplied, f.data = f() is evaluated on first access,
+            assuming f can be called with no arguments.
+            If f cannot be called with no arguments, f.data is None
+
+    returns a KamodoFunction
     """
 
     def decorator_kamodofy(f):
+        if isinstance(f, KamodoFunction):
+            f = f.__wrapped__
         f.meta = dict(
             units=units,
             arg_units=arg_units,
             citation=citation,
             equation=equation,
-            hidden_args=hidden_args)
+            hidden_args=hidden_args,
+            pointwise=pointwise)
 
-        if citation is not None:
-            f.__doc__ = f.__doc__ + '\n\ncitation: {}'.format(citation)
+        citation_str = '\n\ncitation: {}'.format(citation)
+        if citation is not None and not f.__doc__.endswith(citation_str):
+            f.__doc__ = f.__doc__ + citation_str
         f.update = update
-        if data is None:
-            try:
-                f.data = f(**kwargs)
-            except:
-                f.data = None
-        else:
-            f.data = data
 
+        # partials of str rather than lambdas, so f can be pickled
         if equation is not None:
             latex_str = equation.strip("$")
-            f._repr_latex_ = lambda: latex_str
+            f._repr_latex_ = functools.partial(str, latex_str)
         # f._repr_latex_ = lambda : "${}$".format(latex(parse_latex(latex_str)))
         else:
             f_ = symbols(f.__name__, cls=UndefinedFunction)
@@ -159,9 +247,19 @@ def kamodofy(
             # lambda_ = symbols('lambda', cls=UndefinedFunction)
             lambda_ = Function('lambda')
             latex_eq = latex(Eq(lhs, lambda_(*lhs.args)))
-            f._repr_latex_ = lambda: "${}$".format(latex(latex_eq))
+            f._repr_latex_ = functools.partial(str, "${}$".format(latex(latex_eq)))
 
-        return decorate(f, decorator_wrapper)  # preserves signature
+        func = KamodoFunction(f, data, kwargs)
+        func._kamodofy_kwargs = dict(
+            units=units,
+            arg_units=arg_units,
+            update=update,
+            equation=equation,
+            citation=citation,
+            hidden_args=hidden_args,
+            pointwise=pointwise,
+            **kwargs)
+        return func
 
     if _func is None:
         return decorator_kamodofy
@@ -225,6 +323,50 @@ def get_defaults(func):
         return None
 
 
+class Binder(object):
+    """Binds keyword arguments to a function
+
+    Holds the argument names, defaults and hidden args of func, so that
+    valid_args, get_defaults and eval_func need not inspect it on every call.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        if type(func) == np.vectorize:
+            pyfunc = func.pyfunc
+        else:
+            pyfunc = func
+        self.args = tuple(getfullargspec(pyfunc).args)
+        self.defaults = get_defaults(pyfunc)
+        self.hidden_args = tuple(getattr(func, 'meta', dict()).get('hidden_args', []))
+
+    def __repr__(self):
+        return 'Binder({})'.format(', '.join(self.args))
+
+    def valid_args(self, kwargs):
+        """Extract arguments from kwargs that appear in func"""
+        return OrderedDict([(a, kwargs[a]) for a in self.args if a in kwargs])
+
+    def get_defaults(self):
+        """copy of the default arguments of func"""
+        return dict(self.defaults)
+
+    def __call__(self, kwargs):
+        """Evaluate func over valid arguments"""
+        valid = self.valid_args(kwargs)
+        try:
+            return self.func(**valid)
+        except TypeError as m:
+            raise TypeError(str(m) + str(list(valid.keys())))
+
+
+def get_binder(func):
+    """func if it is a Binder, else a new Binder for func"""
+    if isinstance(func, Binder):
+        return func
+    return Binder(func)
+
+
 def cast_0_dim(a, to):
     if a.ndim == 0:
         return a * np.ones(to.shape)
@@ -237,7 +379,7 @@ def simulate(state_funcs, **kwargs):
 
     state_funcs(OrderedDict)
         key: the variable to update
-        value: the function that updates the variable
+        value: the function that updates the variable (or its Binder)
 
     Any remaining kwargs are passed to the state functions.
 
@@ -248,12 +390,13 @@ def simulate(state_funcs, **kwargs):
     steps = kwargs.get('steps', 1)
 
     state_dict = kwargs.copy()
+    binders = [(arg, get_binder(f)) for arg, f in state_funcs.items()]
     yield OrderedDict([(k, state_dict.get(k, None)) for k in state_funcs])
     for i in range(steps):
         result = []
-        for arg, f in list(state_funcs.items()):
+        for arg, binder in binders:
             try:
-                result.append((arg, eval_func(f, state_dict)))
+                result.append((arg, binder(state_dict)))
             except TypeError as m:
                 raise TypeError('{}:'.format(arg) + str(m))
             state_dict.update(OrderedDict(result))
@@ -313,35 +456,45 @@ existing_plot_types = pd.DataFrame({
 existing_plot_types.index.set_names(['nargs', 'arg shapes', 'out shape'], inplace=True)
 existing_plot_types.columns = ['Plot Type', 'notes']
 
-# manually generate the appropriate function signature
-grid_wrapper_def = r"""def wrapped({signature}):
-    coordinates = np.meshgrid({arg_str}, indexing = 'xy', sparse = False, copy = False)
-    points = np.column_stack([c.ravel() for c in coordinates])
-    return np.squeeze({fname}(points).reshape(coordinates[0].shape, order = 'A'))
+class GridFunction(object):
+    """A function of points of shape (n, dim) called on the grid of its arguments
+
+    The signature has one argument per grid dimension, defaulting to the grid.
+    GridFunctions pickle as long as the function of points does,
+    e.g. a scipy RegularGridInterpolator.
     """
 
+    def __init__(self, func, defaults):
+        self.func = func
+        self.__module__ = getattr(func, '__module__', None)
+        self.__name__ = getattr(func, '__name__', 'gridded')
+        self.__qualname__ = getattr(func, '__qualname__', self.__name__)
+        self.__doc__ = func.__doc__
+        self.__signature__ = inspect.Signature([
+            inspect.Parameter(k, inspect.Parameter.POSITIONAL_OR_KEYWORD, default=v)
+            for k, v in defaults.items()])
 
-def gridify(_func=None, **defaults):
-    """Given a function of shape (n,dim) and arguments of shape (L), (M), calls f with points L*M"""
+    def __repr__(self):
+        return '<gridified {}{}>'.format(self.__name__, tuple(self.__signature__.parameters))
 
-    def decorator_gridify(f):
+    def __call__(self, *args, **kwargs):
+        bound = self.__signature__.bind(*args, **kwargs)
+        bound.apply_defaults()
+        coordinates = np.meshgrid(*bound.args, indexing='xy', sparse=False, copy=False)
+        points = np.column_stack([c.ravel() for c in coordinates])
+        return np.squeeze(map_points(self.func, points).reshape(coordinates[0].shape, order='A'))
 
-        arg_str = ', '.join([k for k in defaults])
 
-        signature = ''
-        for k, v in defaults.items():
-            signature = signature + "{} = {},".format(k, k)
+def gridify(_func=None, **defaults):
+    """Given a function of shape (n,dim) and arguments of shape (L), (M), calls f with points L*M
 
-        scope = {**defaults}
-        scope['np'] = np
-        scope[f.__name__] = f
+    The points are evaluated in chunks when threads are available, see parallel.threads
 
-        exec(grid_wrapper_def.format(signature=signature, arg_str=arg_str, fname=f.__name__), scope)
-        wrapped = scope['wrapped']
-        wrapped.__name__ = f.__name__
-        wrapped.__doc__ = f.__doc__
+    returns a GridFunction
+    """
 
-        return decorate(wrapped, decorator_wrapper)
+    def decorator_gridify(f):
+        return GridFunction(f, defaults)
 
     if _func is None:
         return decorator_gridify
@@ -610,19 +763,18 @@ def convert_to(expr, target_units, unit_system="SI", raise_errors=True):
 def get_expr_unit(expr, unit_registry, verbose=False):
     '''Get units from an expression'''
     if is_function(expr):
-        for func in unit_registry:
-            if type(expr) == type(func):
-                # b(a) = b(x)
-                if verbose:
-                    print('get_expr_unit: found match {} for {}'.format(func, expr))
-                    # print('get_expr_unit: func free symbols {}'.format(func.free_symbols))
-                    # print('get_expr_unit: expr free_symbols: {}'.format(expr.free_symbols))
-                # func_units = resolve_unit(func, unit_registry, verbose)
-                # {f(x): f(cm), f(cm): kg}
-                func_units = unit_registry[func]
-                if func_units in unit_registry:
-                    return unit_registry[func_units]
-                return func_units
+        for func in registry_functions(unit_registry, expr):
+            # b(a) = b(x)
+            if verbose:
+                print('get_expr_unit: found match {} for {}'.format(func, expr))
+                # print('get_expr_unit: func free symbols {}'.format(func.free_symbols))
+                # print('get_expr_unit: expr free_symbols: {}'.format(expr.free_symbols))
+            # func_units = resolve_unit(func, unit_registry, verbose)
+            # {f(x): f(cm), f(cm): kg}
+            func_units = unit_registry[func]
+            if func_units in unit_registry:
+                return unit_registry[func_units]
+            return func_units
         if verbose:
             print('get_expr_unit: no match found for {}'.format(expr))
 
@@ -638,9 +790,13 @@ def get_expr_unit(expr, unit_registry, verbose=False):
             return None
 
     if len(unit_registry) > 0:
-        expr_unit = expr.subs(
-            unit_registry, simultaneous=False).subs(
-                unit_registry, simultaneous=False)
+        # {f(x): f(cm)} then {f(cm): kg}
+        expr_unit = expr.xreplace(unit_registry).xreplace(unit_registry)
+        if len(expr_unit.atoms(AppliedUndef)) > 0:
+            # functions redefined with other assumptions only match through subs
+            expr_unit = expr.subs(
+                unit_registry, simultaneous=False).subs(
+                    unit_registry, simultaneous=False)
     else:
         expr_unit = expr
 
@@ -650,7 +806,9 @@ def get_expr_unit(expr, unit_registry, verbose=False):
     if isinstance(expr_unit, Add):
         # use the first term
         arg_0 = expr_unit.args[0]
-        convert_to(expr_unit, arg_0)
+        if not all(has_dimensions(arg) and units_compatible(arg, arg_0)
+                   for arg in expr_unit.args):
+            convert_to(expr_unit, arg_0)  # raises if terms are incompatible
         result = arg_0
     else:
         result = expr_unit
@@ -687,8 +845,8 @@ def replace_args(expr, from_map, to_map):
             from_unit = from_map[arg]
             to_unit = to_map[arg]
             try:
-                assert get_dimensions(from_unit) == get_dimensions(to_unit)
-                arg_map[arg] = convert_to(arg*to_unit, from_unit)/from_unit
+                assert units_compatible(from_unit, to_unit)
+                arg_map[arg] = convert_expr(arg, to_unit, from_unit)
             except:
                 raise NameError('cannot convert from {} to {}'.format(from_unit, to_unit))
     return expr.subs(arg_map)
@@ -743,7 +901,7 @@ def unify(expr, unit_registry, to_symbol=None, verbose=False):
                 print('unify: expr args: {}'.format(expr.args))
                 print('unify: expr free symbols: {}'.format(expr.free_symbols))
 
-            for k, v in unit_registry.items():
+            for k in registry_functions(unit_registry, expr):
                 if isinstance(expr, type(k)):
                     if len(k.free_symbols) > 0:
                         if verbose:
@@ -756,7 +914,7 @@ def unify(expr, unit_registry, to_symbol=None, verbose=False):
                             to_unit = arg_units.get(sym)
                             from_unit = get_expr_unit(arg, unit_registry)
                             if (from_unit is not None) and (to_unit is not None):
-                                expr_units[arg] = convert_to(arg*from_unit, to_unit)/to_unit
+                                expr_units[arg] = convert_expr(arg, from_unit, to_unit)
                         expr = expr.subs(expr_units)
 
                         if verbose:
@@ -768,11 +926,11 @@ def unify(expr, unit_registry, to_symbol=None, verbose=False):
         to_unit = get_expr_unit(to_symbol, unit_registry, verbose)
         if verbose:
             print('unify: to_unit {}'.format(to_unit))
-        if get_dimensions(expr_unit) == get_dimensions(to_unit):
+        if units_compatible(expr_unit, to_unit):
             if verbose:
                 print('unify: {} [{}] -> to_symbol: {}[{}]'.format(
                     expr, expr_unit, to_symbol, to_unit))
-            expr = convert_to(expr*expr_unit, to_unit)/to_unit
+            expr = convert_expr(expr, expr_unit, to_unit)
         else:
             if verbose:
                 print('unify: registry:')
@@ -783,6 +941,24 @@ def unify(expr, unit_registry, to_symbol=None, verbose=False):
 
     return expr
 
+def units_compatible(from_unit, to_unit):
+    """whether from_unit and to_unit have the same dimensions"""
+    if has_dimensions(from_unit) and has_dimensions(to_unit):
+        return get_unit_vector(from_unit).compatible(get_unit_vector(to_unit))
+    return get_dimensions(from_unit) == get_dimensions(to_unit)
+
+
+def convert_expr(expr, from_unit, to_unit):
+    """expr in from_unit expressed as a multiple of to_unit
+
+    same as convert_to(expr*from_unit, to_unit)/to_unit
+    """
+    result = convert_units(expr, from_unit, to_unit)
+    if result is None:
+        result = convert_to(expr*from_unit, to_unit)/to_unit
+    return result
+
+
 def get_abbrev(unit):
     """get the abbreviation for a mixed unit"""
     if hasattr(unit, 'abbrev'):